@@ -1,12 +1,25 @@
+import asyncio
+import json
 import logging
-from typing import Optional
+import time
+from typing import Iterator, Optional
 
-from fastapi import FastAPI, HTTPException, Depends
+import numpy as np
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
 from pydantic import BaseModel
 
-from config import EMBED_DATA_PATH
+from api.live import LiveUserBusy, LiveUserEmbedder
+from api.reload import MatcherReloader
+from config import EMBED_DATA_PATH, INDEX_BACKEND, IVF_NLIST, IVF_NPROBE, MODEL_PATH, CONSUMER_KEY, CONSUMER_SECRET, \
+    ACCESS_KEY, ACCESS_SECRET, LIVE_MAX_CONCURRENCY, LIVE_SCRAPE_WORKERS, LIVE_ENCODE_WORKERS, LIVE_TIMEOUT, \
+    MATCHER_QUANTIZATION, MATCHER_RESCORE, MATCHER_RELOAD_INTERVAL, MATCHER_SHARED_MATRIX, ENCODER_SOCKET
 from core.matcher import TwitterUserMatcher
-from core.utils import username_dict
+from core.cache import EmbeddingCache
+from core.metrics import REQUEST_SECONDS, REQUESTS, export, record_embedding_cache, record_models, stage
+from core.scraper import TwitterScraper
+from core.utils import open_embedding_cache, username_dict
 
 
 class TwitterUsername(BaseModel):
@@ -16,6 +29,13 @@ class TwitterUsername(BaseModel):
     username: str
 
 
+class TwitterUsernames(BaseModel):
+    """
+    TwitterUsernames model: input Twitter usernames for a batch of predictions
+    """
+    usernames: list[str]
+
+
 class Prediction(BaseModel):
     """
     Prediction model: output of the model
@@ -25,37 +45,131 @@ class Prediction(BaseModel):
 
 class TwitterMatcherModel:
     """ TwitterMatcherModel: class for the model """
-    matcher: Optional[TwitterUserMatcher] = None  # twitter_user_matcher object
+    reloader: Optional[MatcherReloader] = None  # serves the twitter_user_matcher object of the current embeddings
+    embedding_cache: Optional[EmbeddingCache] = None  # embeddings of the live users already scraped
+    live_embedder: Optional[LiveUserEmbedder] = None  # scrapes and embeds non-celebrity users
     usernames_dict = username_dict()  # Get the Twitter account names dictionary
     top_n: int = 100  # Top n results
-
-    def load_model(self):
-        """Twitter profile twitter_user_matcher"""
-        self.matcher = TwitterUserMatcher(EMBED_DATA_PATH)
+    batch_max_usernames: int = 10000  # max usernames of a batch request
+
+    @property
+    def matcher(self) -> Optional[TwitterUserMatcher]:
+        """The matcher of the current embeddings, a request keeps the one it started with"""
+        return self.reloader.matcher if self.reloader else None
+
+    def load_matcher(self) -> TwitterUserMatcher:
+        """Twitter profile twitter_user_matcher, of the current embedding files"""
+        return TwitterUserMatcher(EMBED_DATA_PATH, index_backend=INDEX_BACKEND, nlist=IVF_NLIST, nprobe=IVF_NPROBE,
+                                  embedding_cache=self.embedding_cache, quantization=MATCHER_QUANTIZATION,
+                                  rescore=MATCHER_RESCORE, shared_matrix=MATCHER_SHARED_MATRIX)
+
+    async def load_model(self):
+        """Load the matcher, watched for new embeddings, and the live user workers"""
+        # embeddings of the live users already scraped
+        embedding_cache = self.embedding_cache = open_embedding_cache()
+        if embedding_cache is not None:
+            record_embedding_cache(embedding_cache)
+        self.reloader = MatcherReloader(self.load_matcher, EMBED_DATA_PATH, interval=MATCHER_RELOAD_INTERVAL)
+        await self.reloader.start()
+        twitter_scraper = TwitterScraper(consumer_key=CONSUMER_KEY, consumer_secret=CONSUMER_SECRET,
+                                         access_key=ACCESS_KEY, access_secret=ACCESS_SECRET)
+        self.live_embedder = LiveUserEmbedder(twitter_scraper, MODEL_PATH, max_concurrency=LIVE_MAX_CONCURRENCY,
+                                              scrape_workers=LIVE_SCRAPE_WORKERS,
+                                              encode_workers=LIVE_ENCODE_WORKERS, timeout=LIVE_TIMEOUT,
+                                              embedding_cache=embedding_cache, encoder_socket=ENCODER_SOCKET or None)
+        # the model is loaded by the encoding workers (or the encoder server), shared by all the requests
+        encoder_stats = await self.live_embedder.start()
+        record_models(encoder_stats)
+        logging.info(f"Startup: matcher loaded in {self.reloader.info['load_seconds']:.2f}s, models {encoder_stats}")
+
+    def unload_model(self):
+        """Stop the matcher reloads and the live user workers"""
+        if self.reloader:
+            self.reloader.shutdown()
+        if self.live_embedder:
+            self.live_embedder.shutdown()
 
     async def predict(self, input_username: TwitterUsername) -> Prediction:  # dependency
         """Runs a prediction"""
-        if not self.matcher:
+        # the same matcher for the whole request, even if a reload swaps in a new one meanwhile
+        matcher = self.matcher
+        if not matcher:
             # raise RuntimeError("Model is not loaded")
             raise HTTPException(status_code=400, detail="Model is not loaded")
         input_username_dict = input_username.dict()
-        closest_list = self.matcher.match_top_celeb_users(input_username_dict.get("username"))
-        if not closest_list:
+        username = input_username_dict.get("username")
+        if matcher.find_user(username) is not None:
+            # celebrity users are looked up in memory
+            top_results = matcher.top_k(username, self.top_n)
+        else:
+            # live users are scraped and embedded off the event loop
+            try:
+                with stage('resolve'):
+                    embedding = await self.live_embedder.embed(username)
+                top_results = matcher.top_k_embedding(embedding, self.top_n)
+            except LiveUserBusy as e:
+                raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "10"})
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=503, detail=f"Timed out embedding {username}",
+                                    headers={"Retry-After": "30"})
+            except Exception as e:
+                logging.error(e)
+                top_results = None
+        if top_results is None:
             # raise RuntimeError("Result is not found")
             raise HTTPException(status_code=400, detail="An error occurred!")
-        results = sorted(closest_list, key=lambda item: item[1], reverse=True)[1:self.top_n + 1]
-        #     # orjson doesn't support serializing individual numpy input_data types yet, converting to `python float`
-        #     # https://github.com/tiangolo/fastapi/issues/1733
-        results = [{"username": k, "similarity": round(float(v), 4)} for k, v in results]
-        logging.info(results)
+        with stage('format'):
+            results = self.format_results(*top_results)
+        logging.debug(f"{username}: {len(results)} results")
         return Prediction(similarity_result=results)
 
+    @staticmethod
+    def format_results(usernames: np.ndarray, scores: np.ndarray) -> list:
+        """Top results as a list of username/similarity dicts"""
+        # orjson doesn't support serializing individual numpy input_data types yet, converting to `python float`
+        # https://github.com/tiangolo/fastapi/issues/1733
+        return [{"username": k, "similarity": v}
+                for k, v in zip(usernames.tolist(), np.round(scores.astype(np.float64), 4).tolist())]
+
+    def predict_batch(self, input_usernames: TwitterUsernames) -> Iterator[str]:
+        """Runs the predictions of a batch of usernames, as NDJSON lines in input order"""
+        matcher = self.matcher
+        if not matcher:
+            # checked before the response starts streaming
+            raise HTTPException(status_code=400, detail="Model is not loaded")
+        if len(input_usernames.usernames) > self.batch_max_usernames:
+            raise HTTPException(status_code=400, detail=f"At most {self.batch_max_usernames} usernames per request")
+        # lazily scored chunk by chunk while the response is streamed,
+        # live users go through `predict` and its limits, they are not scraped here
+        top_results_batch = matcher.top_k_batch(input_usernames.usernames, self.top_n, scrape=False)
+        return (json.dumps({"username": username, "error": "An error occurred!"} if top_results is None else
+                           {"username": username, "similarity_result": self.format_results(*top_results)}) + "\n"
+                for username, top_results in top_results_batch)
+
 
 app = FastAPI()
 
 twitter_matcher_model = TwitterMatcherModel()
 
 
+@app.middleware("http")
+async def request_metrics(request: Request, call_next) -> Response:
+    """
+    Count and time the requests, by route (the route template, not the path)
+    """
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        REQUESTS.labels(request.method, route_path, status).inc()
+        REQUEST_SECONDS.labels(request.method, route_path).observe(time.perf_counter() - start)
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Twitter Celebrity Matcher API"}
@@ -71,6 +185,52 @@ async def predict(output: Prediction = Depends(twitter_matcher_model.predict, ))
     return output
 
 
+@app.get('/cache')
+def cache_stats() -> dict:
+    """
+    Hit/miss counters of the embedding cache of live users, in the threadpool - counting the entries
+    may wait for the SQLite lock of another worker
+    :return:
+    """
+    embedding_cache = twitter_matcher_model.embedding_cache
+    return {"enabled": embedding_cache is not None, **(embedding_cache.stats() if embedding_cache is not None else {})}
+
+
+@app.get('/metrics')
+async def metrics() -> Response:
+    """
+    Prometheus metrics: request and stage latencies, matcher, model and embedding cache gauges, of all the
+    workers under gunicorn
+    :return:
+    """
+    return Response(export(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+@app.get('/status')
+async def status() -> dict:
+    """
+    Version, fingerprint and load time of the served celebrity embeddings, and the reload state
+    :return:
+    """
+    return twitter_matcher_model.reloader.status() if twitter_matcher_model.reloader else {"loaded": False}
+
+
+@app.post('/results/batch')
+async def predict_batch(input_usernames: TwitterUsernames) -> StreamingResponse:
+    """
+    Top matches of many usernames, streamed back as one JSON object per line
+    :param input_usernames: TwitterUsernames
+    :return:
+    """
+    # errors of single usernames are reported in their own line
+    return StreamingResponse(twitter_matcher_model.predict_batch(input_usernames), media_type="application/x-ndjson")
+
+
 @app.on_event("startup")
 async def startup():
-    twitter_matcher_model.load_model()
+    await twitter_matcher_model.load_model()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    twitter_matcher_model.unload_model()
@@ -0,0 +1,208 @@
+"""
+## Twitter Celebrity Matcher - API
+
+Live (non-celebrity) user embedding off the event loop - the tweets are scraped in a thread pool
+and preprocessed + encoded in a process pool (or through the shared encoder server), within a
+concurrency limit and a timeout.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+import numpy.typing as npt
+import pandas as pd
+
+from core.cache import EmbeddingCache
+from core.dataprep import TwitterDataPrep
+from core.encoder_service import EncoderClient
+from core.metrics import observe_stage, record_embedding_cache, stage
+from core.models import model_registry
+from core.scraper import TwitterScraper
+
+# data preparation object (and model) of an encoding worker
+_worker_data_prep: Optional[TwitterDataPrep] = None
+
+
+def init_encode_worker(model_path: str, encoder_socket: Optional[str] = None) -> None:
+    """
+    Load the model once per encoding worker, or connect to the encoder server
+    :param model_path:
+    :param encoder_socket: Unix socket of the encoder server, None to load the model
+    :return:
+    """
+    global _worker_data_prep
+    _worker_data_prep = TwitterDataPrep(model_path=model_path,
+                                        encoder=EncoderClient(encoder_socket) if encoder_socket else None)
+
+
+def encode_worker_stats() -> dict:
+    """
+    Model load time and memory of an encoding worker, or of the encoder server
+    :return: `ModelRegistry.stats`
+    """
+    if isinstance(_worker_data_prep.model, EncoderClient):
+        return _worker_data_prep.model.stats()
+    return model_registry.stats()
+
+
+def embed_tweets(tweets: list) -> tuple:
+    """
+    Preprocess and encode the tweets of a user, in an encoding worker
+    :param tweets: scraped tweets
+    :return: (mean embedding, seconds of the `preprocess` and `encode` stages) - the metrics of an
+             encoding process are not exported, its stages are recorded by the API process
+    """
+    start = time.perf_counter()
+    df = _worker_data_prep.preprocess_data(pd.DataFrame({'tweet': tweets}))
+    preprocessed = time.perf_counter()
+    embedding = _worker_data_prep.get_embeddings(df)
+    return embedding, {'preprocess': preprocessed - start, 'encode': time.perf_counter() - preprocessed}
+
+
+class LiveUserBusy(Exception):
+    """ All the live user slots are taken """
+
+
+class LiveUserEmbedder:
+    def __init__(self, twitter_scraper: TwitterScraper, model_path: str, max_concurrency: int = 2,
+                 scrape_workers: int = 4, encode_workers: int = 1, timeout: float = 120,
+                 embedding_cache: Optional[EmbeddingCache] = None, encoder_socket: Optional[str] = None) -> None:
+        """
+        :param twitter_scraper:
+        :param model_path:
+        :param max_concurrency: live users embedded at once, more are rejected
+        :param scrape_workers: scraping threads
+        :param encode_workers: encoding processes, 0 to encode in a thread of this process
+        :param timeout: seconds to scrape and embed a user
+        :param embedding_cache: cached users skip the scraping and the encoding
+        :param encoder_socket: Unix socket of the encoder server shared by the processes - the tweets are
+                               preprocessed in threads of this process and encoded by the server, no model
+                               is loaded here
+        """
+        self.twitter_scraper = twitter_scraper
+        self.model_path = model_path
+        self.max_concurrency = max_concurrency
+        self.scrape_workers = scrape_workers
+        self.encode_workers = encode_workers
+        self.timeout = timeout
+        self.embedding_cache = embedding_cache
+        self.encoder_socket = encoder_socket
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._scrape_executor: Optional[Executor] = None
+        self._encode_executor: Optional[Executor] = None
+        # SQLite waits for the locks of the other API workers, off the event loop
+        self._cache_executor: Optional[Executor] = None
+
+    async def start(self) -> dict:
+        """
+        Start the executors and load the model in the encoding workers
+        :return: model stats of an encoding worker
+        """
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._scrape_executor = ThreadPoolExecutor(max_workers=self.scrape_workers, thread_name_prefix='scrape')
+        self._cache_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache')
+        if self.encoder_socket:
+            self._encode_executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='encode',
+                                                       initializer=init_encode_worker,
+                                                       initargs=(self.model_path, self.encoder_socket))
+        elif self.encode_workers > 0:
+            # spawned, torch does not support forking a process with running threads
+            self._encode_executor = ProcessPoolExecutor(max_workers=self.encode_workers,
+                                                        mp_context=multiprocessing.get_context('spawn'),
+                                                        initializer=init_encode_worker, initargs=(self.model_path,))
+        else:
+            self._encode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='encode',
+                                                       initializer=init_encode_worker, initargs=(self.model_path,))
+        return await asyncio.get_running_loop().run_in_executor(self._encode_executor, encode_worker_stats)
+
+    def shutdown(self) -> None:
+        """
+        Stop the executors, without waiting for the running tasks
+        :return:
+        """
+        for executor in (self._scrape_executor, self._encode_executor, self._cache_executor):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    async def embed(self, username: str) -> npt.NDArray:
+        """
+        Scrape and embed the tweets of a user, or get the embedding from the cache.
+        On timeout the request is answered, the running scrape or encoding still finishes in its worker and
+        holds the slot of the user until then - `max_concurrency` bounds the work running, not the requests.
+        :param username: Twitter username
+        :return: mean embedding
+        :raise LiveUserBusy: if `max_concurrency` users are already being embedded
+        :raise asyncio.TimeoutError: if it took longer than `timeout`
+        :raise LookupError: if no tweets were scraped
+        """
+        loop = asyncio.get_running_loop()
+        if self.embedding_cache is not None:
+            with stage('cache'):
+                embedding = await loop.run_in_executor(self._cache_executor, self.embedding_cache.get, username)
+            record_embedding_cache(self.embedding_cache)
+            if embedding is not None:
+                return embedding
+        if self._semaphore.locked():
+            raise LiveUserBusy(f"{self.max_concurrency} live users are already being embedded")
+        await self._semaphore.acquire()
+        running: list = []  # executor future of the stage in progress
+        try:
+            embedding = await asyncio.wait_for(self._embed(username, running), self.timeout)
+        finally:
+            self._release_after(running)
+        if self.embedding_cache is not None:
+            await loop.run_in_executor(self._cache_executor, self.embedding_cache.put, username, embedding)
+        return embedding
+
+    def _release_after(self, running: list) -> None:
+        """
+        Release the slot of a user once the work submitted for it is done
+        :param running: executor future of the last stage submitted, if any
+        :return:
+        """
+        if not running or running[-1].done():
+            self._semaphore.release()
+            return
+        loop = asyncio.get_running_loop()
+
+        def release(_: Future) -> None:
+            try:
+                loop.call_soon_threadsafe(self._semaphore.release)
+            except RuntimeError:
+                # the event loop is closed, the API shut down
+                pass
+
+        running[-1].add_done_callback(release)
+
+    @staticmethod
+    def _submit(running: list, executor: Executor, fn, *args) -> asyncio.Future:
+        """
+        Run a stage in an executor, keeping its future - a cancelled wait does not stop a running task
+        :param running: receives the executor future
+        :param executor:
+        :param fn:
+        :param args:
+        :return: awaitable of the result
+        """
+        future = executor.submit(fn, *args)
+        running[:] = [future]
+        return asyncio.wrap_future(future)
+
+    async def _embed(self, username: str, running: list) -> npt.NDArray:
+        df = await self._submit(running, self._scrape_executor, self.twitter_scraper.scrape_tweets, username)
+        if type(df) is not pd.DataFrame or df.empty:
+            raise LookupError(f"No tweets found for {username}")
+        logging.info(f"{len(df)} tweets scraped for {username}")
+        embedding, timings = await self._submit(running, self._encode_executor, embed_tweets, df['tweet'].tolist())
+        if isinstance(self._encode_executor, ProcessPoolExecutor):
+            # encoded in this process otherwise, already recorded
+            for name, seconds in timings.items():
+                observe_stage(name, seconds)
+        return embedding
@@ -0,0 +1,137 @@
+"""
+## Twitter Celebrity Matcher - API
+
+Hot reload of the celebrity embeddings - the embedding store is polled, a new version is loaded
+and warmed up in a background thread, then swapped in. Requests keep the matcher they started with,
+the previous one is released once they are done.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from core.matcher import TwitterUserMatcher
+from core.metrics import MATCHER_RELOADS, record_matcher
+from core.store import EmbeddingStore
+
+
+class MatcherReloader:
+    def __init__(self, load_matcher: Callable[[], TwitterUserMatcher], embed_data_path: str,
+                 interval: float = 30) -> None:
+        """
+        :param load_matcher: loads a matcher from the current embedding files
+        :param embed_data_path: embedding store watched for new versions
+        :param interval: seconds between two checks, 0 to not watch the store
+        """
+        self.load_matcher = load_matcher
+        self.embed_data_path = embed_data_path
+        self.interval = interval
+        self.matcher: Optional[TwitterUserMatcher] = None
+        self.version: Optional[tuple] = None  # `EmbeddingStore.version` of the loaded matcher
+        self.info: dict = {}  # status of the loaded matcher
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._pending_version: Optional[tuple] = None
+        self._failed_version: Optional[tuple] = None  # not retried until the files change again
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reload')
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self) -> tuple:
+        """
+        Load and warm up a matcher from the current embedding files, in the reload thread
+        :return: (matcher, version of the loaded files, status)
+        """
+        version = EmbeddingStore.version(self.embed_data_path)
+        start = time.perf_counter()
+        matcher = self.load_matcher()
+        # a first search pages in the matrix and the index before the matcher takes requests
+        if len(matcher.usernames):
+            matcher.top_k(matcher.usernames[0], 1)
+        load_seconds = time.perf_counter() - start
+        info = {'users': len(matcher.usernames), 'model': matcher.model,
+                'fingerprint': matcher.fingerprint,
+                'loaded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'load_seconds': round(load_seconds, 3)}
+        return matcher, version, info
+
+    def swap(self, matcher: TwitterUserMatcher, version: tuple, info: dict) -> None:
+        """
+        Serve a loaded matcher, the requests running on the previous one finish with it
+        :param matcher:
+        :param version:
+        :param info:
+        :return:
+        """
+        self.matcher, self.version, self.info = matcher, version, info
+        record_matcher(len(matcher.usernames), matcher.embeddings.nbytes + matcher.normalized_embeddings.nbytes,
+                       info['load_seconds'])
+
+    async def start(self) -> None:
+        """
+        Load the first matcher, then watch the store
+        :return:
+        """
+        self.swap(*await asyncio.get_running_loop().run_in_executor(self._executor, self.load))
+        logging.info(f"Matcher loaded: {self.info}")
+        if self.interval > 0:
+            self._task = asyncio.create_task(self.watch())
+
+    def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.reload_if_changed()
+
+    async def reload_if_changed(self) -> bool:
+        """
+        Load the store if it changed and did not change since the last check - the files of a build are
+        replaced one after another, a version is loaded once they are all written
+        :return: True if a new matcher was swapped in
+        """
+        version = EmbeddingStore.version(self.embed_data_path)
+        if version == self.version or version == self._failed_version:
+            self._pending_version = None
+            return False
+        if version != self._pending_version or any(mtime is None for _, mtime, _ in version):
+            # wait for the next check
+            self._pending_version = version
+            return False
+        try:
+            matcher, loaded_version, info = await asyncio.get_running_loop().run_in_executor(self._executor,
+                                                                                             self.load)
+            if loaded_version != version or EmbeddingStore.version(self.embed_data_path) != version:
+                raise ValueError("Embedding files changed while loading, retrying")
+        except Exception as e:
+            logging.error(f"Matcher reload failed, still serving the previous version: {e}")
+            self.last_error = str(e)
+            self._failed_version = version
+            self._pending_version = None
+            MATCHER_RELOADS.labels('failure').inc()
+            return False
+        self.swap(matcher, version, info)
+        self.reloads += 1
+        self.last_error = None
+        self._pending_version = None
+        MATCHER_RELOADS.labels('success').inc()
+        logging.info(f"Matcher reloaded: {self.info}")
+        return True
+
+    def status(self) -> dict:
+        """
+        Version of the loaded embeddings and reload state
+        :return:
+        """
+        return {'loaded': self.matcher is not None,
+                'version': [dict(zip(('file', 'mtime_ns', 'size'), stat)) for stat in self.version or ()],
+                **self.info, 'reloads': self.reloads, 'reload_interval': self.interval,
+                'pending': self._pending_version is not None, 'last_error': self.last_error}
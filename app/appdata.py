@@ -11,7 +11,9 @@ Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
 
 from dataclasses import dataclass
 from typing import Optional
-from config import CONSUMER_KEY, CONSUMER_SECRET, ACCESS_KEY, ACCESS_SECRET, EMBED_DATA_PATH, TWITTER_USER_LIST_FILE, TWITTER_USER_LIST_PATH
+from config import CONSUMER_KEY, CONSUMER_SECRET, ACCESS_KEY, ACCESS_SECRET, EMBED_DATA_PATH, MODEL_PATH, \
+    TWITTER_USER_LIST_FILE, TWITTER_USER_LIST_PATH, INDEX_BACKEND, IVF_NLIST, IVF_NPROBE, MATCHER_QUANTIZATION, \
+    MATCHER_RESCORE, ENCODER_SOCKET
 from core.utils import username_dict
 
 
@@ -25,4 +27,11 @@ class AppData:
     twitter_user_list_file: str = TWITTER_USER_LIST_FILE
     twitter_user_list_path: str = TWITTER_USER_LIST_PATH
     embed_data_path: str = EMBED_DATA_PATH
+    model_path: str = MODEL_PATH
+    encoder_socket: str = ENCODER_SOCKET
+    index_backend: str = INDEX_BACKEND
+    ivf_nlist: int = IVF_NLIST
+    ivf_nprobe: int = IVF_NPROBE
+    quantization: str = MATCHER_QUANTIZATION
+    rescore: int = MATCHER_RESCORE
     usernames_dict = username_dict()
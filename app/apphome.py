@@ -19,6 +19,7 @@ from pandas import option_context
 from app.utils import social_share_msg
 from core.matcher import TwitterUserMatcher
 from core.scraper import TwitterScraper
+from core.store import EmbeddingStore
 from core.utils import lower_dict
 
 
@@ -40,7 +41,7 @@ class AppHome:
     @property
     def twitter_scraper(self) -> TwitterScraper:
         """
-        Initialize the Twitter scraper object
+        Get the shared Twitter scraper object
         :return:
         """
         return self.app.init.init_twitter_scraper()
@@ -48,7 +49,7 @@ class AppHome:
     @property
     def twitter_user_matcher(self) -> TwitterUserMatcher:
         """
-        Initialize the Twitter user twitter_user_matcher object
+        Get the shared Twitter user twitter_user_matcher object
         :return:
         """
         return self.app.init.init_twitter_user_matcher()
@@ -130,18 +131,17 @@ class AppHome:
                 # return st.error("This twitter user does not exist or some error occurred!")
                 return st.error("This twitter user does not exist in the list or some error occurred!")
 
-        # get the top n results
+        # get the top n results, the username itself is left out
         with st.spinner("**Twitter User Found**! searching for matches..."):
-            closest_list = self.twitter_user_matcher.match_top_celeb_users(username)
+            top_results = self.twitter_user_matcher.top_k(username, self.top_n)
 
         # could be a user with no tweets
-        if not closest_list:
+        if top_results is None:
             return st.error("An error occurred!")
 
-        # sort the list by the similarity score
-        # [1:] to remove the first item which is the username itself
-        results = sorted(closest_list, key=lambda item: item[1], reverse=True)[1:self.top_n + 1]
-        result_df = pd.DataFrame(results, columns=['Twitter Username', 'Similarity Score'])
+        # sorted by the similarity score
+        usernames, scores = top_results
+        result_df = pd.DataFrame({'Twitter Username': usernames, 'Similarity Score': scores})
 
         # show the Celebrity Names
         result_df.insert(1, 'Name', result_df['Twitter Username'].map(lambda x: self.usernames_dict.get(x)))
@@ -321,11 +321,15 @@ class AppHome:
                                           _self.app.data.twitter_user_list_file), 
                                           header=0,
                                           usecols=['name', 'twitter_username', 'followers_count', 'tweet_count'])
-        embed_df = pd.read_csv(os.path.join(os.getcwd(), _self.app.data.embed_data_path, 
-                                            f'{_self.app.data.embed_data_path}.csv'),
-                                            usecols=['username'],
-                                            header=0)
-        df = df[df['twitter_username'].isin(embed_df.username.tolist())].copy()
+        if EmbeddingStore.exists(_self.app.data.embed_data_path):
+            # only the username index of the binary store is read, the matrix is memory-mapped
+            embed_usernames = EmbeddingStore.load(_self.app.data.embed_data_path).usernames
+        else:
+            embed_usernames = pd.read_csv(os.path.join(os.getcwd(), _self.app.data.embed_data_path,
+                                                       f'{_self.app.data.embed_data_path}.csv'),
+                                          usecols=['username'],
+                                          header=0).username.tolist()
+        df = df[df['twitter_username'].isin(embed_usernames)].copy()
         return df
     
     def render_dataframe(self) -> None:
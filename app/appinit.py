@@ -4,30 +4,76 @@
 This app is a tool to match celebrities from Twitter with their respective tweets.
 
 This is a helper class that initializes the core objects - scraper and matcher.
+They are shared by all the sessions and reruns of the app process (`st.cache_resource`).
 Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
 Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
 """
 
+from typing import Optional
+
+import streamlit as st
+
 from app.appdata import AppData
+from core.dataprep import TwitterDataPrep
+from core.encoder_service import encoder_client
 from core.matcher import TwitterUserMatcher
 from core.scraper import TwitterScraper
+from core.cache import EmbeddingCache
+from core.store import EmbeddingStore
+from core.utils import open_embedding_cache
 
 
 class AppInit:
     def __init__(self, data: AppData) -> None:
         self.data = data
 
-    def init_twitter_scraper(self) -> TwitterScraper:
+    # `_self` is not hashed, every instance shares the cached objects
+    # https://github.com/streamlit/streamlit/issues/6109#issuecomment-1523362976
+    @st.cache_resource(show_spinner=False)
+    def init_twitter_scraper(_self) -> TwitterScraper:
+        """
+        Initialize the Twitter scraper object, once per process
+        :return:
+        """
+        return TwitterScraper(consumer_key=_self.data.consumer_key, consumer_secret=_self.data.consumer_secret,
+                              access_key=_self.data.access_key, access_secret=_self.data.access_secret)
+
+    @st.cache_resource(show_spinner="Loading the embedding model...")
+    def init_twitter_data_prep(_self) -> TwitterDataPrep:
+        """
+        Initialize the data preparation object and its SentenceTransformer model, once per process.
+        Only needed to embed non-celebrity users, so it is loaded on the first of them.
+        The tweets are encoded by the encoder server if one is configured.
+        :return:
+        """
+        return TwitterDataPrep(model_path=_self.data.model_path, encoder=encoder_client(_self.data.encoder_socket))
+
+    @st.cache_resource(show_spinner=False)
+    def init_embedding_cache(_self) -> Optional[EmbeddingCache]:
         """
-        Initialize the Twitter scraper object
+        Open the embedding cache of scraped users, once per process
         :return:
         """
-        return TwitterScraper(consumer_key=self.data.consumer_key, consumer_secret=self.data.consumer_secret,
-                              access_key=self.data.access_key, access_secret=self.data.access_secret)
+        return open_embedding_cache()
 
     def init_twitter_user_matcher(self) -> TwitterUserMatcher:
         """
-        Initialize the Twitter user twitter_user_matcher object
+        Get the shared Twitter user twitter_user_matcher object, reloaded when the embedding files change
+        :return:
+        """
+        return self.load_twitter_user_matcher(EmbeddingStore.version(self.data.embed_data_path))
+
+    # a new store version evicts the previous matcher
+    @st.cache_resource(max_entries=1, show_spinner="Loading the celebrity embeddings...")
+    def load_twitter_user_matcher(_self, store_version: tuple) -> TwitterUserMatcher:
+        """
+        Initialize the Twitter user twitter_user_matcher object, once per embedding store version
+        :param store_version: `EmbeddingStore.version`, part of the cache key
         :return:
         """
-        return TwitterUserMatcher(embed_data_path=self.data.embed_data_path)
+        return TwitterUserMatcher(embed_data_path=_self.data.embed_data_path, index_backend=_self.data.index_backend,
+                                  nlist=_self.data.ivf_nlist, nprobe=_self.data.ivf_nprobe,
+                                  twitter_scraper=_self.init_twitter_scraper(),
+                                  data_prep_loader=_self.init_twitter_data_prep,
+                                  embedding_cache=_self.init_embedding_cache(),
+                                  quantization=_self.data.quantization, rescore=_self.data.rescore)
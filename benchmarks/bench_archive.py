@@ -0,0 +1,81 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Tweet storage: the csv files (`b'...'` reprs) against the Parquet archive partitioned by user, on
+tweets scraped from the local fake timeline server and migrated with `core.archive.migrate`.
+Reports the bytes on disk, the time to read the users' tweets as text (the read + decode stage of
+`load_data`) and to read the whole archive as one dataset, and checks the preprocessed tweets agree.
+
+Run from the project root: `python -m benchmarks.bench_archive`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from benchmarks.fake_timeline import FakeTimelineServer
+from core.archive import migrate, partition_file_path, read_archive
+from core.bulk_scraper import BulkScraper, TimelineClient
+from core.dataprep import read_preprocess
+from core.models import load_preprocessor
+from core.preprocessing import decode_bytes_literal
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=48)
+    parser.add_argument('--tweets', type=int, default=3200, help="tweets per user")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    screen_names = [f"user{i}" for i in range(args.users)]
+    preprocessor = load_preprocessor()
+    server = FakeTimelineServer(tweets_per_user=args.tweets, latency=0, limit=10 ** 9).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path, archive_path = os.path.join(tmp, 'csv'), os.path.join(tmp, 'archive')
+        try:
+            BulkScraper(TimelineClient(base_url=server.base_url), csv_path, workers=4,
+                        file_format='csv').scrape_users(screen_names)
+        finally:
+            server.stop()
+        summary = migrate(csv_path, archive_path)
+        assert summary['users'] == args.users
+
+        start = time.perf_counter()
+        for screen_name in screen_names:
+            df = pd.read_csv(os.path.join(csv_path, f"{screen_name}.csv"), usecols=['tweet'])
+            [decode_bytes_literal(tweet) for tweet in df['tweet']]
+        csv_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for screen_name in screen_names:
+            read_archive(partition_file_path(archive_path, screen_name), columns=['tweet'])['tweet'].tolist()
+        archive_seconds = time.perf_counter() - start
+        # the whole archive, the partition folders give the username column
+        start = time.perf_counter()
+        dataset = pq.read_table(archive_path, columns=['username', 'tweet'])
+        dataset_seconds = time.perf_counter() - start
+        assert dataset.num_rows == args.users * args.tweets
+
+        # same cleaned tweets from both
+        for screen_name in screen_names[:4]:
+            csv_df = read_preprocess(os.path.join(csv_path, f"{screen_name}.csv"), preprocessor)[0]
+            archive_df = read_preprocess(partition_file_path(archive_path, screen_name), preprocessor)[0]
+            assert csv_df['tweet'].tolist() == archive_df['tweet'].tolist()
+
+    print(f"{'':>18} {'disk MB':>8} {'read + decode s':>16}")
+    print(f"{'csv files':>18} {summary['csv_bytes'] / 2 ** 20:>8.1f} {csv_seconds:>16.3f}")
+    print(f"{'parquet archive':>18} {summary['archive_bytes'] / 2 ** 20:>8.1f} {archive_seconds:>16.3f}")
+    print(f"{'archive dataset':>18} {'':>8} {dataset_seconds:>16.3f}  ({dataset.num_rows} tweets at once)")
+    print(f"migration of {summary['users']} users: {summary['seconds']}s")
+
+
+if __name__ == '__main__':
+    main()
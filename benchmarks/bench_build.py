@@ -0,0 +1,61 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Embedding build overhead (excluding encoding) against the number of users: the original
+per-user `pd.concat` collection against the preallocated float32 matrix written once.
+
+Run from the project root: `python -m benchmarks.bench_build`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks import reference
+from core.store import embeddings_frame
+
+
+def collect_matrix(usernames: list, vectors: np.ndarray):
+    """
+    Fill a preallocated matrix row by row, the way `load_data` does, then build the frame once
+    :param usernames:
+    :param vectors:
+    :return: dataframe
+    """
+    matrix = np.zeros(vectors.shape, dtype=np.float32)
+    for row, embeddings in enumerate(vectors):
+        matrix[row] = embeddings
+    return embeddings_frame(usernames, matrix)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--legacy-max', type=int, default=1000, help='largest size to run the per-user concat on')
+    parser.add_argument('--dimension', type=int, default=384)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'users':>8} {'concat (s)':>12} {'matrix (s)':>12}")
+    for size in args.sizes:
+        usernames = [f"user{i}" for i in range(size)]
+        vectors = rng.standard_normal((size, args.dimension), dtype=np.float32)
+
+        legacy = float('nan')
+        if size <= args.legacy_max:
+            start = time.perf_counter()
+            reference.collect_embeddings(usernames, vectors)
+            legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        collect_matrix(usernames, vectors)
+        matrix = time.perf_counter() - start
+        print(f"{size:>8} {legacy:>12.3f} {matrix:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Parity check and micro-benchmark of the compiled emoticon replacement against the
+original per-entry replacement loop.
+
+Run from the project root: `python -m benchmarks.bench_emoticons`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import time
+
+from benchmarks.reference import replace_emoticons
+from benchmarks.synthetic import load_emoticons, synthetic_tweets
+from core.preprocessing import EmoticonReplacer
+
+
+def main(n: int = 3200) -> None:
+    emoticons_dict = load_emoticons()
+    tweets = synthetic_tweets(n)
+
+    start = time.perf_counter()
+    replacer = EmoticonReplacer(emoticons_dict)
+    compile_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [replace_emoticons(tweet, emoticons_dict) for tweet in tweets]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [replacer.replace(tweet) for tweet in tweets]
+    compiled_time = time.perf_counter() - start
+
+    mismatches = [(tweet, e, a) for tweet, e, a in zip(tweets, expected, actual) if e != a]
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[0]}"
+
+    print(f"tweets: {n} (parity OK)")
+    print(f"compile: {compile_time * 1000:.1f} ms")
+    print(f"loop:     {loop_time:.3f} s ({n / loop_time:,.0f} tweets/s)")
+    print(f"compiled: {compiled_time:.3f} s ({n / compiled_time:,.0f} tweets/s)")
+    print(f"speedup:  {loop_time / compiled_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
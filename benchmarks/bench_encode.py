@@ -0,0 +1,88 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Mean embedding of a user against its number of tweets: the original single `encode` of every tweet
+(the whole N x dimension output held, then averaged) against `get_embeddings`' length-sorted chunks
+into a running sum. Reports the time, the peak traced memory (numpy buffers included) and the
+padding of the encoding batches, in words, with and without the length sorting of the chunks.
+Needs the sentence-transformers model.
+
+Run from the project root: `python -m benchmarks.bench_encode`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import logging
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import reference
+from benchmarks.synthetic import synthetic_tweets
+from core.dataprep import TwitterDataPrep
+
+
+def padding(tweets: list, batch_size: int, chunk_size: int) -> float:
+    """
+    Share of padding words in the batches, the model sorting each chunk by length
+    :param tweets:
+    :param batch_size:
+    :param chunk_size:
+    :return: padding / (padding + words)
+    """
+    padded = words = 0
+    for start in range(0, len(tweets), chunk_size):
+        lengths = sorted(len(tweet.split()) for tweet in tweets[start:start + chunk_size])
+        for batch in range(0, len(lengths), batch_size):
+            batch_lengths = lengths[batch:batch + batch_size]
+            padded += max(batch_lengths) * len(batch_lengths) - sum(batch_lengths)
+            words += sum(batch_lengths)
+    return padded / (padded + words)
+
+
+def measure(fn) -> tuple:
+    """
+    :param fn:
+    :return: (result, seconds, peak traced bytes)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tweets', type=int, nargs='+', default=[1000, 3200, 10000, 50000])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--model-path', default=os.environ.get('MODEL_PATH') or 'models')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    data_prep = TwitterDataPrep(model_path=args.model_path)
+    data_prep.model.encode(['warm up'])
+    print(f"{'tweets':>7} {'original s':>11} {'chunked s':>10} {'original MB':>12} {'chunked MB':>11} "
+          f"{'padding unsorted':>17} {'padding sorted':>15}")
+    for n in args.tweets:
+        tweets = data_prep.preprocessor.preprocess(synthetic_tweets(n, seed=n))
+        original, original_seconds, original_peak = measure(
+            lambda: reference.get_embeddings(data_prep.model, tweets, args.batch_size))
+        chunked, chunked_seconds, chunked_peak = measure(
+            lambda: data_prep.get_embeddings(pd.DataFrame({'tweet': tweets}), args.batch_size, args.chunk_size))
+        assert np.allclose(original, chunked, atol=1e-5)
+        print(f"{n:>7} {original_seconds:>11.2f} {chunked_seconds:>10.2f} {original_peak / 2 ** 20:>12.1f} "
+              f"{chunked_peak / 2 ** 20:>11.1f} {padding(tweets, args.batch_size, args.chunk_size):>17.1%} "
+              f"{padding(sorted(tweets, key=len), args.batch_size, args.chunk_size):>15.1%}")
+
+
+if __name__ == '__main__':
+    main()
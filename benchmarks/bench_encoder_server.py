@@ -0,0 +1,117 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Encoding throughput under concurrent load: C callers each encode R requests of S tweets, like live users
+of the API arriving together.
+- inline: every caller encodes in the process with the shared model, one `encode` at a time
+- server: through the encoder server without batching (`--max-batch 1`)
+- batched: through the encoder server merging the concurrent requests (`--max-batch` / `--max-wait-ms`)
+Reports the tweets encoded per second, the p50/p99 latency of a request and the mean batch size of the
+server. The embeddings of the server are checked against the inline ones. Needs the sentence-transformers
+model.
+
+Run from the project root: `python -m benchmarks.bench_encoder_server`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_tweets
+from core.encoder_service import EncoderClient
+from core.models import model_registry, resolve_model_name
+
+
+def start_server(model_path: str, socket_path: str, max_batch: int, max_wait_ms: float) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, '-m', 'core.encoder_service', '--socket', socket_path,
+                                '--model-path', model_path, '--max-batch', str(max_batch),
+                                '--max-wait-ms', str(max_wait_ms)])
+    while True:
+        try:
+            Client(socket_path, family='AF_UNIX').close()
+            return process
+        except (ConnectionRefusedError, FileNotFoundError):
+            if process.poll() is not None:
+                raise RuntimeError(f"Encoder server exited with code {process.returncode}")
+            time.sleep(0.2)
+
+
+def run(encoder, requests: list, callers: int, batch_size: int) -> tuple:
+    """
+    Encode the requests from concurrent callers
+    :param encoder: shared encoder or `EncoderClient`
+    :param requests: lists of tweets, split between the callers
+    :param callers: concurrent callers
+    :param batch_size: encoding batch size
+    :return: (embeddings of each request, tweets per second, p50 ms, p99 ms)
+    """
+    def encode(tweets: list) -> tuple:
+        start = time.perf_counter()
+        embeddings = encoder.encode(tweets, batch_size=batch_size)
+        return embeddings, (time.perf_counter() - start) * 1000
+
+    encoder.encode(requests[0], batch_size=batch_size)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        results = list(executor.map(encode, requests))
+    seconds = time.perf_counter() - start
+    latencies = [latency for _, latency in results]
+    return ([embeddings for embeddings, _ in results], sum(map(len, requests)) / seconds,
+            float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99)))
+
+
+def main() -> None:
+    from config import ENCODE_BATCH_SIZE, ENCODER_MAX_BATCH, ENCODER_MAX_WAIT_MS, MODEL_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--callers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=8, help="requests per caller")
+    parser.add_argument('--tweets', type=int, default=4, help="tweets per request")
+    parser.add_argument('--model-path', default=MODEL_PATH, help="local model folder")
+    parser.add_argument('--max-batch', type=int, default=ENCODER_MAX_BATCH)
+    parser.add_argument('--max-wait-ms', type=float, default=ENCODER_MAX_WAIT_MS)
+    args = parser.parse_args()
+    model_path = os.path.abspath(args.model_path)
+
+    inline = model_registry.get(resolve_model_name(model_path))
+    with tempfile.TemporaryDirectory() as tmp:
+        servers = {}
+        try:
+            for name, max_batch, max_wait_ms in (('server', 1, 0), ('batched', args.max_batch, args.max_wait_ms)):
+                socket_path = os.path.join(tmp, f'{name}.sock')
+                servers[name] = (start_server(model_path, socket_path, max_batch, max_wait_ms),
+                                 EncoderClient(socket_path))
+
+            print(f"{'callers':>8} {'encoder':>8} {'tweets/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'batch':>7}")
+            for callers in args.callers:
+                tweets = synthetic_tweets(callers * args.requests * args.tweets, seed=callers)
+                requests = [tweets[start:start + args.tweets] for start in range(0, len(tweets), args.tweets)]
+                expected, throughput, p50, p99 = run(inline, requests, callers, ENCODE_BATCH_SIZE)
+                print(f"{callers:>8} {'inline':>8} {throughput:>10.0f} {p50:>9.1f} {p99:>9.1f} {'':>7}")
+                for name, (_, client) in servers.items():
+                    batches = client.stats()['batching']
+                    embeddings, throughput, p50, p99 = run(client, requests, callers, ENCODE_BATCH_SIZE)
+                    # batched with other requests, the tweets are padded differently
+                    for result, reference in zip(embeddings, expected):
+                        assert np.allclose(result, reference, atol=1e-5)
+                    after = client.stats()['batching']
+                    batch = (after['sentences'] - batches['sentences']) / max(after['batches'] - batches['batches'], 1)
+                    print(f"{callers:>8} {name:>8} {throughput:>10.0f} {p50:>9.1f} {p99:>9.1f} {batch:>7.1f}")
+        finally:
+            for process, _ in servers.values():
+                process.terminate()
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
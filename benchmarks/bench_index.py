@@ -0,0 +1,84 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Recall@k against the exact search and single-query QPS of the nearest-neighbour indexes, on
+clustered synthetic embeddings (topics + noise) of several corpus sizes.
+
+Run from the project root: `python -m benchmarks.bench_index`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import time
+
+import numpy as np
+import numpy.typing as npt
+
+from core.index import BruteForceIndex, IVFIndex, normalize_embeddings
+
+
+def clustered_embeddings(size: int, dimension: int = 384, topics: int = 1000, seed: int = 42) -> npt.NDArray:
+    """
+    Normalized embeddings scattered around random topic vectors
+    :param size:
+    :param dimension:
+    :param topics: number of topics
+    :param seed:
+    :return: (size x dimension) float32 matrix
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dimension), dtype=np.float32)
+    embeddings = np.empty((size, dimension), dtype=np.float32)
+    for start in range(0, size, 65536):
+        stop = min(start + 65536, size)
+        embeddings[start:stop] = centers[rng.integers(0, topics, stop - start)] + \
+            rng.standard_normal((stop - start, dimension), dtype=np.float32)
+    return normalize_embeddings(embeddings)
+
+
+def run_queries(index, queries: npt.NDArray, k: int) -> tuple:
+    """
+    Search the queries one at a time, as the API does
+    :param index:
+    :param queries:
+    :param k:
+    :return: (result rows, queries per second)
+    """
+    start = time.perf_counter()
+    rows = np.concatenate([index.search(query[np.newaxis], k)[0] for query in queries])
+    return rows, len(queries) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=100)
+    parser.add_argument('--nlist', type=int, default=0, help="0 for sqrt(users)")
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'index':>16} {'build (s)':>10} {'recall@' + str(args.k):>11} {'QPS':>9}")
+    for size in args.sizes:
+        embeddings = clustered_embeddings(size)
+        queries = embeddings[np.random.default_rng(0).integers(0, size, args.queries)]
+
+        exact_rows, qps = run_queries(BruteForceIndex(embeddings), queries, args.k)
+        print(f"{size:>8} {'brute-force':>16} {0:>10.2f} {1:>11.3f} {qps:>9.0f}")
+
+        start = time.perf_counter()
+        index = IVFIndex.build(embeddings, nlist=args.nlist)
+        build_time = time.perf_counter() - start
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            rows, qps = run_queries(index, queries, args.k)
+            recall = np.mean([len(np.intersect1d(found, exact)) / len(exact)
+                              for found, exact in zip(rows, exact_rows)])
+            print(f"{size:>8} {f'ivf {index.nlist}/{nprobe}':>16} {build_time:>10.2f} {recall:>11.3f} {qps:>9.0f}")
+        del embeddings, index
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Per-query latency of `match_top_celeb_users` for celebrity users: the original dataframe
+lookup + `cos_sim` against the precomputed normalized matrix and username index.
+
+Run from the project root: `python -m benchmarks.bench_matcher`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import reference
+from core.matcher import TwitterUserMatcher
+from core.store import EmbeddingStore
+
+EMBED_DATA_PATH = 'bench-embed-data'
+
+
+def synthetic_store(size: int, dimension: int = 384, seed: int = 42) -> EmbeddingStore:
+    """
+    Random embeddings for `size` users
+    :param size:
+    :param dimension:
+    :param seed:
+    :return: embedding store
+    """
+    rng = np.random.default_rng(seed)
+    return EmbeddingStore([f"User{i}" for i in range(size)],
+                          rng.standard_normal((size, dimension), dtype=np.float32), model='synthetic')
+
+
+def latency(query, usernames: list) -> tuple:
+    """
+    Run a query per username
+    :param query: callable taking a username
+    :param usernames:
+    :return: (p50, p99) latency in milliseconds
+    """
+    timings = []
+    for username in usernames:
+        start = time.perf_counter()
+        query(username)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[915, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    print(f"{'users':>8} {'before p50/p99 (ms)':>22} {'after p50/p99 (ms)':>22}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                store = synthetic_store(size)
+                os.mkdir(EMBED_DATA_PATH)
+                store.save(EMBED_DATA_PATH)
+                embed_data = store.to_frame()
+                matcher = TwitterUserMatcher(EMBED_DATA_PATH)
+                queries = [f"user{i}" for i in np.random.default_rng(0).integers(0, size, args.queries)]
+
+                before = latency(lambda username: list(reference.match_top_celeb_users(embed_data, username)),
+                                 queries)
+                after = latency(lambda username: list(matcher.match_top_celeb_users(username)), queries)
+                del matcher
+            finally:
+                os.chdir(cwd)
+        print(f"{size:>8} {before[0]:>10.2f} / {before[1]:<9.2f} {after[0]:>10.2f} / {after[1]:<9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Scrape-to-embed against the local fake timeline server: `BulkScraper` csv files then `load_data`
+against the `StreamingPipeline`, with and without the Parquet archive. Reports the wall time, the peak
+traced memory (numpy buffers included) and the bytes kept on disk, and checks the embeddings agree.
+Needs the sentence-transformers model.
+
+Run from the project root: `python -m benchmarks.bench_pipeline`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.fake_timeline import FakeTimelineServer
+from core.bulk_scraper import BulkScraper, TimelineClient
+from core.dataprep import TwitterDataPrep
+from core.pipeline import StreamingPipeline
+from core.store import EmbeddingStore
+
+DATA_PATH = 'bench-tweets-data'
+EMBED_DATA_PATH = 'bench-embed-data'
+
+
+def folder_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+
+
+def measure(run) -> tuple:
+    """
+    Run a build in a fresh folder
+    :param run: callable building the embeddings in the current folder
+    :return: (seconds, peak traced bytes, tweet bytes on disk, embeddings by username)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    store = EmbeddingStore.load(EMBED_DATA_PATH, mmap=False)
+    disk = folder_size(DATA_PATH) if os.path.exists(DATA_PATH) else 0
+    return seconds, peak, disk, dict(zip(store.usernames, store.matrix))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--tweets', type=int, default=3200, help="tweets per user")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per request")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--model-path', default=os.environ.get('MODEL_PATH') or 'models')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    screen_names = [f"user{i}" for i in range(args.users)]
+    server = FakeTimelineServer(tweets_per_user=args.tweets, latency=args.latency, limit=10 ** 9).start()
+    model_path = os.path.abspath(args.model_path)
+    cwd = os.getcwd()
+
+    def csv_build() -> None:
+        BulkScraper(TimelineClient(base_url=server.base_url), DATA_PATH, workers=args.workers,
+                    incremental=False, file_format='csv').scrape_users(screen_names)
+        TwitterDataPrep(model_path, DATA_PATH, EMBED_DATA_PATH).load_data(batch_size=args.batch_size)
+
+    def streaming(archive: bool) -> None:
+        StreamingPipeline(TimelineClient(base_url=server.base_url), TwitterDataPrep(model_path, DATA_PATH,
+                                                                                   EMBED_DATA_PATH),
+                          archive_path=DATA_PATH if archive else None, workers=args.workers,
+                          batch_size=args.batch_size).run(screen_names)
+
+    # load the model and the preprocessor once, outside the measures
+    TwitterDataPrep(model_path)
+    try:
+        results = {}
+        for name, run in [('csv files + load_data', csv_build),
+                          ('streaming, archive', lambda: streaming(True)),
+                          ('streaming, no archive', lambda: streaming(False))]:
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                try:
+                    results[name] = measure(run)
+                finally:
+                    os.chdir(cwd)
+    finally:
+        server.stop()
+
+    reference = results['csv files + load_data'][3]
+    print(f"{'build':>24} {'seconds':>8} {'peak MB':>8} {'disk MB':>8}")
+    for name, (seconds, peak, disk, embeddings) in results.items():
+        assert embeddings.keys() == reference.keys()
+        for username, embedding in embeddings.items():
+            assert np.allclose(embedding, reference[username], atol=1e-5)
+        print(f"{name:>24} {seconds:>8.2f} {peak / 2 ** 20:>8.1f} {disk / 2 ** 20:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Parity check and throughput of the fused batch preprocessing against the original
+five-pass `preprocess_data`, on a synthetic 3200-tweet user.
+
+Run from the project root: `python -m benchmarks.bench_preprocess`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import time
+
+import pandas as pd
+
+from benchmarks import reference
+from benchmarks.synthetic import load_emoticons, synthetic_tweets
+from core.preprocessing import TweetPreprocessor
+
+
+def synthetic_user(n: int = 3200) -> pd.DataFrame:
+    """
+    Build a user's tweet dataframe the way the scraper exports it (`b'...'` literals)
+    :param n: number of tweets
+    :return: dataframe
+    """
+    return pd.DataFrame({'tweet': [str(tweet.encode("utf-8")) for tweet in synthetic_tweets(n)]})
+
+
+def main(n: int = 3200) -> None:
+    emoticons_dict = load_emoticons()
+    preprocessor = TweetPreprocessor(emoticons_dict)
+    df = synthetic_user(n)
+
+    start = time.perf_counter()
+    expected = reference.preprocess_data(df.copy(), emoticons_dict)['tweet'].tolist()
+    before = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = preprocessor.preprocess(df['tweet'])
+    after = time.perf_counter() - start
+
+    mismatches = [(e, a) for e, a in zip(expected, actual) if e != a]
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[0]}"
+
+    print(f"tweets: {n} (parity OK)")
+    print(f"before: {before:.3f} s ({n / before:,.0f} tweets/s)")
+    print(f"after:  {after:.3f} s ({n / after:,.0f} tweets/s)")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Quantized brute-force search against the float32 matrix, on clustered synthetic embeddings (topics +
+noise): bytes of the matrix held in memory, ranking agreement with the float32 search (recall@k and
+top-1 agreement) and single-query QPS, for float16 and int8 with and without the float32 rescoring.
+
+Run from the project root: `python -m benchmarks.bench_quantization`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+
+import numpy as np
+
+from benchmarks.bench_index import clustered_embeddings, run_queries
+from core.index import QUANTIZATIONS, BruteForceIndex, QuantizedIndex, QuantizedMatrix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=100)
+    parser.add_argument('--rescore', type=int, nargs='+', default=[0, 2, 4])
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'matrix':>14} {'MB':>8} {'recall@' + str(args.k):>11} {'top-1':>6} {'QPS':>7}")
+    for size in args.sizes:
+        embeddings = clustered_embeddings(size)
+        queries = embeddings[np.random.default_rng(0).integers(0, size, args.queries)]
+
+        exact_rows, qps = run_queries(BruteForceIndex(embeddings), queries, args.k)
+        print(f"{size:>8} {'float32':>14} {embeddings.nbytes / 2 ** 20:>8.1f} {1:>11.3f} {1:>6.3f} {qps:>7.0f}")
+        for quantization in QUANTIZATIONS[1:]:
+            quantized = QuantizedMatrix.quantize(embeddings, quantization)
+            for rescore in args.rescore:
+                index = QuantizedIndex(quantized, embeddings, rescore=rescore)
+                rows, qps = run_queries(index, queries, args.k)
+                recall = np.mean([len(np.intersect1d(found, exact)) / len(exact)
+                                  for found, exact in zip(rows, exact_rows)])
+                top_1 = np.mean(rows[:, 0] == exact_rows[:, 0])
+                if rescore:
+                    # rescored results carry the float32 scores
+                    _, scores = index.search(queries[:8], args.k)
+                    assert np.allclose(scores, np.take_along_axis(queries[:8] @ embeddings.T,
+                                                                  index.search(queries[:8], args.k)[0], axis=1),
+                                       atol=1e-6)
+                name = f"{quantization}{f' +{rescore}x' if rescore else ''}"
+                print(f"{size:>8} {name:>14} {quantized.nbytes / 2 ** 20:>8.1f} {recall:>11.3f} {top_1:>6.3f} "
+                      f"{qps:>7.0f}")
+        del embeddings
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Bulk scraping throughput (users/hour) against the local fake timeline server: the original one user
+at a time loop (pages one by one + `time.sleep(3)` per user) and `BulkScraper` with several workers,
+then `BulkScraper` under a tight rate limit and failing requests, and finally the requests of a run
+resumed after a crash and of a `since_id` refresh against a full scrape.
+
+Run from the project root: `python -m benchmarks.bench_scraper`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import pandas as pd
+import tweepy
+from tweepy.models import Status
+
+from benchmarks.fake_timeline import FakeTimelineServer
+from core.archive import read_archive
+from core.bulk_scraper import PAGE_SIZE, BulkScraper, TimelineClient, TokenBucket
+
+
+def legacy_timeline(server: FakeTimelineServer, screen_name: str) -> pd.DataFrame:
+    """
+    `TwitterScraper.scrape_tweets` on the fake server pages, parsed into tweepy statuses
+    :param server:
+    :param screen_name:
+    :return: DataFrame of the tweets
+    """
+    api = tweepy.API()
+    alltweets = []
+    new_tweets = [Status.parse(api, tweet) for tweet in server.page(screen_name, PAGE_SIZE)]
+    alltweets.extend(new_tweets)
+    oldest = alltweets[-1].id - 1
+    while len(new_tweets) > 0:
+        new_tweets = [Status.parse(api, tweet) for tweet in server.page(screen_name, PAGE_SIZE, max_id=oldest)]
+        alltweets.extend(new_tweets)
+        oldest = alltweets[-1].id - 1
+    out_tweets = [[tweet.id_str, tweet.created_at, tweet.full_text.encode("utf-8")] for tweet in alltweets]
+    return pd.DataFrame(out_tweets, columns=['twitter_id', 'date', 'tweet'])
+
+
+def run(server: FakeTimelineServer, screen_names: list, workers: int) -> dict:
+    """
+    Scrape the users into a temporary folder
+    :param server:
+    :param screen_names:
+    :param workers:
+    :return: `BulkScraper.scrape_users` summary
+    """
+    client = TimelineClient(base_url=server.base_url, bucket=TokenBucket(), backoff=0.1)
+    with tempfile.TemporaryDirectory() as tmp:
+        return BulkScraper(client, file_path=tmp, workers=workers, file_format='csv').scrape_users(screen_names)
+
+
+class CrashingClient(TimelineClient):
+    """ Client whose process "crashes" after a number of requests """
+
+    def __init__(self, crash_after: int, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.crash_after = crash_after
+
+    def get_page(self, *args, **kwargs) -> list:
+        if self.requests >= self.crash_after:
+            raise KeyboardInterrupt
+        return super().get_page(*args, **kwargs)
+
+
+class TornFirstPage:
+    """ Tweet file whose first page is only half written when the process "crashes" """
+
+    def __init__(self, tweet_file) -> None:
+        self.tweet_file = tweet_file
+
+    def __getattr__(self, name: str):
+        return getattr(self.tweet_file, name)
+
+    def append(self, tweets: list, size: int) -> int:
+        if not size:
+            self.tweet_file.append(tweets[:len(tweets) // 2], size)
+            raise KeyboardInterrupt
+        return self.tweet_file.append(tweets, size)
+
+
+class TornFirstPageScraper(BulkScraper):
+    def tweet_file(self, screen_name: str) -> TornFirstPage:
+        return TornFirstPage(super().tweet_file(screen_name))
+
+
+def read_tweets(tweet_file) -> pd.DataFrame:
+    """
+    Tweets of a tweet file, as strings
+    :param tweet_file: `CsvTweetFile` or `ParquetTweetFile`
+    :return: dataframe
+    """
+    if tweet_file.path.endswith('.parquet'):
+        return read_archive(tweet_file.path).astype(str)
+    return pd.read_csv(tweet_file.path, dtype=str)
+
+
+def sorted_tweets(tweet_file) -> pd.DataFrame:
+    """
+    Tweets ordered by tweet id, refreshed tweets are appended at the end
+    :param tweet_file:
+    :return: dataframe
+    """
+    return read_tweets(tweet_file).sort_values('twitter_id', ignore_index=True)
+
+
+def incremental(server: FakeTimelineServer, screen_names: list, workers: int, file_format: str) -> None:
+    """
+    Requests of a resumed run and of a refresh, and the tweet files against a full scrape
+    :param server:
+    :param screen_names:
+    :param workers:
+    :param file_format: `csv` or `parquet`
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        scraper = BulkScraper(TimelineClient(base_url=server.base_url), file_path=tmp, workers=workers,
+                              file_format=file_format)
+        full = scraper.scrape_users(screen_names)
+        # crash halfway through
+        crashing = BulkScraper(CrashingClient(full['requests'] // 2, base_url=server.base_url),
+                               file_path=os.path.join(tmp, 'resumed'), workers=workers, file_format=file_format)
+        try:
+            crashing.scrape_users(screen_names)
+        except KeyboardInterrupt:
+            pass
+        resumed = BulkScraper(TimelineClient(base_url=server.base_url), file_path=os.path.join(tmp, 'resumed'),
+                              workers=workers, file_format=file_format)
+        pending = resumed.pending(screen_names)
+        # the interrupted users were writing a page, after their last checkpoint
+        for screen_name in pending:
+            if (tweet_file := resumed.tweet_file(screen_name)).exists():
+                if file_format == 'csv':
+                    with open(tweet_file.path, 'a') as f:
+                        f.write('123,2022-01-01 00:00:00+00:00,b"torn')
+                else:
+                    tweet_file.append(server.page(screen_name, PAGE_SIZE), tweet_file.size())
+        resume = resumed.scrape_users(pending)
+        for screen_name in screen_names:
+            assert read_tweets(resumed.tweet_file(screen_name)).equals(read_tweets(scraper.tweet_file(screen_name)))
+
+        # crash while writing the first page of a user, the resume scrapes it again from the newest tweet
+        torn_path = os.path.join(tmp, 'torn')
+        try:
+            TornFirstPageScraper(TimelineClient(base_url=server.base_url), file_path=torn_path,
+                                 file_format=file_format).update_tweets(screen_names[0])
+        except KeyboardInterrupt:
+            pass
+        torn = BulkScraper(TimelineClient(base_url=server.base_url), file_path=torn_path, file_format=file_format)
+        assert torn.pending(screen_names[:1]) == screen_names[:1]
+        torn.scrape_users(screen_names[:1])
+        assert read_tweets(torn.tweet_file(screen_names[0])).equals(read_tweets(scraper.tweet_file(screen_names[0])))
+
+        # new tweets posted, refresh with `since_id` against scraping everything again
+        server.tweets_per_user += 30
+        refresh = resumed.scrape_users(screen_names)
+        rescrape = BulkScraper(TimelineClient(base_url=server.base_url), file_path=tmp, workers=workers,
+                               incremental=False, file_format=file_format).scrape_users(screen_names)
+        for screen_name in screen_names:
+            assert sorted_tweets(resumed.tweet_file(screen_name)).equals(
+                sorted_tweets(scraper.tweet_file(screen_name)))
+        if file_format == 'csv':
+            # switching to the archive, the csv users are converted and refreshed instead of scraped again
+            upgraded = BulkScraper(TimelineClient(base_url=server.base_url), file_path=os.path.join(tmp, 'resumed'),
+                                   workers=workers, file_format='parquet')
+            upgrade = upgraded.scrape_users(screen_names)
+            assert upgrade['requests'] == len(screen_names) and not upgrade['tweets']
+            for screen_name in screen_names:
+                assert upgraded.tweet_file(screen_name).ids().sort_values(ignore_index=True).equals(
+                    resumed.tweet_file(screen_name).ids().sort_values(ignore_index=True))
+        server.tweets_per_user -= 30
+
+    print(f"{f'{file_format} files':>28} {'requests':>9} {'tweets':>9} {'seconds':>8}")
+    print(f"{'full scrape':>28} {full['requests']:>9} {full['tweets']:>9} {full['seconds']:>8}")
+    print(f"{f'resume {len(pending)} interrupted':>28} {resume['requests']:>9} {resume['tweets']:>9} "
+          f"{resume['seconds']:>8}")
+    print(f"{'refresh, 30 new tweets/user':>28} {refresh['requests'] - resume['requests']:>9} "
+          f"{refresh['tweets']:>9} {refresh['seconds']:>8}")
+    print(f"{'full re-scrape':>28} {rescrape['requests']:>9} {rescrape['tweets']:>9} {rescrape['seconds']:>8}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=48)
+    parser.add_argument('--tweets', type=int, default=3200, help="tweets per user")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per request")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    screen_names = [f"user{i}" for i in range(args.users)]
+    server = FakeTimelineServer(tweets_per_user=args.tweets, latency=args.latency, limit=10 ** 9).start()
+    try:
+        # same csv output as the tweepy scraper
+        client = TimelineClient(base_url=server.base_url)
+        for screen_name in screen_names[:2]:
+            assert client.user_timeline(screen_name).to_csv(index=False) == \
+                legacy_timeline(server, screen_name).to_csv(index=False)
+
+        # original loop, one user at a time, timed on a few users
+        sample = screen_names[:max(args.users // 8, 2)]
+        start = time.perf_counter()
+        run(server, sample, workers=1)
+        per_user = (time.perf_counter() - start) / len(sample) + 3
+        print(f"{'scraper':>28} {'users/hour':>12} {'requests':>9} {'429s':>6} {'failed':>7}")
+        print(f"{'one at a time + sleep(3)':>28} {3600 / per_user:>12.0f} {'':>9} {'':>6} {'':>7}")
+        for workers in args.workers:
+            summary = run(server, screen_names, workers)
+            print(f"{f'bulk, {workers} workers':>28} {summary['users_per_hour']:>12.0f} {summary['requests']:>9} "
+                  f"{summary['rate_limited']:>6} {len(summary['failed']):>7}")
+    finally:
+        server.stop()
+
+    # a tight rate limit window and 5% failing requests, the token bucket waits for the resets
+    server = FakeTimelineServer(tweets_per_user=args.tweets, latency=args.latency, limit=100, window=5,
+                                error_rate=0.05).start()
+    try:
+        summary = run(server, screen_names[:24] + ['missing0'], workers=max(args.workers))
+        print(f"{'bulk, 100 req/5s, 5% 503s':>28} {summary['users_per_hour']:>12.0f} {summary['requests']:>9} "
+              f"{summary['rate_limited']:>6} {len(summary['failed']):>7}  "
+              f"(rate limit waits {summary['rate_limit_wait_seconds']} thread-s, server rejected {server.rejected})")
+        assert summary['failed'] == ['missing0']
+    finally:
+        server.stop()
+    print()
+
+    # resumable scraping and `since_id` refresh
+    server = FakeTimelineServer(tweets_per_user=args.tweets, latency=args.latency, limit=10 ** 9).start()
+    try:
+        for file_format in ('csv', 'parquet'):
+            incremental(server, screen_names[:16], workers=max(args.workers), file_format=file_format)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Per-query latency of the top n results as served by the API and the app: the full python
+sort of the zipped scores + `[1:top_n + 1]` slice against the partial `top_k` selection,
+and the per-query cost of `top_k_batch`, which scores chunks of users with one matrix product.
+
+Run from the project root: `python -m benchmarks.bench_topk`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_matcher import EMBED_DATA_PATH, latency, synthetic_store
+from core.matcher import TwitterUserMatcher
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[915, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-n', type=int, default=100)
+    args = parser.parse_args()
+
+    def sorted_top_n(username: str) -> list:
+        closest_list = matcher.match_top_celeb_users(username)
+        return sorted(closest_list, key=lambda item: item[1], reverse=True)[1:args.top_n + 1]
+
+    cwd = os.getcwd()
+    print(f"{'users':>8} {'sort p50/p99 (ms)':>22} {'top_k p50/p99 (ms)':>22} {'batch per query (ms)':>22}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                os.mkdir(EMBED_DATA_PATH)
+                synthetic_store(size).save(EMBED_DATA_PATH)
+                matcher = TwitterUserMatcher(EMBED_DATA_PATH)
+                queries = [f"user{i}" for i in np.random.default_rng(0).integers(0, size, args.queries)]
+
+                # same users and scores as the sorted slice
+                for username in queries[:10]:
+                    usernames, scores = matcher.top_k(username, args.top_n)
+                    expected = sorted_top_n(username)
+                    assert list(usernames) == [k for k, _ in expected]
+                    assert np.allclose(scores, [v for _, v in expected])
+                for username, (usernames, scores) in matcher.top_k_batch(queries[:10], args.top_n, chunk_size=4):
+                    assert list(usernames) == list(matcher.top_k(username, args.top_n)[0])
+
+                before = latency(sorted_top_n, queries)
+                after = latency(lambda username: matcher.top_k(username, args.top_n), queries)
+                start = time.perf_counter()
+                for _ in matcher.top_k_batch(queries, args.top_n):
+                    pass
+                batch = (time.perf_counter() - start) * 1000 / len(queries)
+                del matcher
+            finally:
+                os.chdir(cwd)
+        print(f"{size:>8} {before[0]:>10.2f} / {before[1]:<9.2f} {after[0]:>10.2f} / {after[1]:<9.2f} {batch:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
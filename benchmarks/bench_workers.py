@@ -0,0 +1,164 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Memory of N API workers alive at the same time, each holding a matcher and an encoder:
+- before: every worker normalizes its own copy of the matrix and loads its own model
+- after: the workers memory-map the one normalized matrix file and encode through one encoder server
+RSS counts shared pages in every worker, PSS splits them between the workers sharing them, so the
+PSS total is the memory actually used. The encoder server is counted in the `after` total.
+
+Run from the project root: `python -m benchmarks.bench_workers`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing.connection import Client
+
+import numpy as np
+
+from benchmarks.bench_matcher import EMBED_DATA_PATH, synthetic_store
+from core.store import EmbeddingStore
+
+
+def memory(pid: str = 'self') -> dict:
+    """
+    Resident memory of a process
+    :param pid: process id, `self` for the current one
+    :return: rss, pss and private bytes
+    """
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            field, _, rest = line.partition(':')
+            if field in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                values[field] = int(rest.split()[0]) * 1024
+    return {'rss': values['Rss'], 'pss': values['Pss'],
+            'private': values['Private_Clean'] + values['Private_Dirty']}
+
+
+def worker(embed_data_path: str, shared: bool, model_path: str, encoder_socket: str, results, done) -> None:
+    """
+    Load the matcher and the encoder like an API worker, answer a match, then report the memory
+    :param embed_data_path: embedding store
+    :param shared: shared matrix and encoder server, otherwise a private matrix and model
+    :param model_path: local model folder, no encoder if None
+    :param encoder_socket: socket of the encoder server
+    :param results: queue receiving the memory of the worker
+    :param done: event set once every worker reported
+    :return:
+    """
+    from core.matcher import TwitterUserMatcher
+
+    matcher = TwitterUserMatcher(embed_data_path, shared_matrix=shared)
+    matcher.top_k(matcher.usernames[0], 10)
+    if model_path is not None:
+        from core.dataprep import TwitterDataPrep
+
+        encoder = None
+        if shared:
+            from core.encoder_service import EncoderClient
+
+            encoder = EncoderClient(encoder_socket)
+        dataprep = TwitterDataPrep(model_path, encoder=encoder)
+        dataprep.model.encode(["warm up"])
+    results.put(memory())
+    done.wait()
+
+
+def start_encoder_server(model_path: str, socket_path: str) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, '-m', 'core.encoder_service', '--socket', socket_path,
+                                '--model-path', model_path])
+    while True:
+        try:
+            Client(socket_path, family='AF_UNIX').close()
+            return process
+        except (ConnectionRefusedError, FileNotFoundError):
+            if process.poll() is not None:
+                raise RuntimeError(f"Encoder server exited with code {process.returncode}")
+            time.sleep(0.2)
+
+
+def run_workers(workers: int, *args) -> list:
+    """
+    Start the workers and collect their memory while they are all alive
+    :param workers: number of workers
+    :param args: `worker` arguments
+    :return: memory of each worker
+    """
+    context = multiprocessing.get_context('spawn')
+    results, done = context.Queue(), context.Event()
+    processes = [context.Process(target=worker, args=(*args, results, done))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for _ in processes:
+            while True:
+                try:
+                    results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    if any(process.exitcode for process in processes):
+                        raise RuntimeError("A worker failed")
+        # PSS depends on how many processes map a page, read it again once they all did
+        reports = [memory(str(process.pid)) for process in processes]
+    finally:
+        done.set()
+        for process in processes:
+            process.join()
+    return reports
+
+
+def main() -> None:
+    from config import MODEL_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--model-path', default=MODEL_PATH, help="local model folder")
+    parser.add_argument('--no-model', action='store_true', help="measure the matcher only")
+    args = parser.parse_args()
+    model_path = None if args.no_model else os.path.abspath(args.model_path)
+
+    print(f"{'users':>8} {'workers':>16} {'RSS/worker':>11} {'PSS/worker':>11} {'PSS total MB':>13}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            # the workers load the emoticons relative to the project root, the store is given by its full path
+            embed_data_path = os.path.join(tmp, EMBED_DATA_PATH)
+            socket_path = os.path.join(tmp, 'encoder.sock')
+            server = None
+            try:
+                store = synthetic_store(size)
+                os.mkdir(embed_data_path)
+                store.save(embed_data_path)
+                before = run_workers(args.workers, embed_data_path, False, model_path, socket_path)
+                if model_path is not None:
+                    server = start_encoder_server(model_path, socket_path)
+                after = run_workers(args.workers, embed_data_path, True, model_path, socket_path)
+                normalized = np.load(EmbeddingStore.file_path(embed_data_path, '.normalized.npy'), mmap_mode='r')
+                assert np.allclose(normalized, store.matrix / np.linalg.norm(store.matrix, axis=1,
+                                                                                 keepdims=True), atol=1e-6)
+                del normalized
+                server_pss = memory(str(server.pid))['pss'] if server is not None else 0
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.wait()
+        for name, reports, extra in (('private', before, 0), ('shared', after, server_pss)):
+            rss = np.mean([report['rss'] for report in reports]) / 2 ** 20
+            pss = np.mean([report['pss'] for report in reports]) / 2 ** 20
+            total = (sum(report['pss'] for report in reports) + extra) / 2 ** 20
+            print(f"{size:>8} {name:>16} {rss:>11.1f} {pss:>11.1f} {total:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Local fake of the Twitter `statuses/user_timeline` API, to measure the scrapers offline - every user
+has the same number of synthetic tweets, pages honour `count`/`max_id`/`since_id`, raising
+`tweets_per_user` posts new tweets (the older ones keep their id and text), responses carry the
+`x-rate-limit-*` headers of a fixed window (429 once it is used up), and a share of the requests
+can fail with a 503 to exercise the retries. Users starting with `missing` are not found (404).
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic import synthetic_tweets
+
+
+class FakeTimelineServer:
+    def __init__(self, tweets_per_user: int = 3200, latency: float = 0.05, limit: int = 900, window: float = 900,
+                 error_rate: float = 0.0, seed: int = 42) -> None:
+        """
+        :param tweets_per_user:
+        :param latency: seconds added to every response
+        :param limit: requests per rate limit window
+        :param window: window seconds
+        :param error_rate: share of the requests answered with a 503
+        :param seed:
+        """
+        self.tweets_per_user = tweets_per_user
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.error_rate = error_rate
+        self.texts = synthetic_tweets(1000, seed)
+        self.requests = 0
+        self.rejected = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._window_requests = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/1.1"
+
+    def start(self) -> 'FakeTimelineServer':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def tweet(self, screen_name: str, i: int) -> dict:
+        """
+        The i-th newest tweet of a user
+        :param screen_name:
+        :param i:
+        :return: tweet json
+        """
+        n = self.tweets_per_user - i  # n-th oldest tweet
+        tweet_id = zlib.crc32(screen_name.encode()) * 10 ** 6 + n
+        created_at = datetime(2021, 1, 1, tzinfo=timezone.utc) + timedelta(hours=n)
+        return {'id': tweet_id, 'id_str': str(tweet_id),
+                'created_at': created_at.strftime('%a %b %d %H:%M:%S %z %Y'),
+                'full_text': self.texts[(tweet_id + n) % len(self.texts)],
+                'user': {'id': zlib.crc32(screen_name.encode()), 'screen_name': screen_name}}
+
+    def page(self, screen_name: str, count: int, max_id: int = None, since_id: int = None) -> list:
+        """
+        Tweets of a user, newest first, with an id lower than or equal to `max_id` and greater than `since_id`
+        :param screen_name:
+        :param count:
+        :param max_id:
+        :param since_id:
+        :return: list of tweet json
+        """
+        newest_id = zlib.crc32(screen_name.encode()) * 10 ** 6 + self.tweets_per_user
+        start = 0 if max_id is None else max(newest_id - max_id, 0)
+        stop = self.tweets_per_user if since_id is None else min(max(newest_id - since_id, 0), self.tweets_per_user)
+        return [self.tweet(screen_name, i) for i in range(start, min(start + count, stop))]
+
+    def _rate_limit(self) -> tuple:
+        # (allowed, headers) of a request in the current window
+        with self._lock:
+            self.requests += 1
+            now = time.time()
+            if now >= self._window_start + self.window:
+                self._window_start += self.window * math.floor((now - self._window_start) / self.window)
+                self._window_requests = 0
+            self._window_requests += 1
+            allowed = self._window_requests <= self.limit
+            if not allowed:
+                self.rejected += 1
+            failed = allowed and self._rng.random() < self.error_rate
+            headers = {'x-rate-limit-limit': str(self.limit),
+                       'x-rate-limit-remaining': str(max(self.limit - self._window_requests, 0)),
+                       'x-rate-limit-reset': f"{self._window_start + self.window:.3f}"}
+        return allowed, failed, headers
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send(self, status: int, body: object, headers: dict) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                time.sleep(server.latency)
+                allowed, failed, headers = server._rate_limit()
+                if url.path != '/1.1/statuses/user_timeline.json':
+                    return self._send(404, {'errors': [{'code': 34}]}, headers)
+                if not allowed:
+                    return self._send(429, {'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}, headers)
+                if failed:
+                    return self._send(503, {'errors': [{'code': 130, 'message': 'Over capacity'}]}, headers)
+                screen_name = params.get('screen_name', '')
+                if screen_name.startswith('missing'):
+                    return self._send(404, {'errors': [{'code': 34}]}, headers)
+                max_id = int(params['max_id']) if 'max_id' in params else None
+                since_id = int(params['since_id']) if 'since_id' in params else None
+                self._send(200, server.page(screen_name, int(params.get('count', 20)), max_id, since_id), headers)
+
+        return Handler
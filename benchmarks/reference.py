@@ -0,0 +1,116 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Reference implementations of the original per-tweet preprocessing, kept to check the
+optimized code paths for parity and to measure them against.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import re
+from operator import itemgetter
+
+import demoji
+import numpy as np
+import pandas as pd
+
+from core.preprocessing import parse_bytes
+
+
+def clean_text(text: str) -> str:
+    pat1 = r'@[^ ]+'  # remove username @
+    pat2 = r'https?://[A-Za-z0-9./]+'  # remove urls
+    pat4 = r'\#\w+'  # remove hashtag
+    pat5 = r'&amp '  # remove unicode `&`
+    pat7 = r'RT'  # remove RT / retweet
+    pat8 = r'www\S+'  # remove link www
+    combined_pat = r'|'.join((pat1, pat2, pat4, pat5, pat7, pat8))  # combine all patterns
+    text = re.sub(combined_pat, "", text)
+    text = re.sub(r'\s+', ' ', text)  # remove extra spaces
+    return text.strip()
+
+
+def replace_emoticons(text: str, emoticons_dict: dict) -> str:
+    for emoticon, context in emoticons_dict.items():
+        text = text.replace(emoticon, ' ' + context + ' ')
+        text = re.sub(' +', ' ', text)
+    return text
+
+
+def replace_emojis(text: str) -> str:
+    for emoji, context in demoji.findall(text).items():
+        text = text.replace(emoji, ' ' + context + ' ')
+        text = re.sub(' +', ' ', text)
+    return text
+
+
+def preprocess_data(df: pd.DataFrame, emoticons_dict: dict) -> pd.DataFrame:
+    """
+    The original five-pass `TwitterDataPrep.preprocess_data`
+    :param df: dataframe
+    :param emoticons_dict:
+    :return: dataframe
+    """
+    df['tweet'] = df['tweet'].apply(parse_bytes)
+    df['tweet'] = df['tweet'].str.normalize('NFKD')
+    df['tweet'] = df['tweet'].map(clean_text)
+    df['tweet'] = df['tweet'].apply(lambda x: replace_emoticons(x, emoticons_dict))
+    df['tweet'] = df['tweet'].apply(lambda x: replace_emojis(x))
+    return df
+
+
+def process_embedding_data(embeddings, username: str) -> pd.DataFrame:
+    """
+    The original per-user split of a vector into columns through 384 `itemgetter`s
+    :param embeddings:
+    :param username:
+    :return: dataframe
+    """
+    temp_df = pd.DataFrame({"emb": [embeddings]})
+    indices = range(len(temp_df['emb'][0]))
+    temp_df = temp_df['emb'].transform({f'v{i + 1}': itemgetter(i) for i in indices})
+    temp_df.insert(0, 'username', username)
+    return temp_df
+
+
+def get_embeddings(model, tweets: list, batch_size: int = 32):
+    """
+    The original `TwitterDataPrep.get_embeddings` - every tweet encoded at once, then averaged
+    :param model: sentence-transformers model
+    :param tweets:
+    :param batch_size:
+    :return: mean embedding
+    """
+    vectors = model.encode(tweets, batch_size=batch_size)
+    return vectors.mean(axis=0)
+
+
+def collect_embeddings(usernames: list, vectors) -> pd.DataFrame:
+    """
+    The original `load_data` collection - one `pd.concat` per user
+    :param usernames:
+    :param vectors:
+    :return: dataframe
+    """
+    df_embeddings = pd.DataFrame()
+    for username, embeddings in zip(usernames, vectors):
+        temp_df = process_embedding_data(embeddings, username)
+        df_embeddings = pd.concat([df_embeddings, temp_df], ignore_index=True)
+    return df_embeddings
+
+
+def match_top_celeb_users(embed_data: pd.DataFrame, username: str) -> zip:
+    """
+    The original `TwitterUserMatcher.match_top_celeb_users` over the embedding dataframe
+    :param embed_data: (username, v1..vN) embedding dataframe
+    :param username: celebrity username
+    :return: zip object of usernames and cosine similarity score
+    """
+    from sentence_transformers import util
+
+    user_df = embed_data[embed_data.username.str.lower() == username.lower()]
+    cos_sim_results = np.squeeze(
+        util.cos_sim(user_df.iloc[:, 1:].values.astype(np.float32),
+                     embed_data.iloc[:, 1:].values.astype(np.float32)).numpy())
+    return zip(embed_data.iloc[:, 0], cos_sim_results)
@@ -0,0 +1,257 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Benchmark suite - preprocessing throughput, encoding throughput, `load_data` end-to-end, matcher load
+time and `match_top_celeb_users` / `top_k` latency, on synthetic tweets and embeddings, offline.
+The results are written as JSON with the commit they ran on, and can be compared with an earlier run.
+
+The encoding and `load_data` benchmarks need a local model folder (e.g. a small model saved with
+`SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2').save('models-small')`), they are
+skipped otherwise - unless `--allow-download`.
+
+Run from the project root: `python -m benchmarks.suite --output bench.json [--compare baseline.json]`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import load_emoticons, synthetic_tweets
+from core.index import QUANTIZATIONS
+from core.preprocessing import TweetPreprocessor, clean_text
+
+# metrics with these suffixes are better when higher, the others when lower, the other values are settings
+HIGHER_IS_BETTER = ('_per_s',)
+LOWER_IS_BETTER = ('_ms', '_s')
+
+
+def best_of(fn, repeat: int) -> float:
+    """
+    Best wall time of a few runs
+    :param fn:
+    :param repeat:
+    :return: seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_preprocessing(args: argparse.Namespace) -> dict:
+    """
+    Tweets per second of each preprocessing step and of the fused batch preprocessing
+    """
+    preprocessor = TweetPreprocessor(load_emoticons())
+    tweets = synthetic_tweets(args.tweets)
+    raw = [str(tweet.encode("utf-8")) for tweet in tweets]
+    steps = {
+        'clean_text': lambda: [clean_text(tweet) for tweet in tweets],
+        'replace_emoticons': lambda: [preprocessor.emoticon_replacer.replace(tweet) for tweet in tweets],
+        'replace_emojis': lambda: [preprocessor.replace_emojis(tweet) for tweet in tweets],
+        'preprocess': lambda: preprocessor.preprocess(raw),
+    }
+    return {f"{step}_tweets_per_s": round(len(tweets) / best_of(fn, args.repeat), 1) for step, fn in steps.items()}
+
+
+def load_model_data_prep(args: argparse.Namespace):
+    """
+    Data preparation object of the benchmark model
+    :return: `TwitterDataPrep`
+    :raise LookupError: if there is no local model folder and downloading it is not allowed
+    """
+    from core.dataprep import TwitterDataPrep
+    from core.models import resolve_model_name
+
+    model_path = os.path.abspath(args.model_path)
+    if resolve_model_name(model_path) != model_path and not args.allow_download:
+        raise LookupError(f"no local model in {model_path}")
+    return TwitterDataPrep(model_path=model_path)
+
+
+def bench_encoding(args: argparse.Namespace) -> dict:
+    """
+    Tweets per second of the model, and of the chunked mean embedding of a user
+    """
+    data_prep = load_model_data_prep(args)
+    tweets = data_prep.preprocessor.preprocess(synthetic_tweets(args.tweets), decoded=True)
+    data_prep.model.encode(tweets[:args.batch_size], batch_size=args.batch_size)  # warm up
+    encode = best_of(lambda: data_prep.model.encode(tweets, batch_size=args.batch_size), args.repeat)
+    mean = best_of(lambda: data_prep.get_embeddings(pd.DataFrame({'tweet': tweets}), args.batch_size), args.repeat)
+    return {'model': data_prep.model_name, 'batch_size': args.batch_size,
+            'encode_tweets_per_s': round(len(tweets) / encode, 1),
+            'get_embeddings_tweets_per_s': round(len(tweets) / mean, 1)}
+
+
+def bench_load_data(args: argparse.Namespace) -> dict:
+    """
+    `load_data` of synthetic csv files, then the incremental rebuild of the unchanged users
+    """
+    from core.dataprep import TwitterDataPrep
+
+    model_path = os.path.abspath(load_model_data_prep(args).model_path)
+    users = [synthetic_tweets(args.user_tweets, seed=i) for i in range(args.users)]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            os.mkdir('bench-tweets-data')
+            for i, tweets in enumerate(users):
+                pd.DataFrame({'twitter_id': range(len(tweets)), 'date': '2022-01-01 00:00:00+00:00',
+                              'tweet': [tweet.encode("utf-8") for tweet in tweets]}) \
+                    .to_csv(os.path.join('bench-tweets-data', f"user{i}.csv"), index=False)
+            data_prep = TwitterDataPrep(model_path, 'bench-tweets-data', 'bench-embed-data')
+            start = time.perf_counter()
+            data_prep.load_data(workers=args.workers, batch_size=args.batch_size)
+            full = time.perf_counter() - start
+            start = time.perf_counter()
+            data_prep.load_data(workers=args.workers, batch_size=args.batch_size)
+            incremental = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    return {'users': args.users, 'tweets_per_user': args.user_tweets, 'workers': args.workers,
+            'full_s': round(full, 3), 'users_per_s': round(args.users / full, 2),
+            'incremental_unchanged_s': round(incremental, 3)}
+
+
+def bench_matcher(args: argparse.Namespace) -> dict:
+    """
+    Matcher load time on a synthetic store, then the latency of celebrity queries
+    """
+    from benchmarks.bench_matcher import EMBED_DATA_PATH, latency, synthetic_store
+    from core.matcher import TwitterUserMatcher
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            os.mkdir(EMBED_DATA_PATH)
+            synthetic_store(args.matcher_users).save(EMBED_DATA_PATH)
+            start = time.perf_counter()
+            matcher = TwitterUserMatcher(EMBED_DATA_PATH, quantization=args.quantization)
+            load = time.perf_counter() - start
+            queries = [f"User{i}" for i in np.random.default_rng(0).integers(0, args.matcher_users, args.queries)]
+            match_p50, match_p99 = latency(lambda username: list(matcher.match_top_celeb_users(username)), queries)
+            top_k_p50, top_k_p99 = latency(lambda username: matcher.top_k(username, 10), queries)
+            matrix_bytes = matcher.normalized_embeddings.nbytes
+            del matcher
+        finally:
+            os.chdir(cwd)
+    return {'users': args.matcher_users, 'queries': args.queries, 'quantization': args.quantization,
+            'matrix_bytes': matrix_bytes, 'load_s': round(load, 4),
+            'match_top_celeb_users_p50_ms': round(match_p50, 3), 'match_top_celeb_users_p99_ms': round(match_p99, 3),
+            'top_k_p50_ms': round(top_k_p50, 3), 'top_k_p99_ms': round(top_k_p99, 3)}
+
+
+BENCHMARKS = {'preprocessing': bench_preprocessing, 'encoding': bench_encoding, 'load_data': bench_load_data,
+              'matcher': bench_matcher}
+
+
+def git_commit() -> dict:
+    """
+    Commit of the working tree
+    :return: {commit, dirty}, None values outside a git checkout
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                                text=True, check=True).stdout
+        return {'commit': commit.strip(), 'dirty': bool(status.strip())}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Print the change of every metric against an earlier run
+    :param results: suite results
+    :param baseline: earlier suite results
+    :param threshold: relative change counted as a regression, e.g. 0.1
+    :return: regressed metrics, as `benchmark.metric`
+    """
+    regressions = []
+    print(f"{'metric':>48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, metrics in results['benchmarks'].items():
+        for metric, value in metrics.items():
+            before = baseline['benchmarks'].get(name, {}).get(metric)
+            if not metric.endswith(HIGHER_IS_BETTER + LOWER_IS_BETTER) or not isinstance(before, (int, float)) \
+                    or not before:
+                continue
+            change = (value - before) / before
+            # a regression is slower: less throughput or more time
+            worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+            flag = ' !' if worse > threshold else ''
+            if flag:
+                regressions.append(f"{name}.{metric}")
+            print(f"{f'{name}.{metric}':>48} {before:>12g} {value:>12g} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='bench-results.json', help="results json file")
+    parser.add_argument('--compare', help="results json file of an earlier run")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change counted as a regression")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="benchmarks to run, all by default")
+    parser.add_argument('--model-path', default=os.environ.get('MODEL_PATH') or 'models')
+    parser.add_argument('--allow-download', action='store_true', help="download the default model if needed")
+    parser.add_argument('--tweets', type=int, default=3200, help="tweets of the throughput benchmarks")
+    parser.add_argument('--users', type=int, default=20, help="users of the `load_data` benchmark")
+    parser.add_argument('--user-tweets', type=int, default=200, help="tweets per user of the `load_data` benchmark")
+    parser.add_argument('--workers', type=int, default=1, help="preprocessing processes of `load_data`")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--matcher-users', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--quantization', default=QUANTIZATIONS[0], choices=QUANTIZATIONS, help="matcher embeddings")
+    parser.add_argument('--repeat', type=int, default=3, help="runs of the throughput benchmarks, the best counts")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    results = {'meta': {**git_commit(),
+                        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                        'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                        'args': {name: value for name, value in vars(args).items()
+                                 if name not in ('output', 'compare', 'threshold')}},
+               'benchmarks': {}, 'skipped': {}}
+    for name in args.only or BENCHMARKS:
+        start = time.perf_counter()
+        try:
+            results['benchmarks'][name] = BENCHMARKS[name](args)
+        except (ImportError, LookupError) as e:
+            results['skipped'][name] = str(e)
+            print(f"{name}: skipped ({e})", file=sys.stderr)
+            continue
+        print(f"{name} ({time.perf_counter() - start:.1f}s): {json.dumps(results['benchmarks'][name])}",
+              file=sys.stderr)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Against {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+        if regressions := compare(results, baseline, args.threshold):
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+## Twitter Celebrity Matcher - Benchmarks
+
+Synthetic tweet generator shared by the benchmark scripts, so they run offline without the scraped dataset.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import json
+import random
+from pathlib import Path
+
+WORDS = ['the', 'new', 'movie', 'is', 'awesome', 'thanks', 'everyone', 'for', 'coming', 'tonight', 'love',
+         'great', 'game', 'today', 'album', 'out', 'now', 'see', 'you', 'soon', "it's", '"quoted"', 'back\\slash', 'café', 'ﬁnal', 'Ｔｏｋｙｏ']
+EXTRAS = ['@someone', 'https://t.co/AbC123xyz', '#throwback', '&amp ', 'RT', 'www.example.com', '😂', '❤️',
+          '👍🏽', '🔥', '\n', '  ']
+
+
+def load_emoticons() -> dict:
+    """
+    Load the emoticon dictionary used by the data preparation
+    :return: emoticon dictionary
+    """
+    with open(Path("utilities/") / "emoticon_dict.json") as f:
+        return json.load(f)
+
+
+def synthetic_tweets(n: int, seed: int = 42) -> list:
+    """
+    Generate tweets mixing words, mentions, urls, hashtags, emoticons and emojis
+    :param n: number of tweets
+    :param seed: random seed
+    :return: list of tweets
+    """
+    rng = random.Random(seed)
+    emoticons = list(load_emoticons())
+    tweets = []
+    for _ in range(n):
+        tokens = rng.choices(WORDS, k=rng.randint(5, 30))
+        for _ in range(rng.randint(0, 4)):
+            tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(EXTRAS))
+        for _ in range(rng.randint(0, 2)):
+            # emoticons are often glued to words or to each other, e.g. `great:-))` or `xD:(`
+            emoticon = rng.choice(emoticons) + rng.choice(['', '', ')', rng.choice(emoticons)])
+            tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(['', rng.choice(WORDS)]) + emoticon)
+        tweets.append(' '.join(tokens))
+    return tweets
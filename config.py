@@ -19,3 +19,44 @@ MODEL_PATH = os.environ.get('MODEL_PATH')  # path to save/load models
 TWITTER_USER_LIST_PATH = os.environ.get("TWITTER_USER_LIST_PATH")
 # user listing file
 TWITTER_USER_LIST_FILE = os.environ.get("TWITTER_USER_LIST_FILE")
+
+# embedding build
+PREP_WORKERS = int(os.environ.get("PREP_WORKERS", 1))  # preprocessing processes, 1 to preprocess inline
+ENCODE_BATCH_SIZE = int(os.environ.get("ENCODE_BATCH_SIZE", 32))  # sentence-transformers encoding batch size
+ENCODE_CHUNK_SIZE = int(os.environ.get("ENCODE_CHUNK_SIZE", 1024))  # tweets of a user encoded per model call
+
+# nearest-neighbour index of the matcher
+INDEX_BACKEND = os.environ.get("INDEX_BACKEND", "brute-force")  # `brute-force` (exact) or `ivf` (approximate)
+IVF_NLIST = int(os.environ.get("IVF_NLIST", 0))  # number of IVF lists, 0 for sqrt(users)
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", 8))  # IVF lists scored per query, trades latency for recall
+MATCHER_QUANTIZATION = os.environ.get("MATCHER_QUANTIZATION", "float32")  # `float16` / `int8` for a smaller matrix
+MATCHER_RESCORE = int(os.environ.get("MATCHER_RESCORE", 4))  # quantized candidates rescored per result, 0 disables
+MATCHER_RELOAD_INTERVAL = float(os.environ.get("MATCHER_RELOAD_INTERVAL", 30))  # seconds, 0 to not watch the store
+MATCHER_SHARED_MATRIX = os.environ.get("MATCHER_SHARED_MATRIX", "0") == "1"  # 1 to mmap it, shared by the workers
+
+# local encoder server shared by the processes, e.g. the API workers
+ENCODER_SOCKET = os.environ.get("ENCODER_SOCKET", "")  # Unix socket of `core.encoder_service`, empty to encode inline
+ENCODER_MAX_BATCH = int(os.environ.get("ENCODER_MAX_BATCH", 128))  # sentences of concurrent requests encoded at once
+ENCODER_MAX_WAIT_MS = float(os.environ.get("ENCODER_MAX_WAIT_MS", 5))  # a request waits this long for others
+ENCODER_THREADS = int(os.environ.get("ENCODER_THREADS", 0))  # torch threads of the server, 0 for the default
+
+# live (non-celebrity) users of the API
+LIVE_MAX_CONCURRENCY = int(os.environ.get("LIVE_MAX_CONCURRENCY", 2))  # users embedded at once, more get a 429
+LIVE_SCRAPE_WORKERS = int(os.environ.get("LIVE_SCRAPE_WORKERS", 4))  # scraping threads
+LIVE_ENCODE_WORKERS = int(os.environ.get("LIVE_ENCODE_WORKERS", 1))  # encoding processes, 0 to encode in a thread
+LIVE_TIMEOUT = float(os.environ.get("LIVE_TIMEOUT", 120))  # seconds to scrape and embed a user, then a 503
+
+# embedding cache of scraped non-celebrity users
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH", "user-embedding-cache.sqlite3")  # SQLite file, empty to disable
+EMBED_CACHE_TTL = float(os.environ.get("EMBED_CACHE_TTL", 7 * 24 * 3600))  # seconds an embedding stays valid
+EMBED_CACHE_MAX_ENTRIES = int(os.environ.get("EMBED_CACHE_MAX_ENTRIES", 10000))  # least recently used evicted beyond
+
+# bulk timeline scraping
+TWITTER_API_BASE_URL = os.environ.get("TWITTER_API_BASE_URL", "https://api.twitter.com/1.1")  # e.g. a fake server
+SCRAPE_WORKERS = int(os.environ.get("SCRAPE_WORKERS", 4))  # users scraped concurrently
+SCRAPE_MAX_RETRIES = int(os.environ.get("SCRAPE_MAX_RETRIES", 5))  # retries of a failed request, with backoff
+TWEET_FORMAT = os.environ.get("TWEET_FORMAT", "parquet")  # `parquet` archive partitioned by user, or `csv` files
+
+# streaming scrape-to-embed pipeline
+# the data folder by default - `load_data` reads the archive there, a user's partition supersedes its csv file
+STREAM_ARCHIVE_PATH = os.environ.get("STREAM_ARCHIVE_PATH", DATA_PATH)  # Parquet archive folder, empty to disable
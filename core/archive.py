@@ -0,0 +1,154 @@
+"""
+## Twitter Celebrity Matcher
+
+This app is a tool to match celebrities from Twitter with their respective tweets.
+
+Columnar tweet archive - the scraped tweets as one Parquet dataset (zstd) partitioned by user,
+`<folder>/username=<user>/part-0.parquet`, with an int64 `twitter_id`, a UTC timestamp `date` and
+the `tweet` as UTF-8 text instead of the csv files' `b'...'` reprs.
+
+Convert the csv files of a data folder: `python -m core.archive <data folder> [--archive-path <folder>]`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import io
+import logging
+import os
+import re
+import time
+from typing import Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from core.preprocessing import decode_bytes_literal
+
+ARCHIVE_SCHEMA = pa.schema([('twitter_id', pa.int64()),
+                            ('date', pa.timestamp('ms', tz='UTC')),
+                            ('tweet', pa.string())])
+ARCHIVE_COMPRESSION = 'zstd'
+PARTITION_PATTERN = re.compile(r'^username=(.+)$')
+
+
+def partition_file_path(archive_path: Union[str, os.PathLike[str]], username: str) -> str:
+    """
+    Archive file of a user
+    :param archive_path: archive folder
+    :param username:
+    :return: file path
+    """
+    return os.path.join(archive_path, f"username={username}", "part-0.parquet")
+
+
+def partition_username(file_path: Union[str, os.PathLike[str]]) -> Optional[str]:
+    """
+    User of an archive file, from its partition folder
+    :param file_path:
+    :return: username, None if the file is not in a partition folder
+    """
+    match = PARTITION_PATTERN.match(os.path.basename(os.path.dirname(file_path)))
+    return match.group(1) if match else None
+
+
+def archive_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Convert tweets to the archive schema
+    :param df: (twitter_id, date, tweet) dataframe, tweets as bytes, `b'...'` reprs or text
+    :return: table
+    """
+    return pa.Table.from_pandas(pd.DataFrame({
+        'twitter_id': df['twitter_id'].astype('int64'),
+        'date': pd.to_datetime(df['date'], utc=True).dt.floor('s'),
+        'tweet': [decode_bytes_literal(tweet) for tweet in df['tweet']],
+    }), schema=ARCHIVE_SCHEMA, preserve_index=False)
+
+
+def read_archive(file_path: Union[str, os.PathLike[str]], columns: Optional[list] = None) -> pd.DataFrame:
+    """
+    Read the tweets of a user
+    :param file_path: archive file
+    :param columns: columns to read, all by default
+    :return: dataframe
+    """
+    return pq.read_table(file_path, columns=columns).to_pandas()
+
+
+def write_archive(file_path: Union[str, os.PathLike[str]], table: pa.Table) -> None:
+    """
+    Write the tweets of a user, atomically
+    :param file_path: archive file
+    :param table: tweets in the archive schema
+    :return:
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    pq.write_table(table, f"{file_path}.tmp", compression=ARCHIVE_COMPRESSION)
+    os.replace(f"{file_path}.tmp", file_path)
+
+
+def migrate_file(csv_path: Union[str, os.PathLike[str]], file_path: Union[str, os.PathLike[str]],
+                 size: Optional[int] = None) -> int:
+    """
+    Convert the tweet csv file of a user to its archive file
+    :param csv_path:
+    :param file_path: archive file
+    :param size: only convert the first bytes of the csv file, e.g. up to its scraping checkpoint
+    :return: number of tweets
+    :raise ValueError: if the archive file does not hold every tweet
+    """
+    with open(csv_path, 'rb') as f:
+        csv = io.BytesIO(f.read() if size is None else f.read(size))
+    table = archive_table(pd.read_csv(csv, dtype={'twitter_id': 'int64'}))
+    write_archive(file_path, table)
+    if pq.read_metadata(file_path).num_rows != table.num_rows:
+        raise ValueError("row count mismatch")
+    return table.num_rows
+
+
+def migrate(data_path: Union[str, os.PathLike[str]], archive_path: Union[str, os.PathLike[str]],
+            remove_csv: bool = False) -> dict:
+    """
+    Convert the tweet csv files of a data folder to the archive
+    :param data_path: folder of the `<user>.csv` files
+    :param archive_path: archive folder, can be the data folder
+    :param remove_csv: remove every converted csv file
+    :return: summary - users, failed users, csv bytes, archive bytes, seconds
+    """
+    start = time.perf_counter()
+    summary: dict = {'users': 0, 'failed': [], 'csv_bytes': 0, 'archive_bytes': 0}
+    for file in sorted(os.listdir(data_path)):
+        if not file.endswith('.csv'):
+            continue
+        username, csv_path = file[:-len('.csv')], os.path.join(data_path, file)
+        file_path = partition_file_path(archive_path, username)
+        try:
+            migrate_file(csv_path, file_path)
+        except Exception as e:
+            logging.error(f"{username}: {e}")
+            summary['failed'].append(username)
+            continue
+        summary['users'] += 1
+        summary['csv_bytes'] += os.path.getsize(csv_path)
+        summary['archive_bytes'] += os.path.getsize(file_path)
+        if remove_csv:
+            os.remove(csv_path)
+    summary['seconds'] = round(time.perf_counter() - start, 2)
+    logging.info(f"Migration done: {summary}")
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert the tweet csv files to the Parquet archive")
+    parser.add_argument('data_path', help="folder of the tweet csv files")
+    parser.add_argument('--archive-path', help="archive folder, the data folder by default")
+    parser.add_argument('--remove-csv', action='store_true', help="remove the converted csv files")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    migrate(args.data_path, args.archive_path or args.data_path, remove_csv=args.remove_csv)
+
+
+if __name__ == '__main__':
+    main()
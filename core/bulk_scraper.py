@@ -0,0 +1,564 @@
+"""
+## Twitter Celebrity Matcher
+
+This app is a tool to match celebrities from Twitter with their respective tweets.
+
+Bulk timeline scraper - several users are scraped concurrently, the requests share a token bucket
+refilled from the API's rate limit headers, and failed requests are retried with exponential backoff.
+The API base url is configurable, e.g. to measure the throughput against a local fake timeline server.
+
+The tweet files (the Parquet archive or csv files) are written page by page next to a checkpoint of each
+user (newest and oldest tweet ids), so an interrupted run resumes where it stopped and a later run only
+fetches the new tweets (`since_id`).
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Iterator, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+
+from core.archive import archive_table, migrate_file, partition_file_path, read_archive, write_archive
+
+TWITTER_API_BASE_URL = 'https://api.twitter.com/1.1'
+# timeline tweets per request, the API maximum
+PAGE_SIZE = 200
+TWEET_COLUMNS = ['twitter_id', 'date', 'tweet']
+
+
+def tweets_frame(tweets: list) -> pd.DataFrame:
+    """
+    Build the tweet dataframe of a user from the API's tweets
+    :param tweets: tweets as json dicts
+    :return: DataFrame of the tweets, same columns as `TwitterScraper.scrape_tweets`
+    """
+    out_tweets = [[tweet['id_str'], datetime.strptime(tweet['created_at'], '%a %b %d %H:%M:%S %z %Y'),
+                   tweet['full_text'].encode("utf-8")] for tweet in tweets]
+    return pd.DataFrame(out_tweets, columns=TWEET_COLUMNS)
+
+
+class TokenBucket:
+    def __init__(self, limit: int = 900, window: float = 900) -> None:
+        """
+        Request tokens shared by the scraping threads. The bucket holds the requests left in the current
+        rate limit window and is refilled when the window resets. The API's rate limit headers correct
+        both the tokens and the reset time after every response.
+        :param limit: requests per window until the API reports its own limit
+        :param window: window seconds until the API reports the reset time
+        """
+        self.limit = limit
+        self.window = window
+        self.tokens = limit
+        self.reset_at = time.time() + window
+        self.waited = 0.0  # seconds spent waiting for resets, summed over the threads
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """
+        Take a token, waiting for the window reset if there is none left
+        :return:
+        """
+        with self._condition:
+            while True:
+                now = time.time()
+                if now >= self.reset_at:
+                    self.tokens = self.limit
+                    self.reset_at = now + self.window
+                if self.tokens > 0:
+                    self.tokens -= 1
+                    return
+                delay = self.reset_at - now
+                logging.info(f"Rate limit reached, waiting {delay:.1f}s for the window reset")
+                self._condition.wait(delay)
+                self.waited += time.time() - now
+
+    def update(self, headers: dict) -> None:
+        """
+        Correct the bucket from the `x-rate-limit-*` response headers
+        :param headers:
+        :return:
+        """
+        try:
+            limit = int(headers['x-rate-limit-limit'])
+            remaining = int(headers['x-rate-limit-remaining'])
+            reset_at = float(headers['x-rate-limit-reset'])
+        except (KeyError, ValueError):
+            return
+        with self._condition:
+            self.limit = limit
+            if reset_at > self.reset_at + 1:
+                # a new window, requests still in flight were counted by the API already
+                self.tokens = remaining
+            else:
+                self.tokens = min(self.tokens, remaining)
+            self.reset_at = reset_at
+            self._condition.notify_all()
+
+    def exhaust(self, reset_at: Optional[float] = None) -> None:
+        """
+        Empty the bucket after a `429 Too Many Requests`
+        :param reset_at: epoch seconds of the window reset, if the response had it
+        :return:
+        """
+        with self._condition:
+            self.tokens = 0
+            now = time.time()
+            if reset_at and reset_at > now:
+                self.reset_at = reset_at
+            elif self.reset_at <= now:
+                # no reset time, or one already past - wait a whole window instead of refilling at once
+                self.reset_at = now + self.window
+
+
+class TimelineClient:
+    def __init__(self, auth: Optional[requests.auth.AuthBase] = None, base_url: str = TWITTER_API_BASE_URL,
+                 bucket: Optional[TokenBucket] = None, max_retries: int = 5, backoff: float = 1.0,
+                 timeout: float = 30, max_rate_limited: int = 10) -> None:
+        """
+        `statuses/user_timeline` client
+        :param auth: request signing, e.g. `tweepy.OAuth1UserHandler(...).apply_auth()`
+        :param base_url: API base url
+        :param bucket: shared rate limit token bucket
+        :param max_retries: retries of a request on connection errors and 5xx responses
+        :param backoff: first retry delay in seconds, doubled on every retry
+        :param timeout: request timeout in seconds
+        :param max_rate_limited: consecutive `429` responses to a request before giving up on it
+        """
+        self.auth = auth
+        self.base_url = base_url.rstrip('/')
+        self.bucket = bucket or TokenBucket()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_rate_limited = max_rate_limited
+        self.requests = 0
+        self.rate_limited = 0
+        self._counter_lock = threading.Lock()
+        # a session (connection pool) per thread
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        if (session := getattr(self._local, 'session', None)) is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def get_page(self, screen_name: str, max_id: Optional[int] = None, since_id: Optional[int] = None) -> list:
+        """
+        Get a page of a user's timeline
+        :param screen_name:
+        :param max_id: only tweets with an id lower than or equal to it
+        :param since_id: only tweets with an id greater than it
+        :return: tweets as json dicts, newest first
+        :raise requests.HTTPError: on client errors (e.g. protected or suspended user), once out of retries and
+            after `max_rate_limited` consecutive `429`s
+        """
+        params = {'screen_name': screen_name, 'count': PAGE_SIZE, 'tweet_mode': 'extended'}
+        if max_id is not None:
+            params['max_id'] = max_id
+        if since_id is not None:
+            params['since_id'] = since_id
+        retries = rate_limited = 0
+        while True:
+            self.bucket.acquire()
+            with self._counter_lock:
+                self.requests += 1
+            try:
+                response = self.session.get(f"{self.base_url}/statuses/user_timeline.json", params=params,
+                                            auth=self.auth, timeout=self.timeout)
+            except requests.RequestException as e:
+                response, error = None, e
+            else:
+                self.bucket.update(response.headers)
+                if response.status_code == 429:
+                    # wait for the window reset, not counted as a retry
+                    with self._counter_lock:
+                        self.rate_limited += 1
+                    rate_limited += 1
+                    if rate_limited >= self.max_rate_limited:
+                        raise requests.HTTPError(f"429 Too Many Requests, {rate_limited} times in a row",
+                                                 response=response)
+                    self.bucket.exhaust(float(response.headers.get('x-rate-limit-reset', 0)) or None)
+                    continue
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    return response.json()
+                error = requests.HTTPError(f"{response.status_code} Server Error", response=response)
+            if retries >= self.max_retries:
+                raise error
+            # exponential backoff with jitter
+            delay = self.backoff * 2 ** retries * (0.5 + random.random())
+            retries += 1
+            logging.warning(f"{screen_name}: {error}, retry {retries}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def user_timeline(self, screen_name: str) -> pd.DataFrame:
+        """
+        Get all the tweets the API returns for a user (up to ~3200), page by page
+        :param screen_name:
+        :return: DataFrame of the tweets, same columns as `TwitterScraper.scrape_tweets`
+        :raise LookupError: if the user has no tweets
+        """
+        alltweets: list = []
+        for new_tweets in self.pages(screen_name):
+            alltweets.extend(new_tweets)
+        if not alltweets:
+            raise LookupError(f"No tweets found for {screen_name}")
+        return tweets_frame(alltweets)
+
+    def new_tweets(self, screen_name: str, since_id: int) -> list:
+        """
+        Get the tweets of a user newer than a tweet, page by page
+        :param screen_name:
+        :param since_id: newest tweet id already scraped
+        :return: tweets as json dicts, newest first
+        """
+        return [tweet for new_tweets in self.pages(screen_name, since_id=since_id) for tweet in new_tweets]
+
+    def pages(self, screen_name: str, max_id: Optional[int] = None, since_id: Optional[int] = None) -> Iterator[list]:
+        """
+        Page through a user's timeline, from the newest tweet backwards, as the pages arrive
+        :param screen_name:
+        :param max_id: only tweets with an id lower than or equal to it
+        :param since_id: only tweets with an id greater than it
+        :return: non-empty pages of tweets as json dicts, newest first
+        """
+        while new_tweets := self.get_page(screen_name, max_id=max_id, since_id=since_id):
+            yield new_tweets
+            max_id = new_tweets[-1]['id'] - 1
+
+
+class CsvTweetFile:
+    def __init__(self, folder: Union[str, os.PathLike[str]], screen_name: str) -> None:
+        """
+        Tweets of a user as a csv file, `<folder>/<user>.csv`, the tweets as `b'...'` reprs.
+        Its size is counted in bytes.
+        :param folder:
+        :param screen_name:
+        """
+        self.path = os.path.join(folder, "%s.csv" % screen_name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def ids(self) -> pd.Series:
+        return pd.read_csv(self.path, usecols=['twitter_id'], dtype={'twitter_id': 'int64'}).twitter_id
+
+    def truncate(self, size: int) -> None:
+        with open(self.path, 'r+b') as f:
+            f.truncate(size)
+
+    def append(self, tweets: list, size: int) -> int:
+        """
+        Append a page of tweets, the file is created (with its header) if `size` is 0
+        :param tweets: tweets as json dicts
+        :param size: current size
+        :return: new size
+        """
+        tweets_frame(tweets).to_csv(self.path, mode='a' if size else 'w', header=not size, index=False)
+        return self.size()
+
+    def write(self, df: pd.DataFrame) -> None:
+        df.to_csv(self.path, index=False)
+
+
+class ParquetTweetFile:
+    def __init__(self, folder: Union[str, os.PathLike[str]], screen_name: str) -> None:
+        """
+        Tweets of a user in the Parquet archive, `<folder>/username=<user>/part-0.parquet`.
+        Its size is counted in rows, pages are appended by rewriting the (small) file atomically.
+        :param folder:
+        :param screen_name:
+        """
+        self.path = partition_file_path(folder, screen_name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def size(self) -> int:
+        return pq.read_metadata(self.path).num_rows
+
+    def ids(self) -> pd.Series:
+        return read_archive(self.path, columns=['twitter_id']).twitter_id
+
+    def truncate(self, size: int) -> None:
+        write_archive(self.path, pq.read_table(self.path).slice(0, size))
+
+    def append(self, tweets: list, size: int) -> int:
+        """
+        Append a page of tweets, the file is created if `size` is 0
+        :param tweets: tweets as json dicts
+        :param size: current size
+        :return: new size
+        """
+        table = archive_table(tweets_frame(tweets))
+        if size:
+            table = pa.concat_tables([pq.read_table(self.path), table])
+        write_archive(self.path, table)
+        return table.num_rows
+
+    def write(self, df: pd.DataFrame) -> None:
+        write_archive(self.path, archive_table(df))
+
+
+TWEET_FILE_FORMATS = {'csv': CsvTweetFile, 'parquet': ParquetTweetFile}
+
+
+class ScrapeCheckpoint:
+    def __init__(self, newest_id: Optional[int] = None, oldest_id: Optional[int] = None, complete: bool = False,
+                 size: int = 0, tweets: int = 0) -> None:
+        """
+        Scraping progress of a user, saved after every page written to the user's tweet file
+        :param newest_id: newest tweet id in the file, the `since_id` of the next refresh
+        :param oldest_id: oldest tweet id in the file, an interrupted scrape resumes below it
+        :param complete: the timeline was scraped back to the oldest tweet the API returns
+        :param size: file size (csv bytes, archive rows) after the last saved page, anything after it was not
+            checkpointed
+        :param tweets: tweets in the file
+        """
+        self.newest_id = newest_id
+        self.oldest_id = oldest_id
+        self.complete = complete
+        self.size = size
+        self.tweets = tweets
+
+    @classmethod
+    def load(cls, checkpoint_path: Union[str, os.PathLike[str]]) -> Optional['ScrapeCheckpoint']:
+        """
+        Load a checkpoint
+        :param checkpoint_path:
+        :return: checkpoint, None if it does not exist or can not be read
+        """
+        try:
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            return cls(checkpoint['newest_id'], checkpoint['oldest_id'], checkpoint['complete'],
+                       checkpoint['size'], checkpoint['tweets'])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable checkpoint {checkpoint_path}: {e}")
+            return None
+
+    @classmethod
+    def from_file(cls, tweet_file: Union[CsvTweetFile, ParquetTweetFile]) -> Optional['ScrapeCheckpoint']:
+        """
+        Checkpoint of a tweet file scraped in one go (or migrated), without a checkpoint
+        :param tweet_file:
+        :return: complete checkpoint, None if the file does not exist or has no tweets
+        """
+        try:
+            ids = tweet_file.ids()
+        except FileNotFoundError:
+            return None
+        except (ValueError, pd.errors.ParserError, pa.ArrowException) as e:
+            logging.warning(f"Ignoring unreadable tweets {tweet_file.path}: {e}")
+            return None
+        if ids.empty:
+            return None
+        return cls(int(ids.max()), int(ids.min()), True, tweet_file.size(), len(ids))
+
+    def save(self, checkpoint_path: Union[str, os.PathLike[str]]) -> None:
+        """
+        Save the checkpoint, atomically
+        :param checkpoint_path:
+        :return:
+        """
+        with open(f"{checkpoint_path}.tmp", 'w') as f:
+            json.dump({'newest_id': self.newest_id, 'oldest_id': self.oldest_id, 'complete': self.complete,
+                       'size': self.size, 'tweets': self.tweets}, f)
+        os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+
+class BulkScraper:
+    def __init__(self, client: TimelineClient, file_path: Union[str, os.PathLike[str]], workers: int = 4,
+                 incremental: bool = True, file_format: str = 'parquet') -> None:
+        """
+        :param client: timeline client shared by the workers
+        :param file_path: folder of the tweet files
+        :param workers: users scraped concurrently
+        :param incremental: checkpoint the users and only scrape their missing tweets (`update_tweets`),
+            otherwise scrape the full timelines again (`save_tweets`)
+        :param file_format: `parquet` (the archive, see `core.archive`) or `csv` (one file per user)
+        """
+        if file_format not in TWEET_FILE_FORMATS:
+            raise ValueError(f"Unknown tweet file format {file_format!r}, expected one of {list(TWEET_FILE_FORMATS)}")
+        self.client = client
+        self.file_path = os.path.join(os.getcwd(), file_path)
+        self.workers = workers
+        self.incremental = incremental
+        self.file_format = file_format
+
+    def tweet_file(self, screen_name: str) -> Union[CsvTweetFile, ParquetTweetFile]:
+        return TWEET_FILE_FORMATS[self.file_format](self.file_path, screen_name)
+
+    def checkpoint_path(self, screen_name: str) -> str:
+        return os.path.join(self.file_path, '.checkpoints', "%s.json" % screen_name)
+
+    def checkpoint(self, screen_name: str) -> Optional[ScrapeCheckpoint]:
+        """
+        Get the checkpoint of a user, a tweet file scraped without checkpoint counts as complete
+        :param screen_name:
+        :return: checkpoint, None if the user was never scraped or its tweet file is gone
+        """
+        tweet_file = self.tweet_file(screen_name)
+        if not tweet_file.exists() and self.file_format == 'parquet':
+            self.migrate_csv(screen_name)
+        if not tweet_file.exists():
+            return None
+        checkpoint = ScrapeCheckpoint.load(self.checkpoint_path(screen_name))
+        if checkpoint is None:
+            return ScrapeCheckpoint.from_file(tweet_file)
+        if tweet_file.size() < checkpoint.size:
+            logging.warning(f"{screen_name}: tweet file shorter than its checkpoint, scraping it again")
+            return None
+        return checkpoint
+
+    def migrate_csv(self, screen_name: str) -> None:
+        """
+        Convert the csv file of a user scraped before the archive into its archive partition, with its checkpoint
+        counted in rows instead of bytes - the user is resumed or refreshed instead of scraped again.
+        The csv file is kept, the partition supersedes it in `load_data`.
+        :param screen_name:
+        :return:
+        """
+        csv_file = CsvTweetFile(self.file_path, screen_name)
+        if not csv_file.exists():
+            return
+        checkpoint = ScrapeCheckpoint.load(self.checkpoint_path(screen_name))
+        if checkpoint is not None and csv_file.size() < checkpoint.size:
+            logging.warning(f"{screen_name}: csv file shorter than its checkpoint, scraping it again")
+            return
+        try:
+            # the rows written after the checkpoint are left out, they are scraped again
+            rows = migrate_file(csv_file.path, partition_file_path(self.file_path, screen_name),
+                                checkpoint.size if checkpoint is not None else None)
+        except (ValueError, pa.ArrowException) as e:
+            logging.warning(f"{screen_name}: csv file not converted, scraping it again: {e}")
+            return
+        if checkpoint is not None:
+            checkpoint.size = rows
+            checkpoint.save(self.checkpoint_path(screen_name))
+        logging.info(f"{screen_name}: {rows} tweets of {csv_file.path} converted to the archive")
+
+    def pending(self, screen_names: list) -> list:
+        """
+        Users never scraped or whose scraping was interrupted
+        :param screen_names:
+        :return: screen names
+        """
+        return [screen_name for screen_name in screen_names
+                if (checkpoint := self.checkpoint(screen_name)) is None or not checkpoint.complete]
+
+    def save_tweets(self, screen_name: str) -> int:
+        """
+        Scrape the tweets of a user and save them to its tweet file
+        :param screen_name:
+        :return: number of tweets
+        """
+        df = self.client.user_timeline(screen_name)
+        self.tweet_file(screen_name).write(df)
+        return len(df)
+
+    def update_tweets(self, screen_name: str) -> int:
+        """
+        Scrape the tweets of a user missing from its tweet file. A new user is scraped from the newest tweet
+        backwards, page by page, appending every page to the file and then saving the checkpoint.
+        An interrupted user resumes below its oldest tweet, after dropping the rows written past its last
+        checkpoint. A complete user only gets the tweets newer than its newest one (`since_id`), appended
+        at the end of the file - the rows are not kept in date order.
+        :param screen_name:
+        :return: number of new tweets
+        :raise LookupError: if a new user has no tweets
+        """
+        tweet_file, checkpoint_path = self.tweet_file(screen_name), self.checkpoint_path(screen_name)
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+        checkpoint = self.checkpoint(screen_name)
+        scraped_before = checkpoint is not None
+        if checkpoint is None:
+            checkpoint = ScrapeCheckpoint()
+        elif tweet_file.size() > checkpoint.size:
+            # rows written after the last checkpoint, scraped again
+            tweet_file.truncate(checkpoint.size)
+        count = 0
+
+        def append(tweets: list, newest_id: int, oldest_id: int) -> None:
+            if not checkpoint.size:
+                # before the file exists, else a torn first page would pass for a complete file. Without the ids
+                # of the page, a resume scrapes the user again from its newest tweet.
+                checkpoint.save(checkpoint_path)
+            checkpoint.size = tweet_file.append(tweets, checkpoint.size)
+            # the ids of a page are only checkpointed once it is written
+            checkpoint.newest_id, checkpoint.oldest_id = newest_id, oldest_id
+            checkpoint.tweets += len(tweets)
+            checkpoint.save(checkpoint_path)
+
+        while not checkpoint.complete:
+            max_id = checkpoint.oldest_id - 1 if checkpoint.oldest_id is not None else None
+            new_tweets = self.client.get_page(screen_name, max_id=max_id)
+            if not new_tweets:
+                if checkpoint.newest_id is None:
+                    raise LookupError(f"No tweets found for {screen_name}")
+                checkpoint.complete = True
+                checkpoint.save(checkpoint_path)
+                break
+            append(new_tweets, checkpoint.newest_id or new_tweets[0]['id'], new_tweets[-1]['id'])
+            count += len(new_tweets)
+        if scraped_before:
+            # written at once, an interrupted refresh is fetched again from the same `since_id`
+            if new_tweets := self.client.new_tweets(screen_name, since_id=checkpoint.newest_id):
+                append(new_tweets, new_tweets[0]['id'], checkpoint.oldest_id)
+                count += len(new_tweets)
+        return count
+
+    def scrape_users(self, screen_names: list, save: Optional[Callable[[str], int]] = None) -> dict:
+        """
+        Scrape the users concurrently
+        :param screen_names:
+        :param save: scrapes and saves a user, returns the number of tweets,
+            defaults to `update_tweets` if incremental, `save_tweets` otherwise
+        :return: summary - users, failed users, tweets, requests, rate limited responses, seconds, users per hour
+        """
+        save = save or (self.update_tweets if self.incremental else self.save_tweets)
+        if not os.path.exists(self.file_path):
+            os.mkdir(self.file_path)
+        start = time.perf_counter()
+        failed: list = []
+        tweets = 0
+
+        def scrape(screen_name: str) -> Optional[int]:
+            try:
+                return save(screen_name)
+            except Exception as e:
+                logging.error(f"{screen_name}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scraper') as executor:
+            for c, (screen_name, count) in enumerate(zip(screen_names, executor.map(scrape, screen_names)), 1):
+                if count is None:
+                    failed.append(screen_name)
+                else:
+                    tweets += count
+                    logging.info(f"#{c} {screen_name} {count} tweets scraped")
+        seconds = time.perf_counter() - start
+        summary = {'users': len(screen_names) - len(failed), 'failed': failed, 'tweets': tweets,
+                   'requests': self.client.requests, 'rate_limited': self.client.rate_limited,
+                   'rate_limit_wait_seconds': round(self.client.bucket.waited, 2), 'seconds': round(seconds, 2),
+                   'users_per_hour': round((len(screen_names) - len(failed)) * 3600 / seconds, 1) if seconds else None}
+        logging.info(f"Scraping done: {summary}")
+        return summary
@@ -0,0 +1,131 @@
+"""
+## Twitter Celebrity Matcher
+
+This app is a tool to match celebrities from Twitter with their respective tweets.
+
+Persistent cache of the embeddings of scraped (non-celebrity) users - a SQLite table keyed by
+(username, model, preprocessing version), with a time-to-live and least recently used eviction.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+
+class EmbeddingCache:
+    def __init__(self, db_path: str, model: str, preprocessing_version: int, ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 10000) -> None:
+        """
+        Open (or create) the cache
+        :param db_path: SQLite database file
+        :param model: model identity, embeddings of other models are not returned
+        :param preprocessing_version: embeddings of other preprocessing versions are not returned
+        :param ttl: seconds an embedding stays valid after it was stored
+        :param max_entries: the least recently used embeddings are evicted beyond it
+        """
+        self.db_path = db_path
+        self.model = model
+        self.preprocessing_version = preprocessing_version
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # one connection shared by the threads of the process, one statement at a time
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        with self._lock:
+            # readers don't block the writer of another process
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS user_embeddings (
+                                            username TEXT NOT NULL,
+                                            model TEXT NOT NULL,
+                                            preprocessing_version INTEGER NOT NULL,
+                                            embedding BLOB NOT NULL,
+                                            created_at REAL NOT NULL,
+                                            accessed_at REAL NOT NULL,
+                                            PRIMARY KEY (username, model, preprocessing_version))""")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS user_embeddings_accessed_at "
+                                     "ON user_embeddings (accessed_at)")
+
+    def _key(self, username: str) -> tuple:
+        # lower() to bypass case issue, Twitter usernames are case-insensitive
+        return username.lower(), self.model, self.preprocessing_version
+
+    def get(self, username: str) -> Optional[npt.NDArray]:
+        """
+        Get the embedding of a user
+        :param username: Twitter username
+        :return: float32 embedding, None if it is not cached or expired
+        """
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._connection.execute(
+                    "SELECT embedding FROM user_embeddings WHERE username = ? AND model = ? "
+                    "AND preprocessing_version = ? AND created_at >= ?", (*self._key(username), now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        "UPDATE user_embeddings SET accessed_at = ? WHERE username = ? AND model = ? "
+                        "AND preprocessing_version = ?", (now, *self._key(username)))
+        except sqlite3.Error as e:
+            logging.error(e)
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.frombuffer(row[0], dtype=np.float32).copy()
+
+    def put(self, username: str, embedding: npt.ArrayLike) -> None:
+        """
+        Store the embedding of a user, then evict the expired and the least recently used embeddings
+        :param username: Twitter username
+        :param embedding:
+        :return:
+        """
+        now = time.time()
+        blob = np.ascontiguousarray(embedding, dtype=np.float32).tobytes()
+        try:
+            with self._lock:
+                self._connection.execute("BEGIN IMMEDIATE")
+                try:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO user_embeddings VALUES (?, ?, ?, ?, ?, ?)",
+                        (*self._key(username), blob, now, now))
+                    self._connection.execute("DELETE FROM user_embeddings WHERE created_at < ?", (now - self.ttl,))
+                    self._connection.execute(
+                        "DELETE FROM user_embeddings WHERE rowid IN (SELECT rowid FROM user_embeddings "
+                        "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+                    self._connection.execute("COMMIT")
+                except sqlite3.Error:
+                    self._connection.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            logging.error(e)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM user_embeddings").fetchone()[0]
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters of this process and the number of cached embeddings
+        :return:
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'entries': len(self), 'max_entries': self.max_entries, 'ttl_seconds': self.ttl}
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -8,31 +8,95 @@ Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
 """
 
 import ast
-import json
 import logging
 import os
-import pdb
 import re
 import sys
-from operator import itemgetter
-from pathlib import Path
-from typing import Optional, Union
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, Optional, Union
 
-import demoji
+import numpy as np
 import numpy.typing as npt
 import pandas as pd
-import torch
-from sentence_transformers import SentenceTransformer
+
+from core.archive import partition_username, read_archive
+from core.manifest import EmbeddingManifest, model_identity
+from core.metrics import traced
+from core.models import load_emoticons, load_preprocessor, model_registry, resolve_model_name
+from core.preprocessing import PREPROCESSING_VERSION, TweetPreprocessor, clean_text, decode_bytes_literal
+from core.store import EmbeddingStore, embeddings_frame, read_embeddings_csv
+
+# preprocessor of a worker process in the parallel build, see `TwitterDataPrep.prepared_users`
+_worker_preprocessor: Optional[TweetPreprocessor] = None
+
+
+def init_preprocess_worker(emoticons_dict: dict) -> None:
+    """
+    Compile the preprocessor once per worker process
+    :param emoticons_dict:
+    :return:
+    """
+    global _worker_preprocessor
+    _worker_preprocessor = TweetPreprocessor(emoticons_dict)
+
+
+def read_preprocess(file_path: str, preprocessor: Optional[TweetPreprocessor] = None) -> tuple:
+    """
+    Read and preprocess the tweets of a user
+    :param file_path: user tweets csv or archive file
+    :param preprocessor: defaults to the worker process preprocessor
+    :return: (dataframe of the cleaned tweets, read seconds, preprocess seconds)
+    """
+    start = time.perf_counter()
+    # the archive holds the tweets as text, the csv files as `b'...'` reprs
+    archived = file_path.endswith('.parquet')
+    df = read_archive(file_path, columns=['tweet']) if archived else pd.read_csv(file_path, usecols=['tweet'])
+    read_time = time.perf_counter() - start
+    df['tweet'] = (preprocessor or _worker_preprocessor).preprocess(df['tweet'], decoded=archived)
+    return df, read_time, time.perf_counter() - start - read_time
+
+
+class RunningMean:
+    def __init__(self, dimension: int) -> None:
+        """
+        Mean of the embeddings of a user, accumulated batch by batch
+        :param dimension: embedding dimension
+        """
+        self.sum = np.zeros(dimension, dtype=np.float64)
+        self.count = 0
+
+    def add(self, vectors: npt.NDArray) -> None:
+        """
+        Add a batch of embeddings
+        :param vectors: (n, dimension) matrix
+        :return:
+        """
+        if len(vectors):
+            self.sum += vectors.sum(axis=0, dtype=np.float64)
+            self.count += len(vectors)
+
+    @property
+    def mean(self) -> npt.NDArray:
+        """
+        :return: float32 mean embedding
+        :raise ValueError: if no embedding was added
+        """
+        if not self.count:
+            raise ValueError("No embeddings to average")
+        return (self.sum / self.count).astype(np.float32)
 
 
 class TwitterDataPrep:
     def __init__(self, model_path: str, data_path: Union[str, os.PathLike[str]] = None,
-                 embed_data_path: Union[str, os.PathLike[str]] = None) -> None:
+                 embed_data_path: Union[str, os.PathLike[str]] = None, encoder=None) -> None:
         """
         Initialize the class.
         :param data_path:
         :param model_path:
         :param embed_data_path:
+        :param encoder: encoder used instead of loading the model, e.g. an `EncoderClient` of the encoder server
         """
         self.model_path = model_path
         self.data_path = data_path
@@ -42,25 +106,13 @@ class TwitterDataPrep:
         if not os.path.exists(os.path.join(os.getcwd(), self.model_path)):
             os.mkdir(os.path.join(os.getcwd(), self.model_path))
 
-        # download and save the model
-        # https://huggingface.co/sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2
-        # model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-        # model.save(model_path)
-        # print(f'Model saved to {model_path}')
-        if model_path and len(os.listdir(model_path)) != 0:
-            self.model = SentenceTransformer(model_path)
-        else:
-            self.model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-            # self.model.save(model_path)
-            # print(f'Model saved to {model_path}')
-        if torch.cuda.is_available():
-            self.model = self.model.to(torch.device("cuda"))
-
+        # the model, emoticon dictionary and preprocessor are loaded once per process and shared
+        self.model_name = resolve_model_name(model_path) if encoder is None else encoder.model_name
+        self.model = model_registry.get(self.model_name) if encoder is None else encoder
         # self.model = SentenceTransformer(model_path, device='cuda')  # remove cuda if not available
-        emoticon_data_folder = Path("utilities/")
-        emoticon_file_path = emoticon_data_folder / "emoticon_dict.json"
-        with open(emoticon_file_path) as f:
-            self.emoticons_dict = json.load(f)
+        self.emoticons_dict = load_emoticons()
+        # emoticon and emoji matchers compiled once for the batch preprocessing
+        self.preprocessor = load_preprocessor()
 
     def clean_text(self, text: str) -> str:
         """
@@ -68,25 +120,7 @@ class TwitterDataPrep:
         :param text:
         :return: text
         """
-        pat1 = r'@[^ ]+'  # remove username @
-        pat2 = r'https?://[A-Za-z0-9./]+'  # remove urls
-        # pat3 = r'\'s'  # remove apostrophe
-        pat4 = r'\#\w+'  # remove hashtag
-        pat5 = r'&amp '  # remove unicode `&`
-        # pat6 = r"[\n\t]*" # r'[^A-Za-z\s]'
-        pat7 = r'RT'  # remove RT / retweet
-        pat8 = r'www\S+'  # remove link www
-        combined_pat = r'|'.join((pat1,
-                                  pat2,
-                                  # pat3,
-                                  pat4,
-                                  pat5,
-                                  # pat6,
-                                  pat7,
-                                  pat8))  # combine all patterns
-        text = re.sub(combined_pat, "", text)  # .lower()
-        text = re.sub(r'\s+', ' ', text)  # remove extra spaces
-        return text.strip()
+        return clean_text(text)
 
     def _parse_bytes(self, field: Union[str, ast.AST]) -> Union[str, ast.AST]:
         """ Convert string represented in Python byte-string literal syntax into a
@@ -94,12 +128,7 @@ class TwitterDataPrep:
         :param field: string or bytestring
         :return: string
         """
-
-        result = field
-        try:
-            result = ast.literal_eval(field)
-        finally:
-            return result.decode() if isinstance(result, bytes) else field
+        return decode_bytes_literal(field)
 
     def replace_emoticons(self, text) -> str:
         """
@@ -107,10 +136,7 @@ class TwitterDataPrep:
         :param text:
         :return:
         """
-        for emoticon, context in self.emoticons_dict.items():
-            text = text.replace(emoticon, ' ' + context + ' ')
-            text = re.sub(' +', ' ', text)
-        return text
+        return self.preprocessor.emoticon_replacer.replace(text)
 
     def replace_emojis(self, text: str) -> str:
         """
@@ -118,11 +144,9 @@ class TwitterDataPrep:
         :param text:
         :return:
         """
-        for emoji, context in demoji.findall(text).items():
-            text = text.replace(emoji, ' ' + context + ' ')
-            text = re.sub(' +', ' ', text)
-        return text
+        return self.preprocessor.replace_emojis(text)
 
+    @traced('preprocess')
     def preprocess_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Preprocess the tweets.
@@ -130,32 +154,32 @@ class TwitterDataPrep:
         :return: dataframe
         """
         logging.info('Preprocessing data...')
-        # open encoded file
-        df['tweet'] = df['tweet'].apply(self._parse_bytes)
-        # normalize the text
-        # df['tweet'] = df['tweet'].map(lambda x:BeautifulSoup(x, "html").get_text(strip=True))
-        df['tweet'] = df['tweet'].str.normalize('NFKD')
-        # clean the text
-        df['tweet'] = df['tweet'].map(self.clean_text)
-
-        # .str.encode('ascii', 'ignore').str.decode('utf-8')
-
-        # replace emoticons with custom dictionary
-        # df['tweet'].replace(emoticon_dict_escape, regex=True, method='pad') # to use regex with replace method
-        df['tweet'] = df['tweet'].apply(lambda x: self.replace_emoticons(x))
-        # replace emojis
-        df['tweet'] = df['tweet'].apply(lambda x: self.replace_emojis(x))
+        # decode, normalize, clean and replace emoticons/emojis in one batch per user
+        df['tweet'] = self.preprocessor.preprocess(df['tweet'])
         logging.info('Preprocessing done.')
         return df
 
-    def get_embeddings(self, twitter_data: pd.DataFrame) -> Optional[npt.NDArray]:
+    @traced('encode')
+    def get_embeddings(self, twitter_data: pd.DataFrame, batch_size: int = 32,
+                       chunk_size: int = 1024) -> Optional[npt.NDArray]:
         """
-        Get the embeddings of the tweets.
+        Get the mean embedding of the tweets.
+        The tweets are sorted by length, so the batches pad to similar lengths (the mean does not depend
+        on the order), and encoded `chunk_size` at a time into a running sum - the memory held does not
+        grow with the number of tweets.
         :param twitter_data:
+        :param batch_size: encoding batch size
+        :param chunk_size: tweets encoded per call to the model
         :return: embeddings
+        :raise ValueError: if there are no tweets
         """
-        vectors = self.model.encode(twitter_data.tweet)
-        return vectors.mean(axis=0)
+        tweets = sorted(twitter_data.tweet.tolist(), key=len)
+        running_mean = RunningMean(self.model.get_sentence_embedding_dimension())
+        for start in range(0, len(tweets), chunk_size):
+            running_mean.add(self.model.encode(tweets[start:start + chunk_size], batch_size=batch_size))
+            if len(tweets) > chunk_size:
+                logging.info(f"{min(start + chunk_size, len(tweets))}/{len(tweets)} tweets encoded")
+        return running_mean.mean
 
     def process_embedding_data(self, embeddings: Optional[npt.NDArray], username: str) -> pd.DataFrame:
         """
@@ -164,63 +188,189 @@ class TwitterDataPrep:
         :param embeddings:
         :return:
         """
-        # create a temporary dataframe to split embeddings
-        temp_df = pd.DataFrame({"emb": [embeddings]})
-        # indices range for embeddings
-        indices = range(len(temp_df['emb'][0]))
-        # split embedding values into individual columns
-        # https://stackoverflow.com/a/63198715/11105356
-        temp_df = temp_df['emb'].transform({f'v{i + 1}': itemgetter(i) for i in indices})
-        # insert username at the first column
-        temp_df.insert(0, 'username', username)
-        return temp_df
+        return embeddings_frame([username], np.asarray(embeddings, dtype=np.float32).reshape(1, -1))
 
-    def load_data(self) -> None:
+    def user_files(self) -> list:
         """
-        Export the generated embeddings to a csv file.
-        :return:
+        List the tweet files of the data folder, csv files and Parquet archive partitions.
+        The archive partition of a user wins over its csv file, it holds the tweets scraped or streamed since.
+        :return: list of (username, file path) in sorted walk order
         """
-        df_embeddings = pd.DataFrame()
-        logging.info(f"Loading data from the folder...{self.data_path}")
-        count = 1
+        user_files: dict = {}
         # check file in subdirectory
         for root, dirs, files in os.walk(os.path.join(os.getcwd(), self.data_path)):
             dirs.sort(key=str)
             files.sort(key=str)
             for file in files:
-                # folder_name = os.path.basename(root)
+                archive = False
                 if file.endswith(".csv"):
-                    file_path = os.path.join(root, file)
-                    try:
-                        # get username from csv file names
-                        username = re.sub(r'\.csv$', '', file)
-                        logging.info(f"User: {username}")
-                        # read the data
-                        df = pd.read_csv(file_path)
-                        # preprocess the data
-                        data = self.preprocess_data(df)
-                        # get the embeddings
-                        embeddings = self.get_embeddings(data)
-
-                        temp_df = self.process_embedding_data(embeddings, username)
-                        # merge embedding and username
-                        df_embeddings = pd.concat([df_embeddings, temp_df], ignore_index=True)
-
-                        logging.info(f"{count} user(s) processed.")
-                        count += 1
-                    except IndexError as ie:
-                        logging.exception(f"{ie}")
-                        # file names which contains exceptions
-                        self.error_list.append(file)
-                        logging.info(f"Unexpected error: {sys.exc_info()[0]}")
-                        self.error_list.append(str(sys.exc_info()[0]))
+                    # get username from csv file names
+                    username = re.sub(r'\.csv$', '', file)
+                elif file.endswith(".parquet") and partition_username(os.path.join(root, file)):
+                    # or from the archive partition folder
+                    username = partition_username(os.path.join(root, file))
+                    archive = True
+                else:
+                    continue
+                if username in user_files:
+                    kept = user_files[username]
+                    if archive and not kept.endswith(".parquet"):
+                        # in place of the csv file, the user keeps its position
+                        user_files[username] = os.path.join(root, file)
+                    else:
+                        kept = os.path.join(root, file)
+                    logging.warning(f"Skipping {kept}, {username} has another tweet file")
+                    continue
+                user_files[username] = os.path.join(root, file)
+        return list(user_files.items())
+
+    def prepared_users(self, file_paths: list, workers: int = 1) -> Iterator[Future]:
+        """
+        Read and preprocess the users' tweets, in a process pool if more than one worker is given.
+        At most `2 * workers` users are kept in flight ahead of the encoder.
+        :param file_paths:
+        :param workers: number of preprocessing processes
+        :return: futures of (dataframe, read seconds, preprocess seconds) in file order
+        """
+        if workers <= 1:
+            for file_path in file_paths:
+                future: Future = Future()
+                try:
+                    future.set_result(read_preprocess(file_path, self.preprocessor))
+                except Exception as e:
+                    future.set_exception(e)
+                yield future
+            return
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_preprocess_worker,
+                                 initargs=(self.emoticons_dict,)) as executor:
+            pending: deque = deque()
+            for file_path in file_paths:
+                pending.append(executor.submit(read_preprocess, file_path))
+                if len(pending) > 2 * workers:
+                    yield pending.popleft()
+            while pending:
+                yield pending.popleft()
+
+    def embed_file_path(self, suffix: str = '.csv') -> str:
+        """
+        Path of a file of the embedding folder, e.g. the embedding csv or its manifest
+        :param suffix:
+        :return: file path
+        """
+        return os.path.join(os.getcwd(), self.embed_data_path, f"{self.embed_data_path}{suffix}")
 
+    def previous_embeddings(self) -> tuple:
+        """
+        Read the embeddings of the last build, from the binary store or else the embedding csv file
+        :return: (usernames, float32 matrix), ([], None) if there is no build
+        """
+        if EmbeddingStore.exists(self.embed_data_path):
+            # read, not memory-mapped, as the store files get replaced
+            previous_store = EmbeddingStore.load(self.embed_data_path, mmap=False)
+            return previous_store.usernames, previous_store.matrix
+        if os.path.exists(self.embed_file_path()):
+            return read_embeddings_csv(self.embed_file_path())
+        return [], None
+
+    def save_embeddings(self, usernames: list, matrix: npt.NDArray, manifest: EmbeddingManifest) -> None:
+        """
+        Export the embeddings to the csv file, the binary store loaded by the matcher and the manifest
+        :param usernames:
+        :param matrix: float32 matrix, one row per user
+        :param manifest:
+        :return:
+        """
+        df_embeddings = embeddings_frame(usernames, matrix)
         # create embedding directory if not exist
         if not os.path.exists(os.path.join(os.getcwd(), self.embed_data_path)):
             os.mkdir(os.path.join(os.getcwd(), self.embed_data_path))
         # export the data to a csv file
-        df_embeddings.to_csv(os.path.join(os.getcwd(), self.embed_data_path, "%s.csv" % self.embed_data_path),
-                             index=False)
+        df_embeddings.to_csv(self.embed_file_path(), index=False)
+        # and to the binary store loaded by the matcher
+        EmbeddingStore(usernames, matrix, model=manifest.model).save(self.embed_data_path)
+        manifest.save(self.embed_file_path('.manifest.json'))
+        logging.info(f"Data saved to {self.embed_file_path()}")
+
+    def load_data(self, workers: int = 1, batch_size: int = 32, incremental: bool = True,
+                  chunk_size: int = 1024) -> None:
+        """
+        Export the generated embeddings to a csv file.
+        Preprocessing runs in `workers` processes while this process encodes the prepared users.
+        With `incremental`, users whose tweet file is unchanged since the last build (same model and
+        preprocessing version, see the manifest) keep their previous embedding.
+        :param workers: number of preprocessing processes
+        :param batch_size: encoding batch size
+        :param incremental: reuse the embeddings of unchanged users
+        :param chunk_size: tweets encoded per call to the model, see `get_embeddings`
+        :return:
+        """
+        logging.info(f"Loading data from the folder...{self.data_path}")
+        count = 1
+        timings = dict.fromkeys(['read', 'preprocess', 'wait', 'encode', 'write'], 0.0)
+        start_time = time.perf_counter()
+
+        user_files = self.user_files()
+        manifest = EmbeddingManifest(model_identity(self.model_name), PREPROCESSING_VERSION)
+        previous = EmbeddingManifest.load(self.embed_file_path('.manifest.json')) if incremental else None
+        if previous and not previous.is_compatible(manifest):
+            logging.info("Model or preprocessing changed since the last build, re-embedding all users")
+            previous = None
+        # one preallocated float32 row per user file, in file order
+        dimension = self.model.get_sentence_embedding_dimension()
+        matrix = np.zeros((len(user_files), dimension), dtype=np.float32)
+        filled = np.zeros(len(user_files), dtype=bool)
+        rows = {username: row for row, (username, _) in enumerate(user_files)}
+        # embeddings of the last build, by username
+        previous_usernames, previous_matrix = self.previous_embeddings() if previous else ([], None)
+        previous_rows = {username: row for row, username in enumerate(previous_usernames)}
+        changed_files = []
+        for username, file_path in user_files:
+            if manifest.fingerprint(username, file_path, previous) and username in previous_rows:
+                matrix[rows[username]] = previous_matrix[previous_rows[username]]
+                filled[rows[username]] = True
+            else:
+                changed_files.append((username, file_path))
+        logging.info(f"{len(changed_files)} new or changed user(s), "
+                     f"{len(user_files) - len(changed_files)} unchanged")
+
+        prepared_users = self.prepared_users([file_path for _, file_path in changed_files], workers=workers)
+        for (username, file_path), future in zip(changed_files, prepared_users):
+            try:
+                logging.info(f"User: {username}")
+                # wait for the read and preprocessed data
+                wait_start = time.perf_counter()
+                data, read_time, preprocess_time = future.result()
+                timings['wait'] += time.perf_counter() - wait_start
+                timings['read'] += read_time
+                timings['preprocess'] += preprocess_time
+                # get the embeddings
+                encode_start = time.perf_counter()
+                embeddings = self.get_embeddings(data, batch_size=batch_size, chunk_size=chunk_size)
+                timings['encode'] += time.perf_counter() - encode_start
+
+                matrix[rows[username]] = embeddings
+                filled[rows[username]] = True
+
+                logging.info(f"{count} user(s) processed.")
+                count += 1
+            except Exception as e:
+                # a bad user file (or a worker failing on it) skips the user, not the whole build
+                logging.exception(f"{e}")
+                # file names which contains exceptions
+                self.error_list.append(os.path.basename(file_path))
+                logging.info(f"Unexpected error: {sys.exc_info()[0]}")
+                self.error_list.append(str(sys.exc_info()[0]))
+                # not recorded, so the next build retries it
+                manifest.files.pop(username, None)
+
+        write_start = time.perf_counter()
+        # merge embedding and username once, users whose tweet file is gone are dropped
+        usernames = [username for (username, _), is_filled in zip(user_files, filled) if is_filled]
+        self.save_embeddings(usernames, matrix[filled], manifest)
+        timings['write'] = time.perf_counter() - write_start
         logging.warning(f"Error list: {self.error_list}")
-        logging.info(
-            f"Data saved to {os.path.join(os.getcwd(), self.embed_data_path, '%s.csv' % self.embed_data_path)}")
+        # read/preprocess are summed over the workers, `wait` is the time the encoder sat idle
+        logging.info(f"Stage timings ({workers} worker(s), batch size {batch_size}): " +
+                     ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()) +
+                     f", total {time.perf_counter() - start_time:.2f}s")
@@ -0,0 +1,329 @@
+"""
+## Twitter Celebrity Matcher
+
+This app is a tool to match celebrities from Twitter with their respective tweets.
+
+Local encoding service - one process loads the SentenceTransformer and encodes for the other processes
+(e.g. the workers of the API, the Streamlit app and the embedding builder) over a Unix socket, instead of
+every process loading its own model. `EncoderClient` is a drop-in for the shared encoder of `TwitterDataPrep`.
+
+Requests are batched dynamically: the requests of all the connections are queued, the first one waits at
+most `max_wait` for others to arrive and up to `max_batch` sentences are encoded in one model call.
+Concurrent live users then share the forward passes instead of each running its own small `encode`.
+The server runs as its own process, so its torch threads are sized apart from the web workers.
+
+Start it with: `python -m core.encoder_service --socket <path> [--model-path <folder>]`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Optional
+
+import numpy.typing as npt
+
+from core.models import model_registry, process_rss, resolve_model_name
+
+
+class DynamicBatcher:
+    def __init__(self, encoder, max_batch: int = 128, max_wait: float = 0.005) -> None:
+        """
+        Merge the encode requests of concurrent callers into batches, encoded by one thread
+        :param encoder: model, `SharedEncoder`
+        :param max_batch: sentences encoded per model call, a larger request is encoded alone
+        :param max_wait: seconds the first request of a batch waits for others, 0 to not wait
+        """
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = self.batches = self.sentences = 0
+        # open connections, each has at most one request queued
+        self.connections = 0
+        self._connections_lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._carried: Optional[tuple] = None  # request left out of a full batch, first of the next one
+        self._thread = threading.Thread(target=self.run, name='encoder-batcher', daemon=True)
+        self._thread.start()
+
+    def connected(self, delta: int) -> None:
+        """
+        Count a connection opened (1) or closed (-1)
+        :param delta:
+        :return:
+        """
+        with self._connections_lock:
+            self.connections += delta
+
+    def submit(self, sentences: list, kwargs: dict) -> Future:
+        """
+        Queue sentences to encode
+        :param sentences:
+        :param kwargs: `SentenceTransformer.encode` arguments, only requests with the same ones are merged
+        :return: future of the embeddings of the sentences
+        """
+        future: Future = Future()
+        self._queue.put((sentences, kwargs, future, time.monotonic()))
+        return future
+
+    def next_request(self, timeout: Optional[float] = None) -> tuple:
+        """
+        The request carried over from the previous batch, else the next queued one
+        :param timeout: seconds to wait for a queued request, None to wait until one arrives
+        :return: (sentences, kwargs, future, arrival time) request
+        :raise queue.Empty: if no request arrived in time
+        """
+        if self._carried is not None:
+            request, self._carried = self._carried, None
+            return request
+        return self._queue.get(timeout=timeout)
+
+    def collect(self) -> list:
+        """
+        Wait for a request, then take the ones arriving until the batch is full or the deadline of its first
+        request passed - `max_wait` after it arrived, requests queued while the previous batch was encoded
+        wait no longer. Once every connection has a request in the batch no other can arrive, a lone caller
+        does not wait. A request which does not fit starts the next batch, one larger than `max_batch` is
+        encoded alone.
+        :return: (sentences, kwargs, future, arrival time) requests
+        """
+        batch = [self.next_request()]
+        size = len(batch[0][0])
+        deadline = batch[0][3] + self.max_wait
+        while size < self.max_batch and len(batch) < self.connections:
+            try:
+                request = self.next_request(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if size + len(request[0]) > self.max_batch:
+                self._carried = request
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def run(self) -> None:
+        while True:
+            batch = self.collect()
+            groups: dict = {}
+            for request in batch:
+                groups.setdefault(repr(sorted(request[1].items())), []).append(request)
+            for requests in groups.values():
+                self.encode(requests)
+
+    def encode(self, requests: list) -> None:
+        """
+        Encode requests with the same arguments in one model call, then split the embeddings between them
+        :param requests: (sentences, kwargs, future, arrival time) requests
+        :return:
+        """
+        sentences = [sentence for request in requests for sentence in request[0]]
+        try:
+            embeddings = self.encoder.encode(sentences, **requests[0][1])
+        except Exception as e:
+            logging.error(e)
+            for _, _, future, _ in requests:
+                future.set_exception(e)
+            return
+        start = 0
+        for request_sentences, _, future, _ in requests:
+            future.set_result(embeddings[start:start + len(request_sentences)])
+            start += len(request_sentences)
+        self.requests += len(requests)
+        self.batches += 1
+        self.sentences += len(sentences)
+
+    def stats(self) -> dict:
+        """
+        :return: batching settings, requests, model calls and sentences encoded
+        """
+        return {'max_batch': self.max_batch, 'max_wait_ms': self.max_wait * 1000, 'connections': self.connections,
+                'requests': self.requests,
+                'batches': self.batches, 'sentences': self.sentences,
+                'mean_batch_size': round(self.sentences / max(self.batches, 1), 2)}
+
+
+class EncoderServer:
+    def __init__(self, model_path: Optional[str], socket_path: str, max_batch: int = 128,
+                 max_wait: float = 0.005) -> None:
+        """
+        Load the model
+        :param model_path: local model folder, the default Hugging Face model if empty
+        :param socket_path: Unix socket to listen on
+        :param max_batch: sentences encoded per model call, see `DynamicBatcher`
+        :param max_wait: seconds a request waits for others to batch with
+        """
+        self.model_name = resolve_model_name(model_path)
+        self.encoder = model_registry.get(self.model_name)
+        self.socket_path = socket_path
+        self.batcher = DynamicBatcher(self.encoder, max_batch=max_batch, max_wait=max_wait)
+
+    def info(self) -> dict:
+        """
+        Model of the server
+        :return: model name, embedding dimension, model stats, the RSS of the server and the batching stats
+        """
+        return {'model_name': self.model_name, 'dimension': self.encoder.get_sentence_embedding_dimension(),
+                **model_registry.stats(), 'batching': self.batcher.stats()}
+
+    def serve_forever(self) -> None:
+        """
+        Accept connections, each served by its own thread. Their requests are encoded in batches.
+        :return:
+        """
+        if os.path.exists(self.socket_path):
+            try:
+                Client(self.socket_path, family='AF_UNIX').close()
+                raise RuntimeError(f"An encoder server is already listening on {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                # left by a server which did not shut down
+                os.remove(self.socket_path)
+        with Listener(self.socket_path, family='AF_UNIX') as listener:
+            # requests are unpickled, only the user of the server may connect
+            os.chmod(self.socket_path, 0o600)
+            logging.info(f"Encoder server of {self.model_name} listening on {self.socket_path}, "
+                         f"RSS {process_rss() / 2 ** 20:.1f} MiB")
+            while True:
+                connection = listener.accept()
+                threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+    def handle(self, connection: Connection) -> None:
+        """
+        Answer the requests of a connection until it is closed
+        :param connection:
+        :return:
+        """
+        self.batcher.connected(1)
+        try:
+            with connection:
+                while True:
+                    try:
+                        method, *args = connection.recv()
+                    except (EOFError, OSError):
+                        return
+                    try:
+                        if method == 'encode':
+                            sentences, kwargs = args
+                            response = ('ok', self.batcher.submit(sentences, kwargs).result())
+                        elif method == 'info':
+                            response = ('ok', self.info())
+                        else:
+                            raise ValueError(f"Unknown method {method!r}")
+                    except Exception as e:
+                        logging.error(e)
+                        response = ('error', f"{type(e).__name__}: {e}")
+                    try:
+                        connection.send(response)
+                    except OSError:
+                        # the client went away
+                        return
+        finally:
+            self.batcher.connected(-1)
+
+
+class EncoderClient:
+    def __init__(self, socket_path: str) -> None:
+        """
+        Encoder of a local encoder server, with a connection per thread
+        :param socket_path: Unix socket of the server
+        """
+        self.socket_path = socket_path
+        self._local = threading.local()
+        info = self.call('info')
+        self.model_name = info['model_name']
+        self.dimension = info['dimension']
+
+    def call(self, method: str, *args):
+        """
+        Send a request to the server, reconnecting once if the connection was lost
+        :param method: `encode` or `info`
+        :param args: arguments of the method
+        :return: result
+        :raise RuntimeError: if the server failed to answer the request
+        """
+        for attempt in range(2):
+            connection = getattr(self._local, 'connection', None)
+            try:
+                if connection is None:
+                    connection = self._local.connection = Client(self.socket_path, family='AF_UNIX')
+                connection.send((method, *args))
+                status, result = connection.recv()
+                break
+            except (EOFError, OSError):
+                self._local.connection = None
+                if attempt:
+                    raise
+        if status == 'error':
+            raise RuntimeError(f"Encoder server: {result}")
+        return result
+
+    def encode(self, sentences: list, **kwargs) -> npt.NDArray:
+        """
+        Encode sentences in the server, see `SentenceTransformer.encode`
+        :param sentences:
+        :param kwargs: `SentenceTransformer.encode` arguments
+        :return: embeddings
+        """
+        if isinstance(sentences, str):
+            return self.encode([sentences], **kwargs)[0]
+        return self.call('encode', list(sentences), kwargs)
+
+    def get_sentence_embedding_dimension(self) -> Optional[int]:
+        return self.dimension
+
+    def stats(self) -> dict:
+        """
+        Load time and memory of the model of the server
+        :return: `ModelRegistry.stats` of the server, with its batching stats
+        """
+        info = self.call('info')
+        return {'models': info['models'], 'process_rss_bytes': info['process_rss_bytes'],
+                'batching': info['batching']}
+
+
+def encoder_client(socket_path: Optional[str]) -> Optional[EncoderClient]:
+    """
+    Client of the encoder server, if one is configured and running
+    :param socket_path: Unix socket of the server, empty to encode in the process
+    :return: client, None to load the model in the process
+    """
+    if not socket_path:
+        return None
+    try:
+        return EncoderClient(socket_path)
+    except OSError as e:
+        logging.error(f"Encoder server not reachable on {socket_path}, loading the model in the process: {e}")
+        return None
+
+
+def main() -> None:
+    from config import ENCODER_MAX_BATCH, ENCODER_MAX_WAIT_MS, ENCODER_SOCKET, ENCODER_THREADS, MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Serve the sentence-transformers model over a Unix socket")
+    parser.add_argument('--socket', default=ENCODER_SOCKET, help="Unix socket path")
+    parser.add_argument('--model-path', default=MODEL_PATH, help="local model folder")
+    parser.add_argument('--max-batch', type=int, default=ENCODER_MAX_BATCH, help="sentences per model call")
+    parser.add_argument('--max-wait-ms', type=float, default=ENCODER_MAX_WAIT_MS,
+                        help="milliseconds a request waits for others to batch with")
+    parser.add_argument('--threads', type=int, default=ENCODER_THREADS, help="torch threads, 0 for the default")
+    args = parser.parse_args()
+    if not args.socket:
+        parser.error("no socket path, set ENCODER_SOCKET or --socket")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if args.threads > 0:
+        import torch
+
+        torch.set_num_threads(args.threads)
+    EncoderServer(args.model_path, args.socket, max_batch=args.max_batch,
+                  max_wait=args.max_wait_ms / 1000).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+"""
+## Twitter Celebrity Matcher
+
+This app is a tool to match celebrities from Twitter with their respective tweets.
+
+Nearest-neighbour indexes over the normalized celebrity embeddings, searched by inner product:
+- `brute-force`: exact, scores every celebrity user (default)
+- `ivf`: approximate inverted file index - the embeddings are clustered with k-means into `nlist`
+  lists and a query only scores the users of its `nprobe` closest lists. The index is saved next
+  to the embedding store, the vectors grouped by list and memory-mapped on load.
+
+The brute-force search can run over a quantized copy of the embeddings - `float16`, or `int8` with a
+per-dimension scale - 2x or 4x smaller than the float32 matrix, optionally rescoring the best candidates
+with the float32 embeddings of the (memory-mapped) store.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+from typing import Iterator, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from core.store import EmbeddingStore, matrix_fingerprint
+
+INDEX_BACKENDS = ('brute-force', 'ivf')
+QUANTIZATIONS = ('float32', 'float16', 'int8')
+
+
+def normalize_embeddings(embeddings: npt.ArrayLike) -> npt.NDArray:
+    """
+    L2-normalize embeddings (rows of a matrix or a single vector) as a contiguous float32 array
+    :param embeddings:
+    :return: normalized embeddings
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    # same epsilon as `torch.nn.functional.normalize`, used by `sentence_transformers.util.cos_sim`
+    return np.ascontiguousarray(embeddings / np.maximum(norms, 1e-12))
+
+
+def top_k_rows(scores: npt.NDArray, k: int) -> tuple:
+    """
+    Columns of the k highest scores of each row, selected with a partial sort
+    :param scores: (queries x candidates) scores
+    :param k: number of columns
+    :return: tuple of (columns, scores) arrays, (queries x min(k, candidates)), sorted by descending score
+    """
+    n_candidates = scores.shape[1]
+    k = max(min(k, n_candidates), 0)
+    if 0 < k < n_candidates:
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.broadcast_to(np.arange(k), (scores.shape[0], k))
+    top_scores = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+@contextlib.contextmanager
+def file_lock(file_path: str) -> Iterator[None]:
+    """
+    Exclusive lock between processes, held on `<file_path>.lock`
+    :param file_path: file guarded by the lock
+    :return:
+    """
+    try:
+        import fcntl
+    except ImportError:
+        # not on Windows, where the workers do not share the matrix anyway
+        yield
+        return
+    with open(f"{file_path}.lock", 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_normalized_embeddings(embed_data_path: str, embeddings: npt.NDArray, chunk_size: int = 65536,
+                               fingerprint: Optional[str] = None) -> npt.NDArray:
+    """
+    Normalized embeddings memory-mapped read-only from a file next to the embedding store, written from
+    the embeddings if missing or outdated - a json file next to it holds the `matrix_fingerprint` of the
+    embeddings it was written from. The processes mapping the file share its pages, instead of each
+    holding its own normalized copy.
+    :param embed_data_path:
+    :param embeddings: (users x dimension) embeddings of the store
+    :param chunk_size: users normalized at a time
+    :param fingerprint: `matrix_fingerprint` of the embeddings, saved with the store - hashed if None
+    :return: normalized embeddings, in memory if the file cannot be written
+    """
+    file_path = EmbeddingStore.file_path(embed_data_path, '.normalized.npy')
+    try:
+        # workers starting together wait for the first one to write the file, then map the same one
+        with file_lock(file_path):
+            return _load_normalized_embeddings(file_path, embeddings, chunk_size,
+                                               fingerprint or matrix_fingerprint(embeddings))
+    except OSError as e:
+        logging.error(f"Normalized embeddings not shared, kept in memory: {e}")
+        return normalize_embeddings(embeddings)
+
+
+def _load_normalized_embeddings(file_path: str, embeddings: npt.NDArray, chunk_size: int,
+                                fingerprint: str) -> npt.NDArray:
+    fingerprint_path = f"{os.path.splitext(file_path)[0]}.json"
+    try:
+        with open(fingerprint_path) as f:
+            written_from = json.load(f)['fingerprint']
+        normalized = np.load(file_path, mmap_mode='r')
+        if written_from == fingerprint and normalized.dtype == np.float32 and normalized.shape == embeddings.shape:
+            return normalized
+    except (OSError, ValueError, KeyError):
+        pass
+    logging.info(f"Writing the normalized embeddings to {file_path}")
+    # renamed once complete, processes still mapping a previous version keep it
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        normalized = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=embeddings.shape)
+        for start in range(0, len(embeddings), chunk_size):
+            normalized[start:start + chunk_size] = normalize_embeddings(embeddings[start:start + chunk_size])
+        normalized.flush()
+        del normalized
+        # the fingerprint of the previous file is removed first and the new one written last, a crash in
+        # between leaves the file without a fingerprint
+        if os.path.exists(fingerprint_path):
+            os.remove(fingerprint_path)
+        os.replace(tmp_path, file_path)
+        with open(f"{fingerprint_path}.tmp", 'w') as f:
+            json.dump({'fingerprint': fingerprint}, f)
+        os.replace(f"{fingerprint_path}.tmp", fingerprint_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return np.load(file_path, mmap_mode='r')
+
+
+class BruteForceIndex:
+    name = 'brute-force'
+
+    def __init__(self, embeddings: npt.NDArray) -> None:
+        """
+        Exact search
+        :param embeddings: normalized embeddings, (users x dimension)
+        """
+        self.embeddings = embeddings
+
+    def search(self, queries: npt.NDArray, k: int) -> tuple:
+        """
+        Find the k users with the highest inner product with each query
+        :param queries: normalized queries, (queries x dimension)
+        :param k: number of results per query
+        :return: tuple of (rows, scores) arrays, (queries x min(k, users)), sorted by descending score
+        """
+        # (Q x D) . (D x N)
+        return top_k_rows(queries @ self.embeddings.T, k)
+
+
+class QuantizedMatrix:
+    def __init__(self, codes: npt.NDArray, scale: Optional[npt.NDArray] = None, chunk_size: int = 4096) -> None:
+        """
+        Normalized embeddings stored as float16, or as int8 codes with a per-dimension scale
+        :param codes: (users x dimension) float16 or int8 matrix
+        :param scale: float32 scale of each dimension of int8 codes, None for float16
+        :param chunk_size: users converted to float32 at a time when scoring
+        """
+        self.codes = codes
+        self.scale = scale
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def quantize(cls, embeddings: npt.NDArray, quantization: str, chunk_size: int = 4096) -> 'QuantizedMatrix':
+        """
+        Normalize and quantize embeddings chunk by chunk, a memory-mapped matrix is never loaded whole
+        :param embeddings: (users x dimension) embeddings, not necessarily normalized
+        :param quantization: `float16` or `int8`
+        :param chunk_size: users normalized at a time
+        :return: quantized matrix
+        """
+        if quantization not in QUANTIZATIONS[1:]:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS[1:]}")
+        chunks = range(0, len(embeddings), chunk_size)
+        dtype = np.float16 if quantization == 'float16' else np.int8
+        codes = np.empty(embeddings.shape, dtype=dtype)
+        scale = None
+        if quantization == 'int8':
+            # symmetric, the largest absolute value of each dimension maps to 127
+            scale = np.full(embeddings.shape[1], 1e-12, dtype=np.float32)
+            for start in chunks:
+                np.maximum(scale, np.abs(normalize_embeddings(embeddings[start:start + chunk_size])).max(axis=0),
+                           out=scale)
+            scale /= 127
+        for start in chunks:
+            chunk = normalize_embeddings(embeddings[start:start + chunk_size])
+            if scale is not None:
+                chunk = np.clip(np.rint(chunk / scale), -127, 127)
+            codes[start:start + chunk_size] = chunk
+        return cls(codes, scale, chunk_size)
+
+    @property
+    def quantization(self) -> str:
+        return 'int8' if self.scale is not None else 'float16'
+
+    @property
+    def shape(self) -> tuple:
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, rows) -> npt.NDArray:
+        """
+        Dequantized rows
+        :param rows: row, slice or array of rows
+        :return: float32 embeddings, approximately normalized
+        """
+        rows = self.codes[rows].astype(np.float32)
+        return rows * self.scale if self.scale is not None else rows
+
+    def scores(self, queries: npt.NDArray) -> npt.NDArray:
+        """
+        Inner products of queries with every user, `chunk_size` users converted to float32 at a time
+        :param queries: normalized queries, (queries x dimension)
+        :return: (queries x users) float32 scores
+        """
+        # the scale is folded into the queries: q . (scale * codes) = (q * scale) . codes
+        queries = np.asarray(queries * self.scale if self.scale is not None else queries, dtype=np.float32)
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), self.chunk_size):
+            np.matmul(queries, self.codes[start:start + self.chunk_size].astype(np.float32).T,
+                      out=scores[:, start:start + self.chunk_size])
+        return scores
+
+
+class QuantizedIndex:
+    name = 'brute-force'
+
+    def __init__(self, quantized: QuantizedMatrix, embeddings: Optional[npt.NDArray] = None,
+                 rescore: int = 4) -> None:
+        """
+        Exact search over quantized embeddings, the best `rescore * k` candidates rescored in float32
+        :param quantized: quantized normalized embeddings
+        :param embeddings: float32 embeddings (not necessarily normalized) to rescore with, None to not rescore
+        :param rescore: candidates rescored per result, 0 to not rescore
+        """
+        self.quantized = quantized
+        self.embeddings = embeddings
+        self.rescore = rescore
+
+    def search(self, queries: npt.NDArray, k: int) -> tuple:
+        """
+        Find the k users with the highest inner product with each query
+        :param queries: normalized queries, (queries x dimension)
+        :param k: number of results per query
+        :return: tuple of (rows, scores) arrays, (queries x min(k, users)), sorted by descending score
+        """
+        candidates, scores = top_k_rows(self.quantized.scores(queries), k * max(self.rescore, 1))
+        if self.embeddings is None or self.rescore < 1:
+            return candidates[:, :k], scores[:, :k]
+        # float32 scores of the candidates only, a few rows of the store per query
+        vectors = normalize_embeddings(self.embeddings[candidates.ravel()]).reshape(*candidates.shape, -1)
+        exact = np.einsum('qcd,qd->qc', vectors, queries)
+        columns, top_scores = top_k_rows(exact, k)
+        return np.take_along_axis(candidates, columns, axis=1), top_scores
+
+
+class IVFIndex:
+    name = 'ivf'
+
+    def __init__(self, centroids: npt.NDArray, offsets: npt.NDArray, rows: npt.NDArray, vectors: npt.NDArray,
+                 fingerprint: str, nprobe: int = 8) -> None:
+        """
+        Inverted file index
+        :param centroids: normalized list centroids, (nlist x dimension)
+        :param offsets: start of each list in `rows`/`vectors`, (nlist + 1)
+        :param rows: embedding row of each vector, grouped by list
+        :param vectors: normalized embeddings grouped by list
+        :param fingerprint: fingerprint of the embeddings the index was built from
+        :param nprobe: number of lists scored per query
+        """
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.vectors = vectors
+        self.fingerprint = fingerprint
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, embeddings: npt.NDArray, nlist: int = 0, nprobe: int = 8, n_iter: int = 10,
+              seed: int = 0, chunk_size: int = 65536, fingerprint: Optional[str] = None) -> 'IVFIndex':
+        """
+        Cluster the embeddings with spherical k-means, trained on a sample of at most 64 users per list
+        :param embeddings: normalized embeddings, (users x dimension)
+        :param nlist: number of lists, 0 for `sqrt(users)`
+        :param nprobe: number of lists scored per query
+        :param n_iter: k-means iterations
+        :param seed:
+        :param chunk_size: users assigned per matrix product
+        :param fingerprint: fingerprint of the store the embeddings were normalized from, or of the embeddings
+        :return: index
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        n_users = len(embeddings)
+        nlist = max(min(nlist or int(np.sqrt(n_users)), n_users), 1)
+        rng = np.random.default_rng(seed)
+        train = embeddings[np.sort(rng.choice(n_users, size=min(n_users, 64 * nlist), replace=False))]
+        centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+
+        def assign(vectors: npt.NDArray) -> npt.NDArray:
+            return np.concatenate([np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+                                   for start in range(0, len(vectors), chunk_size)])
+
+        for _ in range(n_iter):
+            labels = assign(train)
+            order = np.argsort(labels, kind='stable')
+            counts = np.bincount(labels, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            non_empty = counts > 0
+            sums[non_empty] = np.add.reduceat(train[order], np.concatenate(([0], np.cumsum(counts)[:-1]))[non_empty])
+            # empty lists restart from random training users
+            sums[~non_empty] = train[rng.choice(len(train), size=int((~non_empty).sum()), replace=False)]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        labels = assign(embeddings)
+        rows = np.argsort(labels, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=nlist)))).astype(np.int64)
+        return cls(centroids.astype(np.float32), offsets, rows.astype(np.int64), embeddings[rows],
+                   fingerprint or matrix_fingerprint(embeddings), nprobe)
+
+    @staticmethod
+    def file_path(embed_data_path: str, suffix: str) -> str:
+        """
+        Path of an index file in the embedding folder
+        :param embed_data_path:
+        :param suffix: `.ivf.npy` for the grouped vectors, `.ivf.npz` for the lists
+        :return: file path
+        """
+        return EmbeddingStore.file_path(embed_data_path, suffix)
+
+    @classmethod
+    def exists(cls, embed_data_path: str) -> bool:
+        """
+        Check if the index was saved
+        :param embed_data_path:
+        :return: True if both the vectors and the lists exist
+        """
+        return os.path.exists(cls.file_path(embed_data_path, '.ivf.npy')) and \
+            os.path.exists(cls.file_path(embed_data_path, '.ivf.npz'))
+
+    @classmethod
+    def load(cls, embed_data_path: str, nprobe: int = 8, mmap: bool = True) -> 'IVFIndex':
+        """
+        Load the index, the vectors are memory-mapped read-only by default
+        :param embed_data_path:
+        :param nprobe: number of lists scored per query
+        :param mmap: memory-map the vectors instead of reading them
+        :return: index
+        """
+        with np.load(cls.file_path(embed_data_path, '.ivf.npz')) as lists:
+            centroids, offsets, rows = lists['centroids'], lists['offsets'], lists['rows']
+            fingerprint = str(lists['fingerprint'])
+        vectors = np.load(cls.file_path(embed_data_path, '.ivf.npy'), mmap_mode='r' if mmap else None)
+        if vectors.shape != (len(rows), centroids.shape[1]) or offsets[-1] != len(rows):
+            raise ValueError(f"IVF vectors {vectors.shape} do not match the index lists")
+        return cls(centroids, offsets, rows, vectors, fingerprint, nprobe)
+
+    def save(self, embed_data_path: str) -> None:
+        """
+        Save the vectors, then the lists, each written aside and renamed into place
+        :param embed_data_path:
+        :return:
+        """
+        vectors_path = self.file_path(embed_data_path, '.ivf.npy')
+        lists_path = self.file_path(embed_data_path, '.ivf.npz')
+        with open(vectors_path + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        os.replace(vectors_path + '.tmp', vectors_path)
+        with open(lists_path + '.tmp', 'wb') as f:
+            np.savez(f, centroids=self.centroids, offsets=self.offsets, rows=self.rows,
+                     fingerprint=np.array(self.fingerprint))
+        os.replace(lists_path + '.tmp', lists_path)
+
+    def search(self, queries: npt.NDArray, k: int) -> tuple:
+        """
+        Find the k users with the highest inner product with each query, among the users of the
+        `nprobe` lists with the closest centroids
+        :param queries: normalized queries, (queries x dimension)
+        :param k: number of results per query
+        :return: tuple of (rows, scores) arrays, (queries x k) sorted by descending score,
+                 padded with -1 rows and -inf scores when the probed lists hold fewer than k users
+        """
+        probes, _ = top_k_rows(queries @ self.centroids.T, self.nprobe)
+        result_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        result_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            # the vectors of a list are contiguous, score each probed list with one product
+            candidates = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            scores = np.concatenate([self.vectors[self.offsets[l]:self.offsets[l + 1]] @ query for l in lists])
+            columns, top_scores = top_k_rows(scores[np.newaxis], k)
+            result_rows[i, :columns.shape[1]] = self.rows[candidates[columns[0]]]
+            result_scores[i, :columns.shape[1]] = top_scores[0]
+        return result_rows, result_scores
+
+
+def load_index(backend: str, embed_data_path: str, embeddings: npt.NDArray, nlist: int = 0, nprobe: int = 8,
+               fingerprint: Optional[str] = None):
+    """
+    Load the index of a backend. A missing or outdated IVF index is rebuilt from the embeddings and saved.
+    :param backend: `brute-force` or `ivf`
+    :param embed_data_path:
+    :param embeddings: normalized embeddings, (users x dimension)
+    :param nlist: number of IVF lists, 0 for `sqrt(users)`
+    :param nprobe: number of IVF lists scored per query
+    :param fingerprint: `matrix_fingerprint` saved with the store the embeddings were normalized from,
+                        compared with the one of the saved index - the embeddings are hashed if None
+    :return: index
+    """
+    if backend == BruteForceIndex.name:
+        return BruteForceIndex(embeddings)
+    if backend != IVFIndex.name:
+        raise ValueError(f"Unknown index backend {backend!r}, expected one of {INDEX_BACKENDS}")
+    index: Optional[IVFIndex] = None
+    if IVFIndex.exists(embed_data_path):
+        try:
+            index = IVFIndex.load(embed_data_path, nprobe=nprobe)
+        except (ValueError, KeyError, OSError) as e:
+            logging.warning(f"Ignoring unreadable IVF index: {e}")
+    fingerprint = fingerprint or matrix_fingerprint(embeddings)
+    if index is None or index.fingerprint != fingerprint or (nlist and index.nlist != nlist):
+        logging.warning("IVF index missing or outdated, building it from the embeddings")
+        index = IVFIndex.build(embeddings, nlist=nlist, nprobe=nprobe, fingerprint=fingerprint)
+        try:
+            index.save(embed_data_path)
+        except OSError as e:
+            logging.error(e)
+    return index
+
+
+def main() -> None:
+    """
+    Build the IVF index of the binary store of `EMBED_DATA_PATH`
+    """
+    from config import EMBED_DATA_PATH, IVF_NLIST, IVF_NPROBE
+
+    parser = argparse.ArgumentParser(description="Build the IVF index of the binary embedding store")
+    parser.add_argument('--embed-data-path', default=EMBED_DATA_PATH)
+    parser.add_argument('--nlist', type=int, default=IVF_NLIST, help="number of lists, 0 for sqrt(users)")
+    args = parser.parse_args()
+
+    store = EmbeddingStore.load(args.embed_data_path)
+    index = IVFIndex.build(normalize_embeddings(store.matrix), nlist=args.nlist, nprobe=IVF_NPROBE,
+                           fingerprint=store.fingerprint)
+    index.save(args.embed_data_path)
+    logging.info(f"IVF index of {len(index.rows)} embeddings in {index.nlist} lists saved to "
+                 f"{IVFIndex.file_path(args.embed_data_path, '.ivf.npz')}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    main()
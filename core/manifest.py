@@ -0,0 +1,112 @@
+"""
+## Twitter Celebrity Matcher
+
+This app is a tool to match celebrities from Twitter with their respective tweets.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Optional, Union
+
+
+def file_sha256(file_path: Union[str, os.PathLike[str]]) -> str:
+    """
+    Hash a file in chunks
+    :param file_path:
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_identity(model_name: str) -> str:
+    """
+    Identify a model by its name, plus the file names and sizes if it is a local model folder
+    :param model_name: local model path or Hugging Face model id
+    :return: model identity
+    """
+    if not os.path.isdir(model_name):
+        return model_name
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(model_name):
+        dirs.sort(key=str)
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            digest.update(f"{os.path.relpath(file_path, model_name)}:{os.path.getsize(file_path)};".encode())
+    return f"{os.path.basename(os.path.normpath(model_name))}@{digest.hexdigest()[:16]}"
+
+
+class EmbeddingManifest:
+    def __init__(self, model: str, preprocessing_version: int, files: Optional[dict] = None) -> None:
+        """
+        Record of the source files an embedding file was built from
+        :param model: model identity
+        :param preprocessing_version: version of the tweet preprocessing
+        :param files: username -> {size, mtime_ns, sha256} of the source file
+        """
+        self.model = model
+        self.preprocessing_version = preprocessing_version
+        self.files: dict = files or {}
+
+    @classmethod
+    def load(cls, manifest_path: Union[str, os.PathLike[str]]) -> Optional['EmbeddingManifest']:
+        """
+        Load a manifest
+        :param manifest_path:
+        :return: manifest, None if it does not exist or can not be read
+        """
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            return cls(manifest['model'], manifest['preprocessing_version'], manifest['files'])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+            return None
+
+    def save(self, manifest_path: Union[str, os.PathLike[str]]) -> None:
+        """
+        Save the manifest
+        :param manifest_path:
+        :return:
+        """
+        with open(manifest_path, 'w') as f:
+            json.dump({'model': self.model,
+                       'preprocessing_version': self.preprocessing_version,
+                       'files': self.files}, f, indent=2, sort_keys=True)
+
+    def is_compatible(self, other: 'EmbeddingManifest') -> bool:
+        """
+        Check if the embeddings of another manifest can be reused by this one
+        :param other:
+        :return: True if both use the same model and preprocessing
+        """
+        return self.model == other.model and self.preprocessing_version == other.preprocessing_version
+
+    def fingerprint(self, username: str, file_path: Union[str, os.PathLike[str]],
+                    previous: Optional['EmbeddingManifest'] = None) -> bool:
+        """
+        Record the fingerprint of a source file. The file is only hashed when its size or
+        modification time differs from the previous manifest.
+        :param username:
+        :param file_path:
+        :param previous: manifest of the last build
+        :return: True if the content is unchanged since the previous build
+        """
+        stat = os.stat(file_path)
+        before = previous.files.get(username) if previous else None
+        if before and before['size'] == stat.st_size and before['mtime_ns'] == stat.st_mtime_ns:
+            sha256 = before['sha256']
+        else:
+            sha256 = file_sha256(file_path)
+        self.files[username] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+        return before is not None and before['sha256'] == sha256
@@ -8,22 +8,193 @@ Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
 """
 
 import logging
-import os
-from typing import Optional
+from typing import Callable, Iterable, Iterator, Optional
 
 import numpy as np
-import pandas as pd
-from sentence_transformers import util
+import numpy.typing as npt
 
 from core import utils
+from core.cache import EmbeddingCache
+from core.dataprep import TwitterDataPrep
+from core.index import QUANTIZATIONS, BruteForceIndex, QuantizedIndex, QuantizedMatrix, load_index, \
+    load_normalized_embeddings, normalize_embeddings
+from core.metrics import record_embedding_cache, stage
+from core.scraper import TwitterScraper
+from core.store import EmbeddingStore, matrix_fingerprint
 
 
 class TwitterUserMatcher:
-    def __init__(self, embed_data_path: str) -> None:
+    def __init__(self, embed_data_path: str, index_backend: str = BruteForceIndex.name, nlist: int = 0,
+                 nprobe: int = 8, twitter_scraper: Optional[TwitterScraper] = None,
+                 data_prep_loader: Optional[Callable[[], TwitterDataPrep]] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None, quantization: str = 'float32',
+                 rescore: int = 4, shared_matrix: bool = False) -> None:
         """
         :param embed_data_path: celebrity user embedding file data path
+        :param index_backend: nearest-neighbour search, `brute-force` (exact) or `ivf` (approximate)
+        :param nlist: number of IVF lists, 0 for `sqrt(users)`
+        :param nprobe: number of IVF lists scored per query, higher is slower with a better recall
+        :param twitter_scraper: shared scraper for non-celebrity users
+        :param data_prep_loader: returns the shared data preparation object (and model) for non-celebrity
+                                 users, called only when one is embedded so the model is loaded lazily
+        :param embedding_cache: embeddings of the non-celebrity users already scraped
+        :param quantization: `float32`, or `float16` / `int8` to hold a 2x / 4x smaller quantized copy of the
+                             normalized embeddings, searched by brute force
+        :param rescore: with a quantization, candidates rescored with the float32 embeddings per result,
+                        0 to rank by the quantized scores
+        :param shared_matrix: memory-map the normalized float32 embeddings from a file written next to the
+                              store, shared by the processes of a multi-worker deployment
         """
-        self.embed_data = pd.read_csv(os.path.join(os.getcwd(), embed_data_path, embed_data_path + '.csv'))
+        self.twitter_scraper = twitter_scraper
+        self.data_prep_loader = data_prep_loader
+        self.embedding_cache = embedding_cache
+        if EmbeddingStore.exists(embed_data_path):
+            # memory-mapped, the matrix is paged in on demand instead of parsed
+            store = EmbeddingStore.load(embed_data_path)
+        else:
+            logging.warning("Binary embedding store not found, reading the embedding csv file "
+                            "(convert it once with `python -m core.store`)")
+            store = EmbeddingStore.from_csv(embed_data_path)
+        self.usernames = np.asarray(store.usernames, dtype=object)
+        self.embeddings = store.matrix
+        self.model = store.model
+        # hashed once here for a csv file, derived files and the reload status compare it
+        self.fingerprint = store.fingerprint or matrix_fingerprint(self.embeddings)
+        if quantization == QUANTIZATIONS[0]:
+            # built once - cosine similarity becomes a single matrix-vector product
+            if shared_matrix and EmbeddingStore.exists(embed_data_path):
+                self.normalized_embeddings = load_normalized_embeddings(embed_data_path, self.embeddings,
+                                                                        fingerprint=self.fingerprint)
+            else:
+                self.normalized_embeddings = normalize_embeddings(self.embeddings)
+            self.index = load_index(index_backend, embed_data_path, self.normalized_embeddings, nlist=nlist,
+                                    nprobe=nprobe, fingerprint=self.fingerprint)
+        else:
+            if index_backend != BruteForceIndex.name:
+                raise ValueError(f"Quantized embeddings are searched by {BruteForceIndex.name}, not {index_backend}")
+            # only the quantized copy is held, the store rows are read back to rescore
+            self.normalized_embeddings = QuantizedMatrix.quantize(self.embeddings, quantization)
+            self.index = QuantizedIndex(self.normalized_embeddings, self.embeddings, rescore=rescore)
+        # lower() to bypass case issue, the first row wins for duplicated usernames
+        self.user_rows: dict = {}
+        for row, username in enumerate(self.usernames):
+            self.user_rows.setdefault(username.lower(), row)
+
+    def find_user(self, username: str) -> Optional[int]:
+        """
+        Find a celebrity user
+        :param username: Twitter username, case-insensitive
+        :return: row of the user, None if the user is not a celebrity
+        """
+        return self.user_rows.get(username.lower())
+
+    def normalized_embedding(self, row: int) -> npt.NDArray:
+        """
+        Get the normalized embedding of a celebrity user, exact with quantized embeddings
+        :param row: row of the user
+        :return: float32 normalized embedding
+        """
+        if isinstance(self.normalized_embeddings, QuantizedMatrix):
+            return normalize_embeddings(self.embeddings[row])
+        return self.normalized_embeddings[row]
+
+    def user_embedding(self, username: str) -> tuple:
+        """
+        Get the normalized embedding of a user, scraping and embedding the tweets of non-celebrity users
+        unless they are in the embedding cache
+        :param username: Twitter username
+        :return: tuple of (username, normalized embedding)
+        """
+        if (row := self.find_user(username)) is not None:
+            return self.usernames[row], self.normalized_embedding(row)
+        if self.embedding_cache is not None:
+            embedding = self.embedding_cache.get(username)
+            record_embedding_cache(self.embedding_cache)
+            if embedding is not None:
+                return username, normalize_embeddings(embedding)
+        user_df = utils.scrape_embed_tweets(username, twitter_scraper=self.twitter_scraper,
+                                            twitter_data_prep=self.data_prep_loader() if self.data_prep_loader else None)
+        embedding = user_df.iloc[0, 1:].to_numpy(dtype=np.float32)
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(username, embedding)
+        return user_df.username.values[0], normalize_embeddings(embedding)
+
+    def similarity_scores(self, embedding: npt.NDArray) -> npt.NDArray:
+        """
+        Cosine similarity of a normalized embedding with every celebrity user
+        :param embedding: normalized embedding
+        :return: score of each celebrity user, approximate with quantized embeddings
+        """
+        if isinstance(self.normalized_embeddings, QuantizedMatrix):
+            return self.normalized_embeddings.scores(embedding[np.newaxis])[0]
+        return self.normalized_embeddings @ embedding
+
+    def top_k(self, username: str, k: int, exclude_self: bool = True) -> Optional[tuple]:
+        """
+        returns the k celebrity users with the highest cosine similarity score to the given user
+        :param username: Twitter username
+        :param k: number of results
+        :param exclude_self: leave the user out of the results if it is a celebrity user
+        :return: tuple of (usernames, cosine similarity scores) arrays, sorted by descending score
+        """
+        _, top_results = next(self.top_k_batch([username], k, exclude_self=exclude_self))
+        return top_results
+
+    def top_k_embedding(self, embedding: npt.ArrayLike, k: int) -> tuple:
+        """
+        returns the k celebrity users with the highest cosine similarity score to an embedding, e.g. of a live user
+        :param embedding: mean tweet embedding
+        :param k: number of results
+        :return: tuple of (usernames, cosine similarity scores) arrays, sorted by descending score
+        """
+        with stage('similarity'):
+            top_rows, top_scores = self.index.search(normalize_embeddings(embedding)[np.newaxis], k)
+        found = np.flatnonzero(top_rows[0] >= 0)
+        return self.usernames[top_rows[0, found]], top_scores[0, found]
+
+    def top_k_batch(self, usernames: Iterable[str], k: int, exclude_self: bool = True,
+                    chunk_size: int = 256, scrape: bool = True) -> Iterator[tuple]:
+        """
+        `top_k` for many users, searching the index for each chunk of users at once
+        :param usernames: Twitter usernames
+        :param k: number of results per user
+        :param exclude_self: leave each user out of its own results if it is a celebrity user
+        :param chunk_size: users per chunk, caps the (chunk size x celebrity users) score matrix
+        :param scrape: scrape and embed the non-celebrity users, otherwise they have no results
+        :return: iterator of (username, tuple of (usernames, scores) arrays or None on error), in input order
+        """
+        usernames = list(usernames)
+        for start in range(0, len(usernames), chunk_size):
+            chunk = usernames[start:start + chunk_size]
+            # resolve the chunk: celebrity rows are gathered from the matrix, other users are scraped
+            with stage('resolve'):
+                rows = [self.find_user(username) for username in chunk]
+                embeddings: list = [None] * len(chunk)
+                for i, username in enumerate(chunk):
+                    if rows[i] is None and scrape:
+                        try:
+                            embeddings[i] = self.user_embedding(username)[1]
+                        except Exception as e:
+                            logging.error(e)
+            resolved = [i for i, row in enumerate(rows) if row is not None or embeddings[i] is not None]
+            if not resolved:
+                yield from ((username, None) for username in chunk)
+                continue
+            queries = np.stack([self.normalized_embedding(rows[i]) if rows[i] is not None else embeddings[i]
+                                for i in resolved])
+            # one extra result in case the user itself is found
+            with stage('similarity'):
+                top_rows, top_scores = self.index.search(queries, k + 1 if exclude_self else k)
+
+            results: list = [None] * len(chunk)
+            for j, i in enumerate(resolved):
+                # approximate indexes pad missing results with -1
+                keep = top_rows[j] >= 0
+                if exclude_self and rows[i] is not None:
+                    keep &= top_rows[j] != rows[i]
+                found = np.flatnonzero(keep)[:k]
+                results[i] = self.usernames[top_rows[j, found]], top_scores[j, found]
+            yield from zip(chunk, results)
 
     def match_twitter_user(self, *args, random_state=None) -> Optional[tuple]:
         """
@@ -33,29 +204,13 @@ class TwitterUserMatcher:
         :return: tuple of (usernames, cosine similarity score)
         """
         try:
-            if len(args) == 0:
-                random_users_df = self.embed_data.sample(n=2, random_state=random_state)
-            elif len(args) == 1:
-                if args[0].lower() in self.embed_data.username.str.lower().values:
-                    random_users_df = pd.concat(
-                        [self.embed_data[self.embed_data.username.str.lower() == args[0].lower()],
-                         self.embed_data.sample(random_state=random_state)])
-                else:
-                    random_users_df = pd.concat(
-                        [utils.scrape_embed_tweets(args[0]), self.embed_data.sample(random_state=random_state)])
-            else:
-                random_users_df = pd.concat(
-                    [self.embed_data[self.embed_data.username.str.lower() == args[0].lower()]
-                     if args[0].lower() in self.embed_data.username.str.lower().values
-                     else utils.scrape_embed_tweets(args[0]),
-
-                     self.embed_data[self.embed_data.username.str.lower() == args[1].lower()]
-                     if args[1].lower() in self.embed_data.username.str.lower().values
-                     else utils.scrape_embed_tweets(args[1])
-                     ])
-            usernames = random_users_df.username.values
-            similarity_score = util.cos_sim(random_users_df.iloc[:, 1:].values[0],
-                                            random_users_df.iloc[:, 1:].values[1])
+            # same draw as `DataFrame.sample(n, random_state=random_state)`
+            random_rows = np.random.RandomState(random_state).choice(len(self.usernames), size=2 - min(len(args), 2),
+                                                                     replace=False)
+            random_users = [self.user_embedding(username) for username in args[:2]] + \
+                           [(self.usernames[row], self.normalized_embedding(row)) for row in random_rows]
+            usernames = np.array([username for username, _ in random_users], dtype=object)
+            similarity_score = np.dot(random_users[0][1], random_users[1][1])
 
         except Exception as e:
             logging.error(e)
@@ -70,18 +225,12 @@ class TwitterUserMatcher:
         :return: zip object of usernames and cosine similarity score
         """
         try:
-            if username.lower() in self.embed_data.username.str.lower().values: # lower() to bypass case issue
-                user_df = self.embed_data[self.embed_data.username.str.lower() == username.lower()]
-            else:
-                user_df = utils.scrape_embed_tweets(username)
-
-            # handle RuntimeError: expected scalar type Double but found Float
-            # https://github.com/pytorch/pytorch/issues/2138
-            cos_sim_results = np.squeeze(
-                util.cos_sim(user_df.iloc[:, 1:].values.astype(np.float32),
-                             self.embed_data.iloc[:, 1:].values.astype(np.float32)).numpy())
+            with stage('resolve'):
+                _, user_embedding = self.user_embedding(username)
+            with stage('similarity'):
+                cos_sim_results = self.similarity_scores(user_embedding)
 
-            top_user_dict = zip(self.embed_data.iloc[:, 0], cos_sim_results)
+            top_user_dict = zip(self.usernames, cos_sim_results)
         except Exception as e:
             logging.error(e)
         else:
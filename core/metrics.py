@@ -0,0 +1,144 @@
+"""
+## Twitter Celebrity Matcher
+
+This app is a tool to match celebrities from Twitter with their respective tweets.
+
+Prometheus metrics of the process - the requests and latencies of the API, the latency of each stage
+of a match (username resolution, scraping, preprocessing, encoding, similarity search, formatting)
+and gauges of the matcher, the models and the embedding cache, exported by the API on `/metrics`.
+Stages are timed as spans with `stage` / `traced`, they nest: resolving a non-celebrity user includes
+scraping and embedding it.
+Under gunicorn every worker writes its metrics to `PROMETHEUS_MULTIPROC_DIR` and `/metrics` merges them,
+whichever worker answers: counters and histograms are summed, the gauges by their `multiprocess_mode`.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import functools
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# from a username lookup to scraping a whole timeline
+LATENCY_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120,
+                   float('inf'))
+
+REQUESTS = Counter('tcm_requests', "API requests", ['method', 'route', 'status'])
+REQUEST_SECONDS = Histogram('tcm_request_seconds', "API request latency, until the response starts",
+                            ['method', 'route'], buckets=LATENCY_BUCKETS)
+STAGE_SECONDS = Histogram('tcm_stage_seconds', "Latency of the stages of a match", ['stage'],
+                          buckets=LATENCY_BUCKETS)
+STAGE_ERRORS = Counter('tcm_stage_errors', "Stages which raised an exception", ['stage'])
+
+# the workers serve the same store, the last one (re)loaded is the current version
+MATRIX_USERS = Gauge('tcm_matrix_users', "Celebrity users of the matcher", multiprocess_mode='livemostrecent')
+MATRIX_BYTES = Gauge('tcm_matrix_bytes', "Bytes of the embedding matrices of the matcher",
+                     multiprocess_mode='livemostrecent')
+MATCHER_LOAD_SECONDS = Gauge('tcm_matcher_load_seconds', "Seconds to load the matcher", multiprocess_mode='livemax')
+MATCHER_RELOADS = Counter('tcm_matcher_reloads', "Reloads of the matcher on a new embedding store version",
+                          ['result'])
+MODEL_LOAD_SECONDS = Gauge('tcm_model_load_seconds', "Seconds to load a model", ['model'], multiprocess_mode='livemax')
+MODEL_MEMORY_BYTES = Gauge('tcm_model_memory_bytes', "Bytes of the weights of a model", ['model'],
+                           multiprocess_mode='livemax')
+
+CACHE_HITS = Gauge('tcm_embedding_cache_hits', "Embedding cache hits of the live workers", multiprocess_mode='livesum')
+CACHE_MISSES = Gauge('tcm_embedding_cache_misses', "Embedding cache misses of the live workers",
+                     multiprocess_mode='livesum')
+# a ratio does not add up between workers, one series per worker
+CACHE_HIT_RATIO = Gauge('tcm_embedding_cache_hit_ratio', "Embedding cache hits per lookup of a worker",
+                        multiprocess_mode='liveall')
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a stage, failed ones included
+    :param name: stage name, e.g. `scrape`
+    :return:
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(name).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+def traced(name: str) -> Callable:
+    """
+    Decorator timing every call of a function as a stage
+    :param name: stage name
+    :return: decorator
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    """
+    Record a stage timed elsewhere, e.g. in a worker process whose metrics are not exported
+    :param name: stage name
+    :param seconds:
+    :return:
+    """
+    STAGE_SECONDS.labels(name).observe(seconds)
+
+
+def record_matcher(users: int, matrix_bytes: int, load_seconds: float) -> None:
+    """
+    Set the gauges of the loaded matcher
+    :param users: celebrity users
+    :param matrix_bytes: bytes of the embedding matrices
+    :param load_seconds:
+    :return:
+    """
+    MATRIX_USERS.set(users)
+    MATRIX_BYTES.set(matrix_bytes)
+    MATCHER_LOAD_SECONDS.set(load_seconds)
+
+
+def record_models(stats: dict) -> None:
+    """
+    Set the gauges of the loaded models
+    :param stats: `ModelRegistry.stats` of the process which encodes
+    :return:
+    """
+    for model_name, model_stats in stats.get('models', {}).items():
+        MODEL_LOAD_SECONDS.labels(model_name).set(model_stats['load_seconds'])
+        MODEL_MEMORY_BYTES.labels(model_name).set(model_stats['memory_bytes'])
+
+
+def record_embedding_cache(embedding_cache) -> None:
+    """
+    Set the gauges of an embedding cache from its hit/miss counters, after every lookup - a gauge reading
+    the cache when collected only exists in the process answering `/metrics`
+    :param embedding_cache: `EmbeddingCache`
+    :return:
+    """
+    hits, misses = embedding_cache.hits, embedding_cache.misses
+    CACHE_HITS.set(hits)
+    CACHE_MISSES.set(misses)
+    CACHE_HIT_RATIO.set(hits / max(hits + misses, 1))
+
+
+def export() -> bytes:
+    """
+    Metrics in the Prometheus text format, of every worker under `PROMETHEUS_MULTIPROC_DIR`
+    :return:
+    """
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
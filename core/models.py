@@ -0,0 +1,160 @@
+"""
+## Twitter Celebrity Matcher
+
+This app is a tool to match celebrities from Twitter with their respective tweets.
+
+Process-wide registry of the shared resources of the data preparation - each SentenceTransformer
+model is loaded once and handed out as a thread-safe encoder, the emoticon dictionary and the
+compiled preprocessor are built once.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy.typing as npt
+import torch
+from sentence_transformers import SentenceTransformer
+
+from core.preprocessing import TweetPreprocessor
+
+DEFAULT_MODEL = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+EMOTICON_FILE_PATH = Path("utilities/") / "emoticon_dict.json"
+
+
+def process_rss() -> int:
+    """
+    Resident memory of the process
+    :return: bytes, the peak resident memory where the current one is not available, 0 where neither is
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        # not on Windows
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SharedEncoder:
+    def __init__(self, model: SentenceTransformer, model_name: str, load_time: float, memory: int) -> None:
+        """
+        A SentenceTransformer shared by the threads of the process, one `encode` at a time
+        :param model:
+        :param model_name: local model path or Hugging Face model id
+        :param load_time: seconds to load the model
+        :param memory: bytes of the model parameters and buffers
+        """
+        self.model = model
+        self.model_name = model_name
+        self.load_time = load_time
+        self.memory = memory
+        # tokenizers and the model are not safe to run concurrently
+        self._lock = threading.Lock()
+
+    def encode(self, sentences: list, **kwargs) -> npt.NDArray:
+        """
+        Encode sentences, see `SentenceTransformer.encode`
+        :param sentences:
+        :param kwargs: `SentenceTransformer.encode` arguments
+        :return: embeddings
+        """
+        with self._lock:
+            return self.model.encode(sentences, **kwargs)
+
+    def get_sentence_embedding_dimension(self) -> Optional[int]:
+        return self.model.get_sentence_embedding_dimension()
+
+
+class ModelRegistry:
+    def __init__(self) -> None:
+        """
+        Models loaded by the process, by name
+        """
+        self._encoders: dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str) -> SharedEncoder:
+        """
+        Get the shared encoder of a model, loading it on first use
+        :param model_name: local model path or Hugging Face model id
+        :return: shared encoder
+        """
+        if (encoder := self._encoders.get(model_name)) is not None:
+            return encoder
+        with self._lock:
+            if (encoder := self._encoders.get(model_name)) is None:
+                start = time.perf_counter()
+                model = SentenceTransformer(model_name)
+                if torch.cuda.is_available():
+                    model = model.to(torch.device("cuda"))
+                memory = sum(t.numel() * t.element_size() for t in (*model.parameters(), *model.buffers()))
+                encoder = SharedEncoder(model, model_name, time.perf_counter() - start, memory)
+                self._encoders[model_name] = encoder
+                logging.info(f"Model {model_name} loaded in {encoder.load_time:.2f}s on {model.device}, "
+                             f"{encoder.memory / 2 ** 20:.1f} MiB of weights, "
+                             f"process RSS {process_rss() / 2 ** 20:.1f} MiB")
+        return encoder
+
+    def stats(self) -> dict:
+        """
+        Load time and memory of the loaded models
+        :return: model name -> {load_seconds, memory_bytes, device}, plus the process RSS
+        """
+        return {'models': {name: {'load_seconds': round(encoder.load_time, 3),
+                                  'memory_bytes': encoder.memory,
+                                  'device': str(encoder.model.device)}
+                           for name, encoder in list(self._encoders.items())},
+                'process_rss_bytes': process_rss()}
+
+
+# the registry of the process
+model_registry = ModelRegistry()
+
+
+def resolve_model_name(model_path: Optional[str]) -> str:
+    """
+    The local model folder if the model was saved there, the Hugging Face model otherwise
+    :param model_path:
+    :return: model name
+    """
+    # download and save the model
+    # https://huggingface.co/sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2
+    # model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+    # model.save(model_path)
+    if model_path and os.path.isdir(model_path) and len(os.listdir(model_path)) != 0:
+        return model_path
+    return DEFAULT_MODEL
+
+
+@lru_cache(maxsize=None)
+def load_emoticons(emoticon_file_path: Path = EMOTICON_FILE_PATH) -> dict:
+    """
+    Read the emoticon dictionary once, the dictionary is shared - do not modify it
+    :param emoticon_file_path:
+    :return: emoticon -> word
+    """
+    with open(emoticon_file_path) as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def load_preprocessor(emoticon_file_path: Path = EMOTICON_FILE_PATH) -> TweetPreprocessor:
+    """
+    Compile the tweet preprocessor once
+    :param emoticon_file_path:
+    :return: shared preprocessor
+    """
+    return TweetPreprocessor(load_emoticons(emoticon_file_path))
@@ -0,0 +1,175 @@
+"""
+## Twitter Celebrity Matcher
+
+This app is a tool to match celebrities from Twitter with their respective tweets.
+
+Streaming scrape-to-embed pipeline - the timeline pages of a user are cleaned and encoded as they
+arrive, into a running mean embedding, without the csv round-trip of `BulkScraper` + `load_data`.
+The raw tweets can be archived in the Parquet tweet archive, read by `load_data` like the scraped tweets.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
+
+import numpy as np
+import numpy.typing as npt
+import pyarrow.parquet as pq
+
+from core.archive import ARCHIVE_COMPRESSION, ARCHIVE_SCHEMA, archive_table, partition_file_path
+from core.bulk_scraper import TimelineClient, tweets_frame
+from core.dataprep import RunningMean, TwitterDataPrep
+from core.manifest import EmbeddingManifest, model_identity
+from core.preprocessing import PREPROCESSING_VERSION
+
+
+class StreamingPipeline:
+    def __init__(self, client: TimelineClient, twitter_data_prep: TwitterDataPrep,
+                 archive_path: Optional[Union[str, os.PathLike[str]]] = None, workers: int = 4,
+                 batch_size: int = 32) -> None:
+        """
+        :param client: timeline client shared by the workers
+        :param twitter_data_prep: preprocessor and model, its embedding folder receives the embeddings
+        :param archive_path: Parquet tweet archive folder, None to not keep the tweets
+        :param workers: users scraped and embedded concurrently, the encoding itself is serialized
+        :param batch_size: encoding batch size
+        """
+        self.client = client
+        self.twitter_data_prep = twitter_data_prep
+        self.archive_path = os.path.join(os.getcwd(), archive_path) if archive_path else None
+        self.workers = workers
+        self.batch_size = batch_size
+        self.embeddings: dict = {}  # username -> mean embedding of the run
+        data_path = twitter_data_prep.data_path
+        if self.archive_path and data_path and \
+                os.path.abspath(self.archive_path) != os.path.abspath(os.path.join(os.getcwd(), data_path)):
+            # the archive partitions supersede the csv files of the users in the data folder only
+            logging.warning(f"Archive {self.archive_path} outside the data folder {data_path}, load_data embeds "
+                            f"the tweet files of the data folder again over the streamed embeddings")
+
+    def archive_file_path(self, screen_name: str) -> str:
+        return partition_file_path(self.archive_path, screen_name)
+
+    def embed_user(self, screen_name: str) -> tuple:
+        """
+        Scrape, clean and encode the tweets of a user page by page. Only the current page, the cleaned
+        tweets short of a full encoding batch and the running sum are held in memory.
+        :param screen_name:
+        :return: (mean embedding, number of tweets)
+        :raise LookupError: if the user has no tweets
+        """
+        data_prep = self.twitter_data_prep
+        running_mean = RunningMean(data_prep.model.get_sentence_embedding_dimension())
+        pending: list = []
+        archive = None
+        if self.archive_path:
+            # a row group per page, under a temporary name - a partial archive would pass for a complete one
+            os.makedirs(os.path.dirname(self.archive_file_path(screen_name)), exist_ok=True)
+            archive = pq.ParquetWriter(self.archive_file_path(screen_name) + '.tmp', ARCHIVE_SCHEMA,
+                                       compression=ARCHIVE_COMPRESSION)
+        try:
+            for page in self.client.pages(screen_name):
+                df = tweets_frame(page)
+                if archive is not None:
+                    archive.write_table(archive_table(df))
+                # same preprocessing as the csv files, from the utf-8 bytes
+                pending.extend(data_prep.preprocessor.preprocess(df['tweet']))
+                # encode full batches only, the rest waits for the next page
+                full = len(pending) - len(pending) % self.batch_size
+                if full:
+                    running_mean.add(data_prep.model.encode(pending[:full], batch_size=self.batch_size))
+                    del pending[:full]
+            if pending:
+                running_mean.add(data_prep.model.encode(pending, batch_size=self.batch_size))
+        except BaseException:
+            if archive is not None:
+                archive.close()
+                self._discard_archive(screen_name)
+            raise
+        if archive is not None:
+            archive.close()
+            if running_mean.count:
+                os.replace(self.archive_file_path(screen_name) + '.tmp', self.archive_file_path(screen_name))
+            else:
+                self._discard_archive(screen_name)
+        if not running_mean.count:
+            raise LookupError(f"No tweets found for {screen_name}")
+        return running_mean.mean, running_mean.count
+
+    def _discard_archive(self, screen_name: str) -> None:
+        os.remove(self.archive_file_path(screen_name) + '.tmp')
+        if not os.listdir(os.path.dirname(self.archive_file_path(screen_name))):
+            os.rmdir(os.path.dirname(self.archive_file_path(screen_name)))
+
+    def run(self, screen_names: list) -> dict:
+        """
+        Embed the users concurrently, then merge their embeddings into the embedding folder
+        :param screen_names:
+        :return: summary - users, failed users, tweets, requests, rate limited responses, seconds, users per hour
+        """
+        if self.archive_path and not os.path.exists(self.archive_path):
+            os.mkdir(self.archive_path)
+        start = time.perf_counter()
+        failed: list = []
+        tweets = 0
+
+        def embed(screen_name: str) -> Optional[tuple]:
+            try:
+                return self.embed_user(screen_name)
+            except Exception as e:
+                logging.error(f"{screen_name}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pipeline') as executor:
+            for c, (screen_name, result) in enumerate(zip(screen_names, executor.map(embed, screen_names)), 1):
+                if result is None:
+                    failed.append(screen_name)
+                else:
+                    # in the order of the users, whichever finished first
+                    self.embeddings[screen_name], count = result
+                    tweets += count
+                    logging.info(f"#{c} {screen_name} {count} tweets embedded")
+        self.save()
+        seconds = time.perf_counter() - start
+        summary = {'users': len(screen_names) - len(failed), 'failed': failed, 'tweets': tweets,
+                   'requests': self.client.requests, 'rate_limited': self.client.rate_limited,
+                   'seconds': round(seconds, 2),
+                   'users_per_hour': round((len(screen_names) - len(failed)) * 3600 / seconds, 1) if seconds else None}
+        logging.info(f"Streaming done: {summary}")
+        return summary
+
+    def save(self) -> None:
+        """
+        Merge the embeddings of the run into the embedding folder. The other users of the last build are
+        kept if it used the same model and preprocessing. With an archive, the archives are recorded in the
+        manifest, so `load_data` reuses these embeddings until the archives change.
+        :return:
+        """
+        data_prep = self.twitter_data_prep
+        manifest = EmbeddingManifest(model_identity(data_prep.model_name), PREPROCESSING_VERSION)
+        previous = EmbeddingManifest.load(data_prep.embed_file_path('.manifest.json'))
+        usernames: list = []
+        rows: list = []
+        if previous and previous.is_compatible(manifest):
+            previous_usernames, previous_matrix = data_prep.previous_embeddings()
+            for row, username in enumerate(previous_usernames):
+                if username not in self.embeddings:
+                    usernames.append(username)
+                    rows.append(previous_matrix[row])
+                    if username in previous.files:
+                        manifest.files[username] = previous.files[username]
+        else:
+            logging.info("No build with the same model and preprocessing, only the streamed users are saved")
+        for username, embedding in self.embeddings.items():
+            usernames.append(username)
+            rows.append(embedding)
+            if self.archive_path:
+                manifest.fingerprint(username, self.archive_file_path(username))
+        dimension = data_prep.model.get_sentence_embedding_dimension()
+        matrix: npt.NDArray = np.array(rows, dtype=np.float32).reshape(-1, dimension)
+        data_prep.save_embeddings(usernames, matrix, manifest)
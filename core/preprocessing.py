@@ -0,0 +1,186 @@
+"""
+## Twitter Celebrity Matcher
+
+This app is a tool to match celebrities from Twitter with their respective tweets.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import ast
+import codecs
+import re
+import unicodedata
+from typing import Iterable, Mapping, Union
+
+import demoji
+
+# bump when the cleaned text changes, so incremental builds re-embed every user
+PREPROCESSING_VERSION = 1
+
+CLEAN_PATTERN = re.compile(r'|'.join((r'@[^ ]+',  # remove username @
+                                      r'https?://[A-Za-z0-9./]+',  # remove urls
+                                      r'\#\w+',  # remove hashtag
+                                      r'&amp ',  # remove unicode `&`
+                                      r'RT',  # remove RT / retweet
+                                      r'www\S+')))  # remove link www
+WHITESPACE_PATTERN = re.compile(r'\s+')
+SPACES_PATTERN = re.compile(' +')
+# tweets of a batch are joined with a character no emoji contains
+BATCH_SEPARATOR = '\x00'
+
+
+def first_char_class(strings: Iterable[str]) -> str:
+    """
+    Build a regex character class matching the first character of any of the strings.
+    Consecutive code points are merged into ranges, which keeps the class fast to test.
+    :param strings:
+    :return: character class, e.g. `[#*0-9]`
+    """
+    ranges: list = []
+    for code_point in sorted({ord(string[0]) for string in strings}):
+        if ranges and code_point == ranges[-1][1] + 1:
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point])
+    return '[%s]' % ''.join(re.escape(chr(start)) if start == end else
+                            '%s-%s' % (re.escape(chr(start)), re.escape(chr(end))) for start, end in ranges)
+
+
+def compile_alternation(strings: Iterable[str], template: str = r'(?=%s)(?:%s)') -> re.Pattern:
+    """
+    Compile a longest-first alternation of literal strings behind a first character check,
+    so the regex engine skips the positions which can not start any of them.
+    :param strings:
+    :param template: pattern template taking the character class and the alternation
+    :return: compiled pattern
+    """
+    strings = list(strings)
+    alternation = r'|'.join(re.escape(string) for string in sorted(strings, key=len, reverse=True))
+    return re.compile(template % (first_char_class(strings), alternation))
+
+
+def parse_bytes(field: Union[str, ast.AST]) -> Union[str, ast.AST]:
+    """ Convert string represented in Python byte-string literal syntax into a
+    decoded character string. Other field types returned unchanged.
+    :param field: string or bytestring
+    :return: string
+    """
+    result = field
+    try:
+        result = ast.literal_eval(field)
+    finally:
+        return result.decode() if isinstance(result, bytes) else field
+
+
+def decode_bytes_literal(field: Union[str, ast.AST]) -> Union[str, ast.AST]:
+    """
+    Fast path of `parse_bytes` for the `b'...'` reprs written by the scraper, which are
+    decoded with the escape codec instead of parsing them with `ast`. Freshly scraped
+    tweets (bytes, not yet written to a csv file) are decoded directly.
+    :param field: string or bytestring
+    :return: string
+    """
+    if isinstance(field, bytes):
+        return field.decode()
+    if isinstance(field, str) and len(field) >= 3 and field[0] == 'b' and field[1] in '\'"' \
+            and field[-1] == field[1] and field[1] not in field[2:-1]:
+        try:
+            return codecs.escape_decode(field[2:-1].encode('ascii'))[0].decode()
+        except (UnicodeError, ValueError):
+            pass
+    return parse_bytes(field)
+
+
+def clean_text(text: str) -> str:
+    """
+    Clean the tweets in a basic way.
+    :param text:
+    :return: text
+    """
+    text = CLEAN_PATTERN.sub("", text)
+    text = WHITESPACE_PATTERN.sub(' ', text)  # remove extra spaces
+    return text.strip()
+
+
+class EmoticonReplacer:
+    def __init__(self, emoticons_dict: Mapping[str, str]) -> None:
+        """
+        Compile the emoticon dictionary into a single matcher.
+        :param emoticons_dict: emoticon -> word mapping, earlier entries take priority
+        """
+        self.emoticons_dict = dict(emoticons_dict)
+        self._priority = {emoticon: i for i, emoticon in enumerate(self.emoticons_dict)}
+        # the zero-width lookahead reports the longest emoticon starting at every position (overlaps included)
+        self._pattern = compile_alternation(self.emoticons_dict, template=r'(?=%s)(?=(%s))')
+        # every emoticon which is a prefix of a longer one, e.g. `:-)` of `:-))`
+        self._prefixes = {emoticon: [prefix for prefix in self.emoticons_dict if emoticon.startswith(prefix)]
+                          for emoticon in self.emoticons_dict}
+
+    def find(self, text: str) -> list:
+        """
+        Find the emoticons present in the text in a single scan.
+        :param text:
+        :return: emoticons ordered by their dictionary priority
+        """
+        found = set()
+        for longest in self._pattern.findall(text):
+            found.update(self._prefixes[longest])
+        return sorted(found, key=self._priority.__getitem__)
+
+    def replace(self, text: str) -> str:
+        """
+        Replace emoticons in the text with their corresponding word.
+        Only the emoticons found by the scan are replaced, in dictionary order, so overlapping
+        emoticons (`:-))` is read as `:-)` + `)`) resolve exactly like the sequential replacement.
+        :param text:
+        :return: text
+        """
+        for emoticon in self.find(text):
+            text = text.replace(emoticon, ' ' + self.emoticons_dict[emoticon] + ' ')
+        return SPACES_PATTERN.sub(' ', text)
+
+
+class TweetPreprocessor:
+    def __init__(self, emoticons_dict: Mapping[str, str]) -> None:
+        """
+        Fused preprocessing stage for a batch of tweets.
+        :param emoticons_dict: emoticon -> word mapping
+        """
+        self.emoticon_replacer = EmoticonReplacer(emoticons_dict)
+        # same longest-first alternation as demoji, behind a first character check. The emoji table is
+        # private to demoji, which is pinned to an exact version - tests/test_preprocessing.py checks the
+        # descriptions against `demoji.findall` on an upgrade
+        demoji.set_emoji_pattern()
+        self._emoji_desc = demoji._CODE_TO_DESC
+        self._emoji_pattern = compile_alternation(self._emoji_desc)
+
+    def _describe_emoji(self, match: re.Match) -> str:
+        return ' ' + self._emoji_desc[match.group()] + ' '
+
+    def replace_emojis(self, text: str) -> str:
+        """
+        Replace emojis in the text with their corresponding word in a single scan.
+        :param text:
+        :return: text
+        """
+        text, count = self._emoji_pattern.subn(self._describe_emoji, text)
+        return SPACES_PATTERN.sub(' ', text) if count else text
+
+    def preprocess(self, tweets: Iterable, decoded: bool = False) -> list:
+        """
+        Decode, normalize, clean and replace the emoticons of a user's tweets in one pass,
+        then replace the emojis of the whole batch in a single scan.
+        :param tweets: tweets as `b'...'` literals or bytes
+        :param decoded: the tweets are text already (e.g. read from the Parquet archive)
+        :return: cleaned tweets
+        """
+        replace_emoticons = self.emoticon_replacer.replace
+        decode = str if decoded else decode_bytes_literal
+        texts = [replace_emoticons(clean_text(unicodedata.normalize('NFKD', decode(tweet)))) for tweet in tweets]
+        batch = BATCH_SEPARATOR.join(texts)
+        if len(texts) < 2 or batch.count(BATCH_SEPARATOR) != len(texts) - 1:
+            return [self.replace_emojis(text) for text in texts]
+        # the emoticon pass collapses the spaces, so the emoji pass can always collapse them too
+        batch = SPACES_PATTERN.sub(' ', self._emoji_pattern.sub(self._describe_emoji, batch))
+        return batch.split(BATCH_SEPARATOR)
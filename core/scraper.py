@@ -14,6 +14,8 @@ from typing import Optional, Union
 import pandas as pd
 import tweepy
 
+from core.metrics import traced
+
 
 class TwitterScraper:
     def __init__(self, consumer_key: Optional[str],
@@ -89,6 +91,7 @@ class TwitterScraper:
             logging.error(e, exc_info=True)
             return False
 
+    @traced('scrape')
     def scrape_tweets(self, screen_name: str) -> Optional[pd.DataFrame]:
         """
         Scrape the tweets of a Twitter user
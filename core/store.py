@@ -0,0 +1,235 @@
+"""
+## Twitter Celebrity Matcher
+
+This app is a tool to match celebrities from Twitter with their respective tweets.
+
+Binary embedding store - a float32 `.npy` matrix, memory-mapped on load, next to a json index
+holding the usernames (one per matrix row), the format version, the model name and the fingerprint of
+the matrix. The matrix file is named after its fingerprint and never rewritten, the index points to it:
+replacing the index switches to a new matrix in one step.
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Optional, Union
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+STORE_FORMAT_VERSION = 2
+# `<embed_data_path>.npy` next to the index, without a fingerprint
+LEGACY_FORMAT_VERSION = 1
+
+
+def matrix_fingerprint(embeddings: npt.NDArray, chunk_size: int = 65536) -> str:
+    """
+    Fingerprint of an embedding matrix - its shape and every row - to tell if a file derived from it
+    (a saved index, the shared normalized matrix) was built from the current embeddings. The incremental
+    builds rewrite single rows, a sample of rows would miss them.
+    :param embeddings:
+    :param chunk_size: rows hashed at a time
+    :return: hex digest
+    """
+    digest = hashlib.sha256(str(embeddings.shape).encode())
+    for start in range(0, len(embeddings), chunk_size):
+        digest.update(np.ascontiguousarray(embeddings[start:start + chunk_size], dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def embeddings_frame(usernames: list, matrix: npt.NDArray) -> pd.DataFrame:
+    """
+    Build the embedding dataframe (username, v1..vN) from a matrix with one row per user
+    :param usernames:
+    :param matrix: float32 matrix
+    :return: dataframe
+    """
+    df = pd.DataFrame(matrix, columns=[f'v{i + 1}' for i in range(matrix.shape[1])])
+    # insert username at the first column
+    df.insert(0, 'username', usernames)
+    return df
+
+
+def read_embeddings_csv(file_path: Union[str, os.PathLike[str]]) -> tuple:
+    """
+    Read an embedding csv file
+    :param file_path:
+    :return: (usernames, float32 matrix)
+    """
+    df = pd.read_csv(file_path)
+    return df.username.tolist(), df.iloc[:, 1:].to_numpy(dtype=np.float32)
+
+
+class EmbeddingStore:
+    def __init__(self, usernames: list, matrix: npt.NDArray, model: Optional[str] = None,
+                 fingerprint: Optional[str] = None) -> None:
+        """
+        Embeddings of the celebrity users
+        :param usernames: username of each matrix row
+        :param matrix: float32 matrix, (users x dimension)
+        :param model: model identity the embeddings were generated with
+        :param fingerprint: `matrix_fingerprint` of the matrix, set by `save` and `load`
+        """
+        if len(usernames) != matrix.shape[0]:
+            raise ValueError(f"{len(usernames)} usernames for {matrix.shape[0]} embeddings")
+        self.usernames = list(usernames)
+        self.matrix = matrix
+        self.model = model
+        self.fingerprint = fingerprint
+
+    @staticmethod
+    def file_path(embed_data_path: str, suffix: str) -> str:
+        """
+        Path of a store file in the embedding folder
+        :param embed_data_path: embedding folder, also the file name prefix
+        :param suffix: `.<fingerprint>.npy` for the matrix, `.index.json` for the usernames
+        :return: file path
+        """
+        return os.path.join(os.getcwd(), embed_data_path, f"{embed_data_path}{suffix}")
+
+    @staticmethod
+    def matrix_suffix(fingerprint: Optional[str]) -> str:
+        """
+        Suffix of the matrix file of a fingerprint
+        :param fingerprint: None for a legacy store
+        :return: file suffix
+        """
+        return f".{fingerprint[:16]}.npy" if fingerprint else '.npy'
+
+    @classmethod
+    def exists(cls, embed_data_path: str) -> bool:
+        """
+        Check if the binary store was generated - its index is written last
+        :param embed_data_path:
+        :return: True if the index exists
+        """
+        return os.path.exists(cls.file_path(embed_data_path, '.index.json'))
+
+    @classmethod
+    def version(cls, embed_data_path: str) -> tuple:
+        """
+        Modification time and size of the file a matcher loads first - the index of the store, or the csv file
+        without it. Changes whenever the embeddings are rebuilt or converted.
+        :param embed_data_path:
+        :return: tuple of (suffix, mtime_ns, size), None for missing files
+        """
+        stats = []
+        for suffix in ('.index.json',) if cls.exists(embed_data_path) else ('.csv',):
+            try:
+                stat = os.stat(cls.file_path(embed_data_path, suffix))
+                stats.append((suffix, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stats.append((suffix, None, None))
+        return tuple(stats)
+
+    @classmethod
+    def load(cls, embed_data_path: str, mmap: bool = True) -> 'EmbeddingStore':
+        """
+        Load the store, the matrix is memory-mapped read-only (zero-copy) by default
+        :param embed_data_path:
+        :param mmap: memory-map the matrix instead of reading it
+        :return: embedding store
+        """
+        with open(cls.file_path(embed_data_path, '.index.json')) as f:
+            index = json.load(f)
+        if index['format_version'] not in (LEGACY_FORMAT_VERSION, STORE_FORMAT_VERSION):
+            raise ValueError(f"Unsupported embedding store version {index['format_version']}")
+        fingerprint = index.get('fingerprint')
+        matrix = np.load(cls.file_path(embed_data_path, cls.matrix_suffix(fingerprint)),
+                         mmap_mode='r' if mmap else None)
+        rows = index.get('rows', len(index['usernames']))
+        if matrix.dtype != np.float32 or matrix.shape != (rows, index['dimension']) or \
+                rows != len(index['usernames']):
+            raise ValueError(f"Embedding matrix {matrix.dtype}{matrix.shape} does not match its index")
+        return cls(index['usernames'], matrix, index['model'], fingerprint)
+
+    @classmethod
+    def from_csv(cls, embed_data_path: str, model: Optional[str] = None) -> 'EmbeddingStore':
+        """
+        Read the (username, v1..vN) embedding csv file
+        :param embed_data_path:
+        :param model: model identity
+        :return: embedding store
+        """
+        usernames, matrix = read_embeddings_csv(cls.file_path(embed_data_path, '.csv'))
+        return cls(usernames, matrix, model)
+
+    def save(self, embed_data_path: str) -> None:
+        """
+        Save the matrix to a new file named after its fingerprint, then the index pointing to it. Both are
+        written aside and renamed into place: readers load the previous matrix and index, or the new ones,
+        never a mix of both. The matrix before the previous one is removed.
+        :param embed_data_path:
+        :return:
+        """
+        matrix = np.ascontiguousarray(self.matrix, dtype=np.float32)
+        self.fingerprint = matrix_fingerprint(matrix)
+        matrix_path = self.file_path(embed_data_path, self.matrix_suffix(self.fingerprint))
+        index_path = self.file_path(embed_data_path, '.index.json')
+        previous_path = None
+        try:
+            with open(index_path) as f:
+                previous_path = self.file_path(embed_data_path, self.matrix_suffix(json.load(f).get('fingerprint')))
+        except (OSError, ValueError):
+            pass
+        with open(matrix_path + '.tmp', 'wb') as f:
+            np.save(f, matrix)
+        os.replace(matrix_path + '.tmp', matrix_path)
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump({'format_version': STORE_FORMAT_VERSION,
+                       'model': self.model,
+                       'dimension': int(matrix.shape[1]),
+                       'rows': int(matrix.shape[0]),
+                       'fingerprint': self.fingerprint,
+                       'usernames': self.usernames}, f)
+        os.replace(index_path + '.tmp', index_path)
+        # a reader which just read the previous index may still open the previous matrix
+        pattern = re.compile(rf"{re.escape(os.path.basename(embed_data_path))}(\.[0-9a-f]{{16}})?\.npy")
+        for path in glob.glob(self.file_path(embed_data_path, '*.npy')):
+            if pattern.fullmatch(os.path.basename(path)) and path not in (matrix_path, previous_path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logging.error(e)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Convert the store to the (username, v1..vN) embedding dataframe
+        :return: dataframe
+        """
+        return embeddings_frame(self.usernames, np.asarray(self.matrix))
+
+
+def main() -> None:
+    """
+    Convert the embedding csv file of `EMBED_DATA_PATH` into the binary store
+    """
+    from config import EMBED_DATA_PATH
+    from core.manifest import EmbeddingManifest, model_identity
+
+    parser = argparse.ArgumentParser(description="Convert the embedding csv file into the binary embedding store")
+    parser.add_argument('--embed-data-path', default=EMBED_DATA_PATH)
+    parser.add_argument('--model', default=None, help="model name, defaults to the one of the build manifest")
+    args = parser.parse_args()
+
+    model = model_identity(args.model) if args.model else None
+    if model is None and (manifest := EmbeddingManifest.load(
+            EmbeddingStore.file_path(args.embed_data_path, '.manifest.json'))):
+        model = manifest.model
+    store = EmbeddingStore.from_csv(args.embed_data_path, model=model)
+    store.save(args.embed_data_path)
+    logging.info(f"{len(store.usernames)} embeddings saved to "
+                 f"{EmbeddingStore.file_path(args.embed_data_path, store.matrix_suffix(store.fingerprint))}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    main()
@@ -13,26 +13,36 @@ from typing import Mapping, Optional
 
 import pandas as pd
 
+from core.cache import EmbeddingCache
 from core.dataprep import TwitterDataPrep
+from core.encoder_service import encoder_client
+from core.manifest import model_identity
+from core.models import resolve_model_name
+from core.preprocessing import PREPROCESSING_VERSION
 from core.scraper import TwitterScraper
 
 from config import CONSUMER_KEY, ACCESS_SECRET, CONSUMER_SECRET, ACCESS_KEY, MODEL_PATH, TWITTER_USER_LIST_FILE, \
-    TWITTER_USER_LIST_PATH
+    TWITTER_USER_LIST_PATH, EMBED_CACHE_PATH, EMBED_CACHE_TTL, EMBED_CACHE_MAX_ENTRIES, ENCODER_SOCKET
 
 
-def scrape_embed_tweets(username: str) -> Optional[pd.DataFrame]:
+def scrape_embed_tweets(username: str, twitter_scraper: Optional[TwitterScraper] = None,
+                        twitter_data_prep: Optional[TwitterDataPrep] = None) -> Optional[pd.DataFrame]:
     """
     Scrape tweets and generate embedding dataframe
     :param username: Twitter username
+    :param twitter_scraper: shared scraper, a new one is created if not given
+    :param twitter_data_prep: shared data preparation object (and model), a new one is loaded if not given
     :return: embedding dataframe
     """
     df_embeddings = pd.DataFrame()
     # Create a TwitterScraper object for tweepy
-    twitter_scraper = TwitterScraper(consumer_key=CONSUMER_KEY, consumer_secret=CONSUMER_SECRET,
-                                     access_key=ACCESS_KEY,
-                                     access_secret=ACCESS_SECRET)
+    if twitter_scraper is None:
+        twitter_scraper = TwitterScraper(consumer_key=CONSUMER_KEY, consumer_secret=CONSUMER_SECRET,
+                                         access_key=ACCESS_KEY,
+                                         access_secret=ACCESS_SECRET)
     logging.info("Scraping initiated  for {}".format(username))
-    twitter_data_prep = TwitterDataPrep(model_path=MODEL_PATH)
+    if twitter_data_prep is None:
+        twitter_data_prep = TwitterDataPrep(model_path=MODEL_PATH, encoder=encoder_client(ENCODER_SOCKET))
     try:
         # Get the tweets of the user
         df = twitter_scraper.scrape_tweets(username)
@@ -49,6 +59,18 @@ def scrape_embed_tweets(username: str) -> Optional[pd.DataFrame]:
     return df_embeddings
 
 
+def open_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Open the embedding cache of scraped users, for the configured model and the current preprocessing
+    :return: embedding cache, None if `EMBED_CACHE_PATH` is empty
+    """
+    if not EMBED_CACHE_PATH:
+        return None
+    return EmbeddingCache(EMBED_CACHE_PATH, model=model_identity(resolve_model_name(MODEL_PATH)),
+                          preprocessing_version=PREPROCESSING_VERSION, ttl=EMBED_CACHE_TTL,
+                          max_entries=EMBED_CACHE_MAX_ENTRIES)
+
+
 def username_dict() -> Mapping:
     """
     Generate a dictionary of usernames
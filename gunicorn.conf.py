@@ -0,0 +1,73 @@
+"""
+## Twitter Celebrity Matcher - API
+
+Gunicorn configuration of the multi-worker API: `gunicorn -c gunicorn.conf.py api.api:app`
+- the normalized celebrity embeddings are memory-mapped read-only from one file, the workers share its pages
+- one encoder server, started before the workers, encodes the live users of all the workers, so the
+  model is loaded once instead of once per worker
+- the workers write their Prometheus metrics to `PROMETHEUS_MULTIPROC_DIR`, `/metrics` merges those of all
+  the workers
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+from multiprocessing.connection import Client
+
+bind = os.environ.get("API_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("API_WORKERS", 4))
+worker_class = "uvicorn.workers.UvicornWorker"
+# loading the matcher takes longer than the default 30s on large stores
+timeout = int(os.environ.get("API_WORKER_TIMEOUT", 120))
+
+# read by `config` in the workers, which import the app after this file
+os.environ.setdefault("MATCHER_SHARED_MATRIX", "1")
+os.environ.setdefault("ENCODER_SOCKET", "/tmp/twitter-celebrity-encoder.sock")
+# read by `prometheus_client` when the workers import it
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/twitter-celebrity-metrics")
+# seconds to wait for the encoder server to load the model
+ENCODER_START_TIMEOUT = 600
+
+
+def on_starting(server):
+    """Clear the metrics of a previous run and start the encoder server, the workers start once it listens"""
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+    socket_path = os.environ["ENCODER_SOCKET"]
+    server.encoder_process = subprocess.Popen([sys.executable, "-m", "core.encoder_service", "--socket", socket_path])
+    deadline = time.monotonic() + ENCODER_START_TIMEOUT
+    while True:
+        try:
+            # a socket file left by a previous run refuses connections until the new server replaces it
+            Client(socket_path, family="AF_UNIX").close()
+            break
+        except (ConnectionRefusedError, FileNotFoundError):
+            pass
+        if server.encoder_process.poll() is not None:
+            raise RuntimeError(f"Encoder server exited with code {server.encoder_process.returncode}")
+        if time.monotonic() > deadline:
+            server.encoder_process.terminate()
+            raise RuntimeError(f"Encoder server not listening on {socket_path} after {ENCODER_START_TIMEOUT}s")
+        time.sleep(0.5)
+    server.log.info(f"Encoder server listening on {socket_path}, pid {server.encoder_process.pid}")
+
+
+def child_exit(server, worker):
+    """Drop the live gauges of a dead worker, its counters and histograms stay in the totals"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    """Stop the encoder server"""
+    encoder_process = getattr(server, "encoder_process", None)
+    if encoder_process is not None and encoder_process.poll() is None:
+        encoder_process.terminate()
+        encoder_process.wait(timeout=30)
@@ -1,6 +1,5 @@
 import logging
 import os
-import time
 
 import pandas as pd
 import uvicorn
@@ -8,11 +7,17 @@ import uvicorn
 from api.api import app  # import fastAPI app
 from app.app import App
 from config import (DATA_PATH, CONSUMER_KEY, ACCESS_SECRET, CONSUMER_SECRET, ACCESS_KEY,
-                    EMBED_DATA_PATH, MODEL_PATH, TWITTER_USER_LIST_PATH, TWITTER_USER_LIST_FILE)
+                    EMBED_DATA_PATH, MODEL_PATH, TWITTER_USER_LIST_PATH, TWITTER_USER_LIST_FILE,
+                    PREP_WORKERS, ENCODE_BATCH_SIZE, ENCODE_CHUNK_SIZE, INDEX_BACKEND, IVF_NLIST, IVF_NPROBE,
+                    MATCHER_QUANTIZATION, MATCHER_RESCORE, TWITTER_API_BASE_URL, SCRAPE_WORKERS, SCRAPE_MAX_RETRIES,
+                    TWEET_FORMAT, STREAM_ARCHIVE_PATH, ENCODER_SOCKET)
+from core.bulk_scraper import BulkScraper, TimelineClient
 from core.dataprep import TwitterDataPrep
+from core.encoder_service import encoder_client
 from core.matcher import TwitterUserMatcher
+from core.pipeline import StreamingPipeline
 from core.scraper import TwitterScraper
-from core.utils import username_dict
+from core.utils import open_embedding_cache, username_dict
 
 
 def set_config() -> None:
@@ -38,11 +43,14 @@ def twitter_scraper_users(twitter_scraper: TwitterScraper, screen_names: list) -
     if not os.path.exists(os.path.join(os.getcwd(), DATA_PATH)):
         os.mkdir(os.path.join(os.getcwd(), DATA_PATH))
 
-    # scrape the data from the Twitter username list
-    for c, screen_name in enumerate(screen_names, 1):
-        twitter_scraper.save_tweets(screen_name)
-        logging.info(f"#{c} {screen_name} tweets scraped")
-        time.sleep(3)
+    # scrape the data from the Twitter username list, `SCRAPE_WORKERS` users at a time
+    # the requests are paced by the API's rate limit headers
+    # users scraped before resume from their checkpoint, or only fetch their new tweets
+    client = TimelineClient(auth=twitter_scraper.api.auth.apply_auth(), base_url=TWITTER_API_BASE_URL,
+                            max_retries=SCRAPE_MAX_RETRIES)
+    # saved to the Parquet archive partitioned by user (or csv files), see `TWEET_FORMAT`
+    BulkScraper(client, file_path=DATA_PATH, workers=SCRAPE_WORKERS,
+                file_format=TWEET_FORMAT).scrape_users(screen_names)
 
 
 def scrape_celebrity_tweets(twitter_scraper: TwitterScraper) -> None:
@@ -73,7 +81,19 @@ def scraper_in_action(twitter_scraper: TwitterScraper) -> None:
 # data preparation
 def data_preparation(twitter_data_prep: TwitterDataPrep) -> None:
     # preprocess the tweets, generate embeddings and save them in a single CSV file
-    twitter_data_prep.load_data()
+    # preprocessing runs in `PREP_WORKERS` processes while the main process encodes
+    # a user's tweets are encoded `ENCODE_CHUNK_SIZE` at a time into a running mean
+    twitter_data_prep.load_data(workers=PREP_WORKERS, batch_size=ENCODE_BATCH_SIZE, chunk_size=ENCODE_CHUNK_SIZE)
+
+
+# streaming scrape-to-embed, instead of scraping to csv files and `data_preparation`
+def stream_celebrity_embeddings(twitter_scraper: TwitterScraper, twitter_data_prep: TwitterDataPrep) -> None:
+    # pages of tweets are cleaned and encoded as they arrive, into a running mean embedding per user
+    # the raw tweets are archived in the Parquet archive `STREAM_ARCHIVE_PATH`, if set
+    client = TimelineClient(auth=twitter_scraper.api.auth.apply_auth(), base_url=TWITTER_API_BASE_URL,
+                            max_retries=SCRAPE_MAX_RETRIES)
+    StreamingPipeline(client, twitter_data_prep, archive_path=STREAM_ARCHIVE_PATH or None, workers=SCRAPE_WORKERS,
+                      batch_size=ENCODE_BATCH_SIZE).run(fetch_users())
 
 
 # twitter_user_matcher
@@ -110,9 +130,9 @@ def matcher_in_action(twitter_user_matcher: TwitterUserMatcher, usernames_dict)
     username = 'ahmed__shahriar'
 
     top_n = 10
-    top_results = twitter_user_matcher.match_top_celeb_users(username)  # returns a zip object
+    top_usernames, top_scores = twitter_user_matcher.top_k(username, top_n)  # sorted arrays, excluding the user
 
-    for k, v in sorted(top_results, key=lambda item: item[1], reverse=True)[1:top_n + 1]:
+    for k, v in zip(top_usernames, top_scores):
         print(f"Twitter username: {k} ({usernames_dict.get(k)}): {v}")
 
 
@@ -132,15 +152,21 @@ def main() -> None:
     scraper_in_action(twitter_scraper)
 
     """data preparation"""
-    # create a data preparation object
-    twitter_data_prep = TwitterDataPrep(model_path=MODEL_PATH, data_path=DATA_PATH, embed_data_path=EMBED_DATA_PATH)
+    # create a data preparation object, encoding through the encoder server if one is configured
+    twitter_data_prep = TwitterDataPrep(model_path=MODEL_PATH, data_path=DATA_PATH, embed_data_path=EMBED_DATA_PATH,
+                                        encoder=encoder_client(ENCODER_SOCKET))
 
     # save a single file containing all the generated vector embeddings per user
     data_preparation(twitter_data_prep=twitter_data_prep)
 
+    # or scrape and embed the users in one streaming pass
+    # stream_celebrity_embeddings(twitter_scraper, twitter_data_prep)
+
     """twitter user matcher"""
     # create Twitter profile matcher object
-    matcher = TwitterUserMatcher(EMBED_DATA_PATH)
+    matcher = TwitterUserMatcher(EMBED_DATA_PATH, index_backend=INDEX_BACKEND, nlist=IVF_NLIST, nprobe=IVF_NPROBE,
+                                 embedding_cache=open_embedding_cache(), quantization=MATCHER_QUANTIZATION,
+                                 rescore=MATCHER_RESCORE)
 
     # get the Twitter account names dictionary
     usernames_dict = username_dict()
@@ -0,0 +1,153 @@
+"""
+## Twitter Celebrity Matcher - Tests
+
+Parity of the compiled preprocessing with the original per-entry replacement loops of
+`benchmarks.reference`.
+
+Run from the project root: `python -m pytest tests`
+
+Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
+Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
+"""
+
+import json
+import unicodedata
+from pathlib import Path
+
+import pytest
+
+from benchmarks.reference import clean_text, replace_emojis, replace_emoticons
+from core.preprocessing import EmoticonReplacer, TweetPreprocessor, parse_bytes
+
+EMOTICON_DICT_PATH = Path(__file__).resolve().parent.parent / "utilities" / "emoticon_dict.json"
+
+
+@pytest.fixture(scope='module')
+def emoticons_dict() -> dict:
+    with open(EMOTICON_DICT_PATH) as f:
+        return json.load(f)
+
+
+def reference_preprocess(tweet, emoticons_dict: dict) -> str:
+    """
+    The original `preprocess_data` passes, on one tweet
+    :param tweet: tweet as a `b'...'` literal, bytes or text
+    :param emoticons_dict:
+    :return: cleaned tweet
+    """
+    text = tweet.decode() if isinstance(tweet, bytes) else parse_bytes(tweet)
+    text = clean_text(unicodedata.normalize('NFKD', text))
+    return replace_emojis(replace_emoticons(text, emoticons_dict))
+
+
+def bytes_literal(text: str) -> str:
+    """
+    A tweet as written to the csv files by the scraper
+    :param text:
+    :return: `b'...'` literal
+    """
+    return str(text.encode('utf-8'))
+
+
+@pytest.fixture(scope='module')
+def emoticon_replacer(emoticons_dict: dict) -> EmoticonReplacer:
+    return EmoticonReplacer(emoticons_dict)
+
+
+def test_emoticon_dictionary(emoticons_dict: dict, emoticon_replacer: EmoticonReplacer) -> None:
+    # every emoticon alone, inside words and next to all the others
+    texts = [emoticon for emoticon in emoticons_dict]
+    texts += [f"so{emoticon}good" for emoticon in emoticons_dict]
+    texts.append(' '.join(emoticons_dict))
+    texts.append(''.join(emoticons_dict))
+    for text in texts:
+        assert emoticon_replacer.replace(text) == replace_emoticons(text, emoticons_dict), text
+
+
+@pytest.mark.parametrize('text', [
+    "great :-)",
+    "great :-))",
+    "great :-)))))))",
+    ":-)):-) :-)))",
+    "smile:-))and:-)",
+    ":-) :-)) :-))) :-)))) :-))))) :-))))))",
+])
+def test_overlapping_emoticons(text: str, emoticons_dict: dict, emoticon_replacer: EmoticonReplacer) -> None:
+    assert emoticon_replacer.replace(text) == replace_emoticons(text, emoticons_dict)
+
+
+@pytest.mark.parametrize('text', [
+    "",
+    "no emoticons here",
+    "  extra   spaces  ",
+    "tweet number 42 - nothing else",
+    "nothing to see: ) ( -",
+])
+def test_no_emoticons(text: str, emoticons_dict: dict, emoticon_replacer: EmoticonReplacer) -> None:
+    assert emoticon_replacer.find(text) == []
+    assert emoticon_replacer.replace(text) == replace_emoticons(text, emoticons_dict)
+
+
+@pytest.fixture(scope='module')
+def tweet_preprocessor(emoticons_dict: dict) -> TweetPreprocessor:
+    return TweetPreprocessor(emoticons_dict)
+
+
+TWEETS = [
+    "RT @user: Great game tonight :-) #win https://t.co/abc123",
+    "It's \"quoted\" and it's 'single' too \U0001F600",
+    "back\\slash and a tab\tand a newline\nhere",
+    "www.example.com &amp friends :-)) \U0001F44D\U0001F3FD",
+    "Caf\u00e9 na\u00efve \uff21\uff22\uff23 \u2460",
+    "",
+]
+
+EMOJI_ONLY = [
+    "\U0001F600",
+    "\U0001F600\U0001F600\U0001F602",
+    "\u2764\ufe0f \U0001F525",
+    "\U0001F1FA\U0001F1F8",
+]
+
+# the longest emoji wins over the emojis it starts with
+OVERLAPPING_EMOJI = [
+    "\U0001F44D\U0001F3FD",  # thumbs up: medium skin tone, not thumbs up
+    "\U0001F468\u200d\U0001F469\u200d\U0001F467\u200d\U0001F466",  # family, not man + woman + ...
+    "\U0001F1FA\U0001F1F8\U0001F1EC\U0001F1E7",  # two flags, not four regional indicators
+]
+
+
+@pytest.mark.parametrize('texts', [TWEETS, EMOJI_ONLY, OVERLAPPING_EMOJI], ids=['tweets', 'emoji-only', 'overlapping'])
+def test_bytes_literals(texts: list, emoticons_dict: dict, tweet_preprocessor: TweetPreprocessor) -> None:
+    tweets = [bytes_literal(text) for text in texts]
+    expected = [reference_preprocess(tweet, emoticons_dict) for tweet in tweets]
+    # the whole batch in one emoji scan, and each tweet alone
+    assert tweet_preprocessor.preprocess(tweets) == expected
+    assert [tweet_preprocessor.preprocess([tweet])[0] for tweet in tweets] == expected
+
+
+@pytest.mark.parametrize('texts', [TWEETS, EMOJI_ONLY, OVERLAPPING_EMOJI], ids=['tweets', 'emoji-only', 'overlapping'])
+def test_non_bytes_input(texts: list, emoticons_dict: dict, tweet_preprocessor: TweetPreprocessor) -> None:
+    # freshly scraped bytes, and text read back from the Parquet archive
+    tweets = [text.encode('utf-8') for text in texts]
+    expected = [reference_preprocess(tweet, emoticons_dict) for tweet in tweets]
+    assert tweet_preprocessor.preprocess(tweets) == expected
+    assert tweet_preprocessor.preprocess(texts, decoded=True) == expected
+
+
+def test_emoji_only(tweet_preprocessor: TweetPreprocessor) -> None:
+    assert tweet_preprocessor.preprocess([bytes_literal("\U0001F600\U0001F602")]) == \
+        [" grinning face face with tears of joy "]
+
+
+def test_overlapping_emoji(tweet_preprocessor: TweetPreprocessor) -> None:
+    assert tweet_preprocessor.replace_emojis("\U0001F44D\U0001F3FD") == " thumbs up: medium skin tone "
+    assert tweet_preprocessor.replace_emojis("\U0001F1FA\U0001F1F8") == " flag: United States "
+    # with an emoji next to a longer one it starts, the original loop replaced them in the order of
+    # `demoji.findall` (which varies with the hash seed) and could split the longer one - the single scan
+    # always matches the longest
+    family = "\U0001F468\u200d\U0001F469\u200d\U0001F467\u200d\U0001F466"
+    assert tweet_preprocessor.preprocess([bytes_literal(f"\U0001F468 {family}"), bytes_literal(family)]) == \
+        [" man family: man, woman, girl, boy ", " family: man, woman, girl, boy "]
+    assert tweet_preprocessor.preprocess([bytes_literal("\U0001F44D\U0001F3FD\U0001F44D")]) == \
+        [" thumbs up: medium skin tone thumbs up "]
@@ -6,21 +6,28 @@ This is a standalone script that scrapes tweets based on a given Twitter handle
 Author: [Ahmed Shahriar Sakib](https://www.linkedin.com/in/ahmedshahriar)
 Source: [Github](https://github.com/ahmedshahriar/TwitterCelebrityMatcher)
 """
-import tweepy
-import pandas as pd
-import schedule
-import time
+import logging
 import os
-import glob
+import sys
 
+import pandas as pd
+import tweepy
 from dotenv import load_dotenv
 
+# run from the utilities folder, the scraper lives in the project's `core` package
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from core.bulk_scraper import BulkScraper, TimelineClient  # noqa: E402
+
 load_dotenv()
 
 access_key = os.environ.get("ACCESS_KEY")
 access_secret = os.environ.get("ACCESS_SECRET")
 consumer_key = os.environ.get("CONSUMER_KEY")
 consumer_secret = os.environ.get("CONSUMER_SECRET")
+base_url = os.environ.get("TWITTER_API_BASE_URL", "https://api.twitter.com/1.1")
+workers = int(os.environ.get("SCRAPE_WORKERS", 4))
+file_format = os.environ.get("TWEET_FORMAT", "parquet")
 
 # screen_name="apotofvestiges"
 
@@ -32,65 +39,16 @@ handler_df = pd.read_csv("../celebrity-listing/Top-1000-Celebrity-Twitter-Accoun
 # screen_names = handler_df.twitter.unique().tolist()
 
 screen_names_all = handler_df.twitter.unique().tolist()
-screen_names_parsed = [x.split('\\')[1].replace('.csv', '').strip() for x in glob.glob(
-    "../twitter-celebrity-tweets-data/*.csv")]
-# missing Twitter accounts to be parsed
-screen_names = list(set(screen_names_all) - set(screen_names_parsed))
-i = 0
-
-
-def parser():
-    try:
-        print("\n\nstarting...")
-        global screen_names
-        global i
-        print(i)
-        name = screen_names[i]
-        print(name)
-
-        auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
-        auth.set_access_token(access_key, access_secret)
-        api = tweepy.API(auth)
-        alltweets = []
-        new_tweets = api.user_timeline(screen_name=name, count=200, tweet_mode="extended")
-        alltweets.extend(new_tweets)
-        oldest = alltweets[-1].id - 1
-        while len(new_tweets) > 0:
-            print("getting tweets before %s" % (oldest))
-            new_tweets = api.user_timeline(screen_name=name, count=200, max_id=oldest, tweet_mode="extended")
-            alltweets.extend(new_tweets)
-            oldest = alltweets[-1].id - 1
-            print("...%s tweets downloaded so far" % (len(alltweets)))
-
-        out_tweets = [[tweet.id_str, tweet.created_at, tweet.full_text.encode("utf-8")] for tweet in alltweets]
-        df = pd.DataFrame(out_tweets, columns=['twitter_id', 'date', 'tweet'])
-        # export tweets to CSV under dataset directory
-        df.to_csv("../twitter-celebrity-tweets-data/%s.csv" % name, index=False)
-        i = i + 1
-        print(i)
-    except Exception as e:
-        print(e)
-        i = i + 1
-        pass
-
-
-# Cron Job
-
-parser()
-# configure schedule job
-schedule.every(5).seconds.do(parser)
-# schedule.every(1).minutes.do(parser)
-# schedule.every().hour.do(parser)
-# schedule.every().day.at("23:19").do(parser)
-# schedule.every().day.at("23:24").do(parser)
-# schedule.every().day.at("23:30").do(parser)
-# schedule.every().day.at("23:40").do(parser)
-# schedule.every(5).to(10).minutes.do(parser)
-# schedule.every().monday.do(parser)
-# schedule.every().wednesday.at("13:15").do(parser)
-# schedule.every().minute.at(":17").do(parser)
-
 
-while len(screen_names) > i:
-    schedule.run_pending()
-    time.sleep(1)
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    # concurrent users, paced by the API's rate limit headers instead of a fixed schedule
+    client = TimelineClient(auth=tweepy.OAuth1UserHandler(consumer_key, consumer_secret,
+                                                          access_key, access_secret).apply_auth(),
+                            base_url=base_url)
+    scraper = BulkScraper(client, file_path="../twitter-celebrity-tweets-data", workers=workers,
+                          file_format=file_format)
+    # missing Twitter accounts to be parsed, and the ones an interrupted run did not finish
+    screen_names = scraper.pending(screen_names_all)
+    # export tweets to the Parquet archive (or CSV) under dataset directory
+    scraper.scrape_users(screen_names)